@@ -0,0 +1,299 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Benchmarks
+# Runs the relaxation and analytical series scripts with fixed parameters over a
+# range of step sizes and records the wall time, peak memory, iterations and
+# (where there is an analytic solution) the error of every run. The results are
+# saved as JSON and compared against the results of an earlier run, so that the
+# effect of a change to the solvers is measured rather than guessed.
+# Each run is done in its own process (with the `Agg` backend, so the plots do
+# not block) inside of a temporary folder, the scripts themselves are not
+# changed. The constants of a script are replaced before it is run, so any
+# constant of a script can be fixed for a run.
+# ==============================================================================
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# ==============================================================================
+# Constants
+# ==============================================================================
+
+# The step sizes that every workload is run with
+STEP_SIZES = [0.05, 0.02, 0.01, 0.005, 0.0025]
+
+# The workloads that are run, `None` runs all of WORKLOADS
+RUN_WORKLOADS = None
+
+# Constants that are replaced in every script that has them, as the Python
+# source of the new value (such as `{'SOLVER': "'sor'", 'TOLERANCE': '1e-6'}`).
+# The scripts keep their own values for everything else.
+OVERRIDES = {}
+
+# Each workload is run this many times and the fastest run is kept, which
+# keeps the noise of the machine out of the comparisons
+REPEATS = 3
+
+# Runs that take longer than this many seconds are stopped and recorded as
+# timed out
+TIMEOUT = 3600
+
+# The file that the results of this run are written to
+OUT_FILENAME = 'benchmark.json'
+
+# The results that this run is compared against. When the file does not exist
+# yet, the results of this run are saved to it.
+BASELINE_FILENAME = 'baseline.json'
+
+# The root of the repo, the paths of the workloads are relative to it
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# ==============================================================================
+# Analytic solutions
+# ==============================================================================
+
+
+def _coords_mesh(saved):
+    return np.meshgrid(saved['x_coords'], saved['y_coords'])
+
+
+# Problem 1.21, a uniform charge density inside of a grounded unit square:
+#   V = 4 / (pi^3 eps_0) sum_m sin(k x) / m^3 (1 - cosh(k (y - 1/2)) /
+#                                                 cosh(k / 2))
+# for odd m and k = m pi. The cosh ratio is written with exponentials that
+# cannot overflow.
+def _exact_1_21(saved, terms=2000):
+    x_mesh, y_mesh = _coords_mesh(saved)
+    exact = np.zeros(x_mesh.shape)
+    for m in range(1, 2 * terms, 2):
+        k = m * np.pi
+        offset = y_mesh - 0.5
+        ratio = ((np.exp(k * (offset - 0.5)) + np.exp(-k * (offset + 0.5))) /
+                 (1 + np.exp(-k)))
+        exact += np.sin(k * x_mesh) / m**3 * (1 - ratio)
+    return exact * 4 / (np.pi**3 * 8.8541878128e-12)
+
+
+# Section 2.10, a box of width 1 and height 5 with a sine on the bottom:
+#   V = sin(pi x) sinh(pi (5 - y)) / sinh(5 pi)
+def _exact_2_10(saved):
+    x_mesh, y_mesh = _coords_mesh(saved)
+    return (np.sin(np.pi * x_mesh) * np.sinh(np.pi * (5 - y_mesh)) /
+            np.sinh(5 * np.pi))
+
+
+# Each workload is the script, the name of its step size constant and the
+# function that gives the analytic solution on its grid (or `None`)
+WORKLOADS = {
+    '1.21_square': ('numerical_hw1/relaxation_1.21.py', 'H_STEP_SIZE',
+                    _exact_1_21),
+    '2.10_sine': ('numerical_hw2/sec2_10_numerical.py', 'H_STEP_SIZE',
+                  _exact_2_10),
+    '2.11_wedge': ('numerical_hw2/sec2_11_numerical.py', 'H_STEP_SIZE', None),
+    '2.26_wedge_circle': ('numerical_hw2/q2_26_numerical.py', 'H_STEP_SIZE',
+                          None),
+    'cylinder': ('numerical_hw4/relaxation_technique_polarizable_cylinder.py',
+                 'H_STEP_SIZE', None),
+    '2.10_series': ('numerical_hw2/sec2_10_analytical_series.py',
+                    'H_STEP_SIZE', _exact_2_10),
+    '2.11_series': ('numerical_hw2/sec2_11_analytical_series.py',
+                    'H_STEP_SIZE', None),
+    '3.2_series_v1': ('numerical_hw3/fig_3_2_analytical_series_v1.py',
+                      'H_STEP_SIZE', None),
+    '3.2_series_v2': ('numerical_hw3/fig_3_2_analytical_series_v2.py',
+                      'H_STEP_SIZE', None),
+    '2.22_3.33': ('numerical_hw3/compare_eq_2_22_eq_3_33.py', 'STEP_SIZE',
+                  None),
+}
+
+# ==============================================================================
+# Run the workloads
+# ==============================================================================
+
+# The program that runs one script in the child process. The constants are
+# replaced in the source, which is then run as if it were the script itself.
+# The time and peak memory of the whole script are written to `run.json`.
+RUNNER = '''
+import json, re, sys, time
+script, overrides, repo_root = sys.argv[1:]
+overrides = json.loads(overrides)
+sys.path.append(repo_root)
+from relaxation.profiling import peak_memory
+with open(script) as script_file:
+    source = script_file.read()
+for name, value in overrides.items():
+    source = re.sub(rf'^{name} = .*$', f'{name} = {value}', source, count=1,
+                    flags=re.M)
+start = time.perf_counter()
+exec(compile(source, script, 'exec'), {'__name__': '__main__',
+                                       '__file__': script})
+with open('run.json', 'w') as run_file:
+    json.dump({
+        'seconds': time.perf_counter() - start,
+        'peak_memory_mb': peak_memory(),
+    }, run_file)
+'''
+
+
+def _run_once(name, step):
+    script, step_constant, exact = WORKLOADS[name]
+    script = os.path.abspath(os.path.join(REPO_ROOT, script))
+    overrides = dict(OVERRIDES)
+    overrides[step_constant] = repr(step)
+    overrides['OUT_FILENAME'] = repr('out.npz')
+    overrides['PROFILE_FILENAME'] = repr('profile.jsonl')
+    record = {'workload': name, 'step': step}
+    with tempfile.TemporaryDirectory() as run_dir:
+        env = dict(os.environ, MPLBACKEND='Agg')
+        try:
+            completed = subprocess.run(
+                [sys.executable, '-c', RUNNER, script, json.dumps(overrides),
+                 os.path.abspath(REPO_ROOT)],
+                cwd=run_dir, env=env, capture_output=True, text=True,
+                timeout=TIMEOUT)
+        except subprocess.TimeoutExpired:
+            record['status'] = 'timeout'
+            return record
+        if completed.returncode != 0:
+            record['status'] = 'failed'
+            record['error_output'] = completed.stderr[-2000:]
+            return record
+        record['status'] = 'ok'
+        with open(os.path.join(run_dir, 'run.json')) as run_file:
+            record.update(json.load(run_file))
+        # The stages and the solve itself, for the scripts that can be profiled
+        # (the time of the whole script includes importing the libraries)
+        profile_filename = os.path.join(run_dir, 'profile.jsonl')
+        if os.path.exists(profile_filename):
+            with open(profile_filename) as profile_file:
+                events = [json.loads(line) for line in profile_file]
+            record['stages'] = {event['stage']: event['seconds']
+                                for event in events
+                                if event['event'] == 'stage'}
+            solves = [event for event in events if event['event'] == 'solve']
+            if solves:
+                record['solve_seconds'] = sum(
+                    solve['seconds'] for solve in solves)
+                record['cell_updates_per_second'] = (
+                    solves[-1]['cell_updates_per_second'])
+        out_filename = os.path.join(run_dir, 'out.npz')
+        if os.path.exists(out_filename):
+            with np.load(out_filename) as saved:
+                if 'field' in saved.files:
+                    record['points'] = int(saved['field'].size)
+                if 'iterations' in saved.files:
+                    record['iterations'] = int(saved['iterations'])
+                    record['converged'] = bool(saved['converged'])
+                    history = saved['residual_history']
+                    if len(history):
+                        record['residual'] = float(history[-1, 1])
+                if exact is not None:
+                    solution = exact(saved)
+                    error = np.nanmax(np.abs(saved['field'] - solution))
+                    record['max_error'] = float(error)
+                    record['relative_error'] = float(
+                        error / np.nanmax(np.abs(solution)))
+    return record
+
+
+# Run a workload REPEATS times and keep the fastest run
+def _run(name, step):
+    best = None
+    for _ in range(max(int(REPEATS), 1)):
+        record = _run_once(name, step)
+        if record['status'] != 'ok':
+            return record
+        if best is None or record['seconds'] < best['seconds']:
+            best = record
+    return best
+
+
+def _environment():
+    environment = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    try:
+        environment['commit'] = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        environment['commit'] = None
+    return environment
+
+
+names = list(WORKLOADS) if RUN_WORKLOADS is None else list(RUN_WORKLOADS)
+for name in names:
+    if name not in WORKLOADS:
+        raise ValueError(f'Unknown workload `{name}`, must be one of '
+                         f'{tuple(WORKLOADS)}')
+
+results = []
+for name in names:
+    for step in STEP_SIZES:
+        record = _run(name, step)
+        results.append(record)
+        if record['status'] != 'ok':
+            print(f'{name:18} h={step:<7} {record["status"]}')
+            continue
+        line = (f'{name:18} h={step:<7} {record["seconds"]:9.3f} s '
+                f'{record["peak_memory_mb"]:8.1f} MB')
+        if 'solve_seconds' in record:
+            line += f'  solve {record["solve_seconds"]:8.3f} s'
+        if 'iterations' in record:
+            line += f'  {record["iterations"]:6} iterations'
+        if 'relative_error' in record:
+            line += f'  error {record["relative_error"]:.3e}'
+        print(line)
+
+# ==============================================================================
+# Save the results and compare them against the baseline
+# ==============================================================================
+
+report = {
+    'environment': _environment(),
+    'overrides': OVERRIDES,
+    'repeats': REPEATS,
+    'results': results,
+}
+with open(OUT_FILENAME, 'w') as out_file:
+    json.dump(report, out_file, indent=2)
+
+if not os.path.exists(BASELINE_FILENAME):
+    with open(BASELINE_FILENAME, 'w') as baseline_file:
+        json.dump(report, baseline_file, indent=2)
+    print(f'Saved the results as the baseline `{BASELINE_FILENAME}`')
+else:
+    with open(BASELINE_FILENAME) as baseline_file:
+        baseline = json.load(baseline_file)
+    baseline_results = {(record['workload'], record['step']): record
+                        for record in baseline['results']}
+    print(f'Compared with `{BASELINE_FILENAME}` '
+          f'(commit {baseline["environment"].get("commit")}), a ratio below '
+          f'one is an improvement:')
+    for record in results:
+        old = baseline_results.get((record['workload'], record['step']))
+        if (old is None or record['status'] != 'ok' or
+                old['status'] != 'ok'):
+            continue
+        line = (f'{record["workload"]:18} h={record["step"]:<7} time '
+                f'{record["seconds"] / old["seconds"]:6.2f}x  memory '
+                f'{record["peak_memory_mb"] / old["peak_memory_mb"]:6.2f}x')
+        if 'solve_seconds' in record and 'solve_seconds' in old:
+            line += (f'  solve '
+                     f'{record["solve_seconds"] / old["solve_seconds"]:6.2f}x')
+        if 'relative_error' in record and 'relative_error' in old:
+            line += (f'  error {old["relative_error"]:.3e} -> '
+                     f'{record["relative_error"]:.3e}')
+        print(line)
@@ -3,10 +3,16 @@
 # [PHYS 6570] Electromagnetic Theory I
 # Question 2.26 – Relaxation Algorithm Approach
 # ==============================================================================
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
+import os
+import sys
+
 import numpy as np
 
+# The shared relaxation package lives in the root of the repo
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from relaxation import (EPSILON_0, Profiler, SolveParameters, save, solve,
+                        wedge_circle_2_26)
+
 # ==============================================================================
 # Constants
 # ==============================================================================
@@ -14,6 +20,10 @@ import numpy as np
 # Display the text version of the field
 TEXT_FIELD = False
 
+# Do not plot the field (or import `matplotlib` at all), for batch jobs on
+# machines without a display. The field is always saved before it is plotted.
+HEADLESS = False
+
 # Bounds for the X and Y axes
 X_BOUNDS = [0, 2]
 Y_BOUNDS = [0, 1]
@@ -22,9 +32,56 @@ Y_BOUNDS = [0, 1]
 # size of the calculations field
 H_STEP_SIZE = 0.02
 
-# The total iterations in the relaxation algorithm
+# The total iterations in the relaxation algorithm. When a tolerance is given,
+# this is the max number of iterations.
 ITERATIONS = 5000
 
+# Stop iterating once the max residual (the largest change that a sweep makes
+# to the field) is below this value. When `None`, all ITERATIONS are done.
+TOLERANCE = None
+
+# The number of iterations between each residual check
+CHECK_EVERY = 10
+
+# Instead of a number of iterations, solve within this many seconds of wall
+# clock time on successively finer grids (see `relaxation/anytime.py`), which
+# also estimates the max error of the field. ITERATIONS is then the max number
+# of iterations of each grid and the solve stops early at TOLERANCE. `None`
+# does not limit the time.
+TIME_BUDGET = None
+
+# Where the inner points start from, `None` starts them at zero, `nested` first
+# solves the problem on coarser grids and `cache` uses the field saved in
+# OUT_FILENAME by an earlier run on the same grid (or `nested` without one)
+WARM_START = None
+
+# The relaxation solver, either `jacobi`, `compact` (the same updates, but only
+# the points inside of the boundary are stored, which is faster when they only
+# cover a small part of the grid), `threaded` (the same updates split across
+# threads), `sor` (red-black successive over-relaxation, which needs far fewer
+# iterations), `mixed` (single precision SOR sweeps with double precision
+# corrections, which reaches double precision accuracy), `multigrid` (where each
+# iteration is a full multigrid cycle), `sparse` (builds the linear system and
+# solves it directly, needs `scipy`) or `krylov` (conjugate gradient
+# preconditioned with sine transforms of the whole grid, which needs few
+# iterations for any shape)
+SOLVER = 'jacobi'
+
+# Extra options for the solver. The `sor` solver takes `omega`, which is picked
+# from the grid dimensions when not given (`estimate` measures it instead). The
+# `multigrid` solver takes `cycle`, either `v` or `fmg` (full multigrid). The
+# `sparse` solver takes `method`, either `cg` or `direct`, and `preconditioner`
+# for `cg`, one of `jacobi`, `ilu`, `multigrid` or `None`. The `threaded` solver
+# takes `threads`, which defaults to the number of cores. The `mixed` solver
+# takes `omega` like `sor` and `inner_reduction`, how far each correction is
+# solved. The `krylov` solver takes `preconditioner`, one of `fft`, `jacobi` or
+# `None`.
+SOLVER_OPTIONS = {}
+
+# The precision that the field is stored in. Use `float64` with the `mixed`
+# solver, otherwise its extra precision is lost.
+FIELD_DTYPE = 'float32'
+
 # Divide by epsilon
 ADD_EPSILON_SCALING = False
 
@@ -34,150 +91,140 @@ BETA_ANGLE = 35
 # Radius of the circle
 A_RAD = 0.5
 
-# The file in which the computed field will be saved
-OUT_FILENAME = 'numerical226.npz'
+# How the edges are put on the grid, `nearest` rounds every column to the row
+# nearest to the edge (the staircase that this script has always used) and
+# `distance` keeps every point inside of or on the edges of the shapes (see
+# `relaxation/geometry.py`)
+RASTERIZE = 'nearest'
 
-# ==============================================================================
-# Initialize the coordinates
-# ==============================================================================
-
-
-def _init_coords(bounds):
-    # Add one to the total number of steps so that the end bound is exclusive
-    # and does not contribute to the step size
-    total_steps = int(np.diff(bounds)[0] / H_STEP_SIZE) + 1
-    # Create evenly spaced coordinate steps between the bounds
-    coords = np.linspace(*bounds, total_steps)
-    return total_steps, coords
+# Potential of the right wall
+RIGHT_VOLTAGE = 5
 
+# The file in which the computed field will be saved
+OUT_FILENAME = 'numerical226.npz'
 
-x_steps, x_coords = _init_coords(X_BOUNDS)
-y_steps, y_coords = _init_coords(Y_BOUNDS)
+# The file in which the state of the solve is saved every CHECKPOINT_EVERY
+# iterations, so that a long run can be stopped and continued. `None` does not
+# save it.
+CHECKPOINT_FILENAME = None
+CHECKPOINT_EVERY = 1000
 
-# ==============================================================================
-# Initialize the field and empty vectors
-# ==============================================================================
+# Continue from the state saved in CHECKPOINT_FILENAME when it exists, this
+# gives the same field as a run that was never stopped
+RESUME = False
 
-# The field that calculations will be done within
-field = np.full((y_steps, x_steps), np.inf)
+# The file in which the response of the field to one volt on the right wall is
+# saved (see `relaxation/superposition.py`). When given, the field is the
+# response scaled by RIGHT_VOLTAGE instead of being relaxed, and the response
+# is only solved again once the geometry changes, so other voltages take no new
+# solve. `None` relaxes the field as usual.
+RESPONSE_FILENAME = None
 
-# Empty vectors that will be used to perform iterations faster
-empty_x_col = np.full(y_steps, 0)[:, None]
-empty_y_row = np.full(x_steps, 0)[None, :]
+# The file in which the wall time of every stage of the run and every sweep is
+# written, one JSON object per line (see `relaxation/profiling.py`). `None`
+# does not profile the run.
+PROFILE_FILENAME = None
 
 # ==============================================================================
 # Set the boundaries of the potential
 # ==============================================================================
 
-# Set the bottom to be zero potential
-field[0] = 0
-
-
-def _find_nearest_idx(coords, val):
-    return (np.abs(coords - val)).argmin()
-
-
-# Set all pixels on or above the slope to be a boundary
-slope = np.tan(np.radians(BETA_ANGLE))
-for x_idx, x_val in enumerate(x_coords):
-    y_val = slope * x_val
-    # If the slope has continued outside of the Y bounds, end the line
-    if y_val > Y_BOUNDS[1]:
-        continue
-    y_idx = _find_nearest_idx(y_coords, y_val)
-    field[y_idx:, x_idx] = 0
-
-# Circle about the origin: x^2 + y^2 = a^2
-# Solving for y: y = sqrt(a^2 - x^2)
-x_circle_max = _find_nearest_idx(x_coords, A_RAD) + 1
-for x_idx, x_val in enumerate(x_coords[:x_circle_max]):
-    y_val = np.sqrt(A_RAD**2 - x_val**2)
-    y_idx = _find_nearest_idx(y_coords, y_val)
-    field[:y_idx, x_idx] = 0
-
-field[:, -1] = 5
+# Time every stage of the run when profiling
+profiler = Profiler(PROFILE_FILENAME)
+profiler.stage('geometry')
 
-# ==============================================================================
-# Set the mask of all points inside of the boundary and make them finite
-# ==============================================================================
-
-# This mask will allow us to determine which points should be updated after each
-# iteration in the relaxation algorithm. We can determine that any points with a
-# value of `inf` must not be a boundary.
-inner_mask = field == np.inf
-# Turn the inner points back into finite values
-field[field == np.inf] = 0
+# The second half of the equation used to average points in the relaxation
+# algorithm is constant since the density across all points is constant:
+#   DENSITY * H_STEP_SIZE^2 / EPSILON_0 [Optional]
+relaxation_constant = H_STEP_SIZE**2
+if ADD_EPSILON_SCALING:
+    relaxation_constant /= EPSILON_0
 
-# ==============================================================================
-# Prepare the field for iterations
-# ==============================================================================
+# For some reason, adding in the H_STEP_SIZE**2 actually skewes the results
+relaxation_constant = 0
 
-# Conver the field to floats so that they can actually be non-integer values
-field = field.astype('float32')
+# The points that are not on the bottom, the other wall, the circle or the
+# right wall are relaxed
+problem = wedge_circle_2_26(H_STEP_SIZE, BETA_ANGLE, A_RAD, RIGHT_VOLTAGE,
+                            X_BOUNDS, Y_BOUNDS, relaxation_constant,
+                            RASTERIZE)
+x_coords, y_coords = problem.x_coords, problem.y_coords
 
 # ==============================================================================
 # Iterate for the relaxation algorithm
 # ==============================================================================
 
+profiler.stage('iterate')
+
 if TEXT_FIELD:
     print('Initial Field:')
-    print(field)
+    print(problem.field.astype(FIELD_DTYPE))
+
+# Do all the points at the same time:
+#   (V_i+1,j + V_i-1,j + V_i,j+1 + V_i,j-1 + relaxation_constant) / 4
+parameters = SolveParameters(
+    iterations=ITERATIONS,
+    tolerance=TOLERANCE,
+    check_every=CHECK_EVERY,
+    time_budget=TIME_BUDGET,
+    warm_start=WARM_START,
+    solver=SOLVER,
+    solver_options=SOLVER_OPTIONS,
+    field_dtype=FIELD_DTYPE,
+    out_filename=OUT_FILENAME,
+    checkpoint_filename=CHECKPOINT_FILENAME,
+    checkpoint_every=CHECKPOINT_EVERY,
+    resume=RESUME,
+    response_filename=RESPONSE_FILENAME,
+)
+result = solve(problem, parameters, profiler)
+field = result.field
+if result.error_estimates is not None:
+    print('Estimated max error: '
+          f'{result.error_estimates["error_estimate"]:.3e}')
 
-# The second half of the equation used to average points in the relaxation
-# algorithm is constant since the density across all points is constant:
-#   DENSITY * H_STEP_SIZE^2 / EPSILON_0 [Optional]
-relaxation_constant = H_STEP_SIZE**2
-if ADD_EPSILON_SCALING:
-    # Epislon has units of F * m^-1 (farads per meter)
-    relaxation_constant /= 8.8541878128e-12
+if TEXT_FIELD:
+    print(f'After {result.iterations} iterations:')
+    print(field)
 
-# For some reason, adding in the H_STEP_SIZE**2 actually skewes the results
-relaxation_constant = 0
+# ==============================================================================
+# Save the computed field
+# ==============================================================================
 
-for i in range(ITERATIONS):
-    # The four directions specify which side has an empty vector shifting the
-    # values over. So, `top` means that the top row has an empty vector and the
-    # other rows are all being shifted down one.
-    top = np.concatenate((empty_y_row, field[:-1]))
-    bottom = np.concatenate((field[1:], empty_y_row))
-    left = np.concatenate((empty_x_col, field[:, :-1]), axis=1)
-    right = np.concatenate((field[:, 1:], empty_x_col), axis=1)
-    # Do all the points at the same time:
-    #   (V_i+1,j + V_i-1,j + V_i,j+1 + V_i,j-1 + relaxation_constant) / 4
-    summed = (top + bottom + left + right + relaxation_constant) / 4
-    field[inner_mask] = summed[inner_mask]
+profiler.stage('save')
 
-if TEXT_FIELD:
-    print(f'After {ITERATIONS} iterations:')
-    print(field)
+save(problem, result, OUT_FILENAME)
 
 # ==============================================================================
 # Plot out the final field using mpl
 # ==============================================================================
 
-fig = plt.figure()
-ax = fig.add_subplot(111, projection='3d')
-x_mesh, y_mesh = np.meshgrid(x_coords, y_coords)
-ax.plot_surface(x_mesh, y_mesh, field)
+profiler.stage('plot')
 
-# Add a line that represents the other wall
-slope_x = np.array([x for x in x_coords])
-slope_y = np.array([x * slope for x in x_coords])
-slope_mask = slope_y <= Y_BOUNDS[1]
-slope_x = slope_x[slope_mask]
-slope_y = slope_y[slope_mask]
-ax.plot(slope_x, slope_y, zorder=5)
+if not HEADLESS:
+    import matplotlib.pyplot as plt
+    from mpl_toolkits.mplot3d import Axes3D
 
-circle_x = np.array([x for x in x_coords[:x_circle_max]])
-circle_y = np.array([np.sqrt(A_RAD**2 - x**2) for x in circle_x])
-ax.plot(circle_x, circle_y, zorder=5)
+    fig = plt.figure()
+    ax = fig.add_subplot(111, projection='3d')
+    x_mesh, y_mesh = np.meshgrid(x_coords, y_coords)
+    ax.plot_surface(x_mesh, y_mesh, field)
 
-ax.set_box_aspect(aspect=(X_BOUNDS[1], Y_BOUNDS[1], 1))
-plt.title('Relaxation Algorithm')
-plt.show()
+    # Add a line that represents the other wall
+    slope = np.tan(np.radians(BETA_ANGLE))
+    slope_x = np.array([x for x in x_coords])
+    slope_y = np.array([x * slope for x in x_coords])
+    slope_mask = slope_y <= Y_BOUNDS[1]
+    slope_x = slope_x[slope_mask]
+    slope_y = slope_y[slope_mask]
+    ax.plot(slope_x, slope_y, zorder=5)
 
-# ==============================================================================
-# Save the computed field
-# ==============================================================================
+    circle_x = x_coords[x_coords <= A_RAD]
+    circle_y = np.array([np.sqrt(A_RAD**2 - x**2) for x in circle_x])
+    ax.plot(circle_x, circle_y, zorder=5)
+
+    ax.set_box_aspect(aspect=(X_BOUNDS[1], Y_BOUNDS[1], 1))
+    plt.title('Relaxation Algorithm')
+    plt.show()
 
-np.savez(OUT_FILENAME, x_coords=x_coords, y_coords=y_coords, field=field)
+profiler.finish()
@@ -0,0 +1,130 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Question 2.26 – Relaxation Algorithm Parameter Sweep
+# Solves the wedge of question 2.26 for every combination of beta, radius and
+# voltage at once. A radius of zero leaves out the circle, which gives the
+# wedge of section 2.11. The field scales with the voltage, so every geometry
+# is only solved once with one volt on the right side.
+# ==============================================================================
+import itertools
+import os
+import sys
+
+import numpy as np
+
+# The shared relaxation package lives in the root of the repo
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from relaxation import BatchKernel, Profiler, init_coords, wedge_circle_2_26
+
+# ==============================================================================
+# Constants
+# ==============================================================================
+
+# Bounds for the X and Y axes
+X_BOUNDS = [0, 2]
+Y_BOUNDS = [0, 1]
+
+# Step size determines how many boxes will be used. This directly affects the
+# size of the calculations field
+H_STEP_SIZE = 0.02
+
+# The max number of iterations for every configuration
+ITERATIONS = 5000
+
+# Each configuration stops iterating once its max residual is below this value
+TOLERANCE = 1e-6
+
+# The number of iterations between each residual check
+CHECK_EVERY = 10
+
+# The relaxation solver, either `jacobi` or `sor` (red-black successive
+# over-relaxation, which needs far fewer iterations)
+SOLVER = 'sor'
+
+# Angles of beta in degrees
+BETA_ANGLES = np.arange(10, 65, 5)
+
+# Radii of the circle
+A_RADS = [0, 0.25, 0.5, 0.75]
+
+# Potentials of the right side of the field
+VOLTAGES = [5, 40]
+
+# The file in which the computed fields will be saved
+OUT_FILENAME = 'sweep226.npz'
+
+# The file in which the wall time of every stage of the run is written, one
+# JSON object per line (see `relaxation/profiling.py`). `None` does not profile
+# the run.
+PROFILE_FILENAME = None
+
+# ==============================================================================
+# Build the field and mask for every configuration
+# ==============================================================================
+
+# Time every stage of the run when profiling
+profiler = Profiler(PROFILE_FILENAME)
+profiler.stage('geometry')
+
+
+# Same boundaries as `q2_26_numerical.py` with one volt on the right side
+def _build_geometry(beta_angle, a_rad):
+    problem = wedge_circle_2_26(H_STEP_SIZE, beta_angle, a_rad, 1, X_BOUNDS,
+                                Y_BOUNDS)
+    return problem.field, problem.inner_mask
+
+
+x_coords = init_coords(X_BOUNDS, H_STEP_SIZE)
+y_coords = init_coords(Y_BOUNDS, H_STEP_SIZE)
+shapes = list(itertools.product(BETA_ANGLES, A_RADS))
+geometries = [_build_geometry(*shape) for shape in shapes]
+unit_fields, inner_masks = map(np.stack, zip(*geometries))
+
+# ==============================================================================
+# Iterate for the relaxation algorithm
+# ==============================================================================
+
+profiler.stage('iterate')
+
+# The unit fields are scaled by up to the largest voltage, so their residual
+# has to be that much smaller
+voltages = np.array(VOLTAGES, dtype='float64')
+kernel = BatchKernel(unit_fields, inner_masks, solver=SOLVER)
+results = kernel.solve(ITERATIONS, TOLERANCE / np.abs(voltages).max(),
+                       CHECK_EVERY)
+
+# Every configuration is a unit field scaled by its voltage (the voltages are
+# the innermost loop of the configurations)
+configs = list(itertools.product(BETA_ANGLES, A_RADS, VOLTAGES))
+fields = unit_fields[:, None] * voltages[:, None, None]
+fields = fields.reshape(-1, *unit_fields.shape[1:]).astype('float32')
+unit_iterations = np.array([result.iterations for result in results])
+unit_residuals = np.array([result.residual for result in results])
+iterations = np.repeat(unit_iterations, len(voltages))
+residuals = (unit_residuals[:, None] * np.abs(voltages)).reshape(-1)
+converged = np.repeat([result.converged for result in results],
+                      len(voltages))
+print(f'{np.count_nonzero(converged)} of {len(configs)} configurations '
+      'converged')
+
+# ==============================================================================
+# Save the computed fields
+# ==============================================================================
+
+profiler.stage('save')
+
+configs = np.array(configs, dtype='float64')
+np.savez(
+    OUT_FILENAME,
+    x_coords=x_coords,
+    y_coords=y_coords,
+    beta_angles=configs[:, 0],
+    a_rads=configs[:, 1],
+    voltages=configs[:, 2],
+    fields=fields,
+    iterations=iterations,
+    residuals=residuals,
+    converged=converged,
+)
+profiler.finish()
@@ -6,13 +6,23 @@
 # will be saved and written out. This code should be pretty fast since
 # everything is vectorized, it will just be a bit more memory intensive.
 # ==============================================================================
-import matplotlib.pyplot as plt
+import os
+import sys
+
 import numpy as np
 
+# The shared relaxation package lives in the root of the repo
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from relaxation import legendre_series_v2
+
 # ==============================================================================
 # Constants
 # ==============================================================================
 
+# Do not plot the field (or import `matplotlib` at all), for batch jobs on
+# machines without a display. The field is always saved before it is plotted.
+HEADLESS = False
+
 # Bounds for the X axes
 X_BOUNDS = [-1, 1]
 
@@ -27,63 +37,27 @@ N_TERMS = 100
 OUT_FILENAME = 'fig_3_2_analytical_series_v2.npz'
 
 # ==============================================================================
-# Initialize the coordinates and empty field
+# Iterate for the infinite series
 # ==============================================================================
 
-
-def _init_coords(bounds):
-    # Add one to the total number of steps so that the end bound is exclusive
-    # and does not contribute to the step size
-    total_steps = int(np.diff(bounds)[0] / H_STEP_SIZE) + 1
-    # Create evenly spaced coordinate steps between the bounds
-    coords = np.linspace(*bounds, total_steps)
-    return total_steps, coords
-
-
-x_steps, x_coords = _init_coords(X_BOUNDS)
-
-# The field that will be filled in, each row corresponds to a different
-# term value
-field = np.full([N_TERMS, x_steps], 1).astype('float32')
+# Each row of the field corresponds to a different term value
+x_coords, field = legendre_series_v2(H_STEP_SIZE, X_BOUNDS, N_TERMS)
 
 # ==============================================================================
-# Iterate for the infinite series
+# Save the computed field
 # ==============================================================================
 
-Legendre = np.polynomial.legendre.Legendre
-
-for n_idx in range(N_TERMS):
-    # Legendre of degree n integrated between 0 and 1
-    legendre_int = np.sum(
-        Legendre.basis(
-            n_idx,
-            domain=[0, 1],
-            window=[0, 1],
-        ).integ(1).coef)
-    # Equation 3.25
-    A_n = (2 * n_idx + 1) * legendre_int
-    # Equation 3.23
-    x_vals = A_n * Legendre.basis(n_idx).linspace(x_steps, X_BOUNDS)[1]
-    # Add on the previous terms
-    if n_idx > 0:
-        x_vals += field[n_idx - 1, :]
-    field[n_idx, :] = x_vals
-
-# Field was between 0 and 2
-field -= 1
+np.savez(OUT_FILENAME, x_coords=x_coords, field=field)
 
 # ==============================================================================
 # Plot out the final field using mpl
 # ==============================================================================
 
-plt.plot(x_coords, field[-1])
-plt.title('Analytical Infinite Series')
-plt.xlabel('X-Coordinates')
-plt.ylabel('f(x)')
-plt.show()
+if not HEADLESS:
+    import matplotlib.pyplot as plt
 
-# ==============================================================================
-# Save the computed field
-# ==============================================================================
-
-np.savez(OUT_FILENAME, x_coords=x_coords, field=field)
+    plt.plot(x_coords, field[-1])
+    plt.title('Analytical Infinite Series')
+    plt.xlabel('X-Coordinates')
+    plt.ylabel('f(x)')
+    plt.show()
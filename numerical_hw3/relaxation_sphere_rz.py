@@ -0,0 +1,194 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Equations 2.22 and 3.33 – Relaxation Algorithm Approach
+# The sphere with its hemispheres held at plus and minus VOLTAGE is symmetric
+# about the z-axis, so it is relaxed on the (r, z) half plane with the Laplacian
+# in cylindrical coordinates (see `relaxation/axisymmetric.py`). The potential
+# along the z-axis is compared against equation 2.22.
+# ==============================================================================
+import os
+import sys
+
+import numpy as np
+
+# The shared relaxation package lives in the root of the repo
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from relaxation import Profiler, SolveParameters, save, solve, sphere_3_36
+
+# ==============================================================================
+# Constants
+# ==============================================================================
+
+# Display the text version of the field
+TEXT_FIELD = False
+
+# Do not plot the field (or import `matplotlib` at all), for batch jobs on
+# machines without a display. The field is always saved before it is plotted.
+HEADLESS = False
+
+# Bounds for the R and Z axes, the edges away from the axis are held at the
+# exterior series of equation 3.36
+R_BOUNDS = [0, 4]
+Z_BOUNDS = [-4, 4]
+
+# Step size determines how many boxes will be used. This directly affects the
+# size of the calculations field
+H_STEP_SIZE = 0.05
+
+# The total iterations in the relaxation algorithm. When a tolerance is given,
+# this is the max number of iterations.
+ITERATIONS = 20000
+
+# Stop iterating once the max residual (the largest change that a sweep makes
+# to the field) is below this value. When `None`, all ITERATIONS are done.
+TOLERANCE = 1e-6
+
+# The number of iterations between each residual check
+CHECK_EVERY = 10
+
+# Instead of a number of iterations, solve within this many seconds of wall
+# clock time on successively finer grids (see `relaxation/anytime.py`), which
+# also estimates the max error of the field. ITERATIONS is then the max number
+# of iterations of each grid and the solve stops early at TOLERANCE. `None`
+# does not limit the time.
+TIME_BUDGET = None
+
+# Where the inner points start from, `None` starts them at zero, `nested` first
+# solves the problem on coarser grids and `cache` uses the field saved in
+# OUT_FILENAME by an earlier run on the same grid (or `nested` without one)
+WARM_START = None
+
+# The relaxation solver, any of the solvers of the other relaxation scripts
+# that take an epsilon field (every one but `fast`), since the radius is
+# folded into the epsilon field
+SOLVER = 'sor'
+
+# Extra options for the solver, same as the other relaxation scripts
+SOLVER_OPTIONS = {}
+
+# The precision that the field is stored in
+FIELD_DTYPE = 'float32'
+
+# Radius of the sphere
+RADIUS = 1
+
+# Potential of the upper hemisphere, the lower one is at minus this potential
+VOLTAGE = 1
+
+# The file in which the computed field will be saved
+OUT_FILENAME = 'relaxation_sphere_rz.npz'
+
+# The file in which the state of the solve is saved every CHECKPOINT_EVERY
+# iterations, so that a long run can be stopped and continued. `None` does not
+# save it.
+CHECKPOINT_FILENAME = None
+CHECKPOINT_EVERY = 1000
+
+# Continue from the state saved in CHECKPOINT_FILENAME when it exists, this
+# gives the same field as a run that was never stopped
+RESUME = False
+
+# The file in which the wall time of every stage of the run and every sweep is
+# written, one JSON object per line (see `relaxation/profiling.py`). `None`
+# does not profile the run.
+PROFILE_FILENAME = None
+
+# ==============================================================================
+# Build the field, boundaries and mask
+# ==============================================================================
+
+# Time every stage of the run when profiling
+profiler = Profiler(PROFILE_FILENAME)
+profiler.stage('geometry')
+
+# The points that are not inside of the sphere or on the edges away from the
+# axis are relaxed
+problem = sphere_3_36(H_STEP_SIZE, RADIUS, VOLTAGE, R_BOUNDS, Z_BOUNDS)
+r_coords, z_coords = problem.x_coords, problem.y_coords
+
+# ==============================================================================
+# Iterate for the relaxation algorithm
+# ==============================================================================
+
+profiler.stage('iterate')
+
+if TEXT_FIELD:
+    print('Initial Field:')
+    print(problem.field.astype(FIELD_DTYPE))
+
+# Do all the points at the same time, weighted by their radii
+parameters = SolveParameters(
+    iterations=ITERATIONS,
+    tolerance=TOLERANCE,
+    check_every=CHECK_EVERY,
+    time_budget=TIME_BUDGET,
+    warm_start=WARM_START,
+    solver=SOLVER,
+    solver_options=SOLVER_OPTIONS,
+    field_dtype=FIELD_DTYPE,
+    out_filename=OUT_FILENAME,
+    checkpoint_filename=CHECKPOINT_FILENAME,
+    checkpoint_every=CHECKPOINT_EVERY,
+    resume=RESUME,
+)
+result = solve(problem, parameters, profiler)
+field = result.field
+if result.error_estimates is not None:
+    print('Estimated max error: '
+          f'{result.error_estimates["error_estimate"]:.3e}')
+
+if TEXT_FIELD:
+    print(f'After {result.iterations} iterations:')
+    print(field)
+
+# ==============================================================================
+# Compare the z-axis against equation 2.22
+# ==============================================================================
+
+# The points of the z-axis above the sphere
+above = z_coords > RADIUS
+axis_coords = z_coords[above]
+axis_field = field[above, 0]
+# Equation 2.22
+field_2_22 = VOLTAGE * (1 - (axis_coords**2 - RADIUS**2) /
+                        (axis_coords * (axis_coords**2 + RADIUS**2)**0.5))
+print('Max difference from 2.22 along the z-axis: '
+      f'{np.max(np.abs(axis_field - field_2_22)):.3e}')
+
+# ==============================================================================
+# Save the computed field
+# ==============================================================================
+
+profiler.stage('save')
+
+save(problem, result, OUT_FILENAME)
+
+# ==============================================================================
+# Plot out the final field using mpl
+# ==============================================================================
+
+profiler.stage('plot')
+
+if not HEADLESS:
+    import matplotlib.pyplot as plt
+    from mpl_toolkits.mplot3d import Axes3D
+
+    fig = plt.figure()
+    ax = fig.add_subplot(111, projection='3d')
+    r_mesh, z_mesh = np.meshgrid(r_coords, z_coords)
+    ax.plot_surface(r_mesh, z_mesh, field)
+    ax.set_xlabel('R')
+    ax.set_ylabel('Z')
+    plt.title('Relaxation Algorithm')
+
+    plt.figure()
+    plt.plot(axis_coords, axis_field, label='Relaxation')
+    plt.plot(axis_coords, field_2_22, label='2.22')
+    plt.title('Relaxation vs 2.22')
+    plt.xlabel('Z-Coordinates')
+    plt.ylabel('Potential')
+    plt.legend()
+    plt.show()
+
+profiler.finish()
@@ -2,10 +2,16 @@
 # Michael Jones (Michael_Jones6@student.uml.edu)
 # [PHYS 6570] Electromagnetic Theory I
 # ==============================================================================
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
+import os
+import sys
+
 import numpy as np
 
+# The shared relaxation package lives in the root of the repo
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from relaxation import (EPSILON_0, Profiler, SolveParameters,
+                        polarizable_cylinder, save, solve)
+
 # ==============================================================================
 # Constants
 # ==============================================================================
@@ -13,6 +19,10 @@ import numpy as np
 # Display the text version of the field
 TEXT_FIELD = False
 
+# Do not plot the field (or import `matplotlib` at all), for batch jobs on
+# machines without a display. The field is always saved before it is plotted.
+HEADLESS = False
+
 # Bounds for the X and Y axes
 X_BOUNDS = [-1, 1]
 Y_BOUNDS = [-1, 1]
@@ -22,13 +32,87 @@ Y_BOUNDS = [-1, 1]
 # checks to verify that the radius is acceptable).
 RADIUS = 0.75
 
+# How the edges are put on the grid, `nearest` rounds every column to the row
+# nearest to the edge (the staircase that this script has always used) and
+# `distance` keeps every point inside of or on the edges of the shapes (see
+# `relaxation/geometry.py`)
+RASTERIZE = 'nearest'
+
 # Step size determines how many boxes will be used. This directly affects the
 # size of the calculations field
 H_STEP_SIZE = 0.005
 
-# The total iterations in the relaxation algorithm
+# The total iterations in the relaxation algorithm. When a tolerance is given,
+# this is the max number of iterations.
 ITERATIONS = 5000
 
+# Stop iterating once the max residual (the largest change that a sweep makes
+# to the field) is below this value. When `None`, all ITERATIONS are done.
+TOLERANCE = None
+
+# The number of iterations between each residual check
+CHECK_EVERY = 10
+
+# Instead of a number of iterations, solve within this many seconds of wall
+# clock time on successively finer grids (see `relaxation/anytime.py`), which
+# also estimates the max error of the field. ITERATIONS is then the max number
+# of iterations of each grid and the solve stops early at TOLERANCE. `None`
+# does not limit the time.
+TIME_BUDGET = None
+
+# Where the inner points start from, `None` starts them at zero, `nested` first
+# solves the problem on coarser grids and `cache` uses the field saved in
+# OUT_FILENAME by an earlier run on the same grid (or `nested` without one)
+WARM_START = None
+
+# The relaxation solver, either `jacobi`, `compact` (the same updates, but only
+# the points inside of the boundary are stored, which is faster when they only
+# cover a small part of the grid), `threaded` (the same updates split across
+# threads), `sor` (red-black successive over-relaxation, which needs far fewer
+# iterations), `mixed` (single precision SOR sweeps with double precision
+# corrections, which reaches double precision accuracy), `multigrid` (where each
+# iteration is a full multigrid cycle), `sparse` (builds the linear system and
+# solves it directly, needs `scipy`), `krylov` (conjugate gradient
+# preconditioned with sine transforms of the whole grid, which needs few
+# iterations for any shape) or `out_of_core` (the `jacobi` updates on a few rows
+# at a time of a field kept in a file, see OUT_OF_CORE_DIRECTORY)
+SOLVER = 'jacobi'
+
+# Extra options for the solver. The `sor` solver takes `omega`, which is picked
+# from the grid dimensions when not given (`estimate` measures it instead). The
+# `multigrid` solver takes `cycle`, either `v` or `fmg` (full multigrid). The
+# `sparse` solver takes `method`, either `cg` or `direct`, and `preconditioner`
+# for `cg`, one of `jacobi`, `ilu`, `multigrid` or `None`. The `threaded` solver
+# takes `threads`, which defaults to the number of cores. The `mixed` solver
+# takes `omega` like `sor` and `inner_reduction`, how far each correction is
+# solved. The `krylov` solver takes `preconditioner`, one of `fft`, `jacobi` or
+# `None`. The `out_of_core` solver takes `directory` and `tile_mb`, which
+# default to OUT_OF_CORE_DIRECTORY and TILE_MB.
+SOLVER_OPTIONS = {}
+
+# The precision that the field is stored in. Use `float64` with the `mixed`
+# solver, otherwise its extra precision is lost.
+FIELD_DTYPE = 'float32'
+
+# Only relax the part of the field that is not a mirror image of the rest (see
+# `relaxation/symmetry.py`), either `None` (the whole field), `detect` (every
+# axis that the problem is a mirror image across) or a list of the axes, 0 for
+# the rows and 1 for the columns of the field. Works with the `jacobi`, `sor`
+# and `mixed` solvers. The cylinder is a mirror image across both lines through
+# its center, so `detect` only relaxes a quarter of the field.
+SYMMETRY = None
+
+# Keep the field, inner mask and epsilon field in memory-mapped files in this
+# folder instead of in memory, for grids that are too large for the memory of
+# the machine (see `relaxation/out_of_core.py`). Solve them with the
+# `out_of_core` solver, any other solver reads the whole field into memory.
+# `None` keeps them in memory.
+OUT_OF_CORE_DIRECTORY = None
+
+# The memory budget in MB of the tile of rows that is built or relaxed at a time
+# when OUT_OF_CORE_DIRECTORY is given
+TILE_MB = 64
+
 # Divide by epsilon
 ADD_EPSILON_SCALING = False
 
@@ -38,168 +122,124 @@ NO_CHARGE_DENSITY = True
 # The file in which the computed field will be saved
 OUT_FILENAME = 'relaxation.npz'
 
-# ==============================================================================
-# Initialize the coordinates
-# ==============================================================================
-
-
-def _init_coords(bounds):
-    # Add one to the total number of steps so that the end bound is exclusive
-    # and does not contribute to the step size
-    total_steps = int(np.diff(bounds)[0] / H_STEP_SIZE) + 1
-    # Create evenly spaced coordinate steps between the bounds
-    coords = np.linspace(*bounds, total_steps)
-    return total_steps, coords
-
-
-x_steps, x_coords = _init_coords(X_BOUNDS)
-y_steps, y_coords = _init_coords(Y_BOUNDS)
-
-# ==============================================================================
-# Initialize the field and empty vectors
-# ==============================================================================
-
-# The field that calculations will be done within.
-# This represents the electric potential.
-field = np.full((y_steps, x_steps), np.inf)
-
-# Empty vectors that will be used to perform iterations faster
-empty_x_col = np.full(y_steps, 0)[:, None]
-empty_y_row = np.full(x_steps, 0)[None, :]
-
-# ==============================================================================
-# Initialize the epsilon field
-# ==============================================================================
-
-# Epsilon will default to a value of 1
-epsilon_field = np.full((y_steps, x_steps), 1)
-
-# ==============================================================================
-# Set the boundaries of the electric potential and epsilon
-# ==============================================================================
-
-
-def _find_nearest_idx(coords, val):
-    return (np.abs(coords - val)).argmin()
-
-
-mid_x_coord_idx = (x_steps - 1) // 2
-mid_x_coord = x_coords[mid_x_coord_idx]
-mid_y_coord = y_coords[(y_steps - 1) // 2]
-# Solving for y: y = sqrt(a^2 - x^2)
-for rel_x_idx, x_idx in enumerate(np.arange(x_steps)[mid_x_coord_idx:]):
-    x_val = x_coords[x_idx]
-    rel_x_val = np.abs(x_val - mid_x_coord)
-    if rel_x_val > RADIUS:
-        break
-    y_val = np.sqrt(RADIUS**2 - rel_x_val**2)
-    y_idx_below = _find_nearest_idx(y_coords, mid_y_coord - y_val)
-    y_idx_above = _find_nearest_idx(y_coords, mid_y_coord + y_val)
-    # Pixels to the right of the middle are given by `x_idx`
-    # Pixels to the left of the middle are given by `x_idx - (rel_x_idx * 2)`
-    l_x_idx = x_idx - (rel_x_idx * 2)
-    # The inside of the cylinder
-    field[y_idx_below:y_idx_above, x_idx] = 0
-    field[y_idx_below:y_idx_above, l_x_idx] = 0
-    # The boundaries of the cylinder
-    field[y_idx_below, x_idx] = 10
-    field[y_idx_above, x_idx] = 10
-    field[y_idx_below, l_x_idx] = 10
-    field[y_idx_above, l_x_idx] = 10
-    # The epsilon inside the cylinder
-    epsilon_field[y_idx_below:y_idx_above, x_idx] = 5
-    epsilon_field[y_idx_below:y_idx_above, l_x_idx] = 5
+# The file in which the state of the solve is saved every CHECKPOINT_EVERY
+# iterations, so that a long run can be stopped and continued. `None` does not
+# save it.
+CHECKPOINT_FILENAME = None
+CHECKPOINT_EVERY = 1000
 
-# ==============================================================================
-# Set the mask of all points inside of the boundary and make them finite
-# ==============================================================================
+# Continue from the state saved in CHECKPOINT_FILENAME when it exists, this
+# gives the same field as a run that was never stopped
+RESUME = False
 
-# This mask will allow us to determine which points should be updated after each
-# iteration in the relaxation algorithm. We can determine that any points with a
-# value of `np.inf` must be the boundary.
-inner_mask = field != np.inf
-# Turn the boundary points back into finite values
-field[field == np.inf] = 0
+# Levels of patches placed over the points with the largest truncation error
+# (such as along the staircased edge of the cylinder, where epsilon jumps), each
+# with half the step size of the last. `0` only solves the uniform grid. The
+# patches are solved with SOLVER and SOLVER_OPTIONS (`sor` is far faster than
+# `jacobi` for them) and the field is saved on the uniform grid. Warm starts
+# and checkpoints are not used then.
+REFINE_LEVELS = 0
 
-# ==============================================================================
-# Prepare the field for iterations
-# ==============================================================================
+# Patches are placed where the estimated truncation error of the field is
+# larger than this fraction of the largest potential
+REFINE_THRESHOLD = 1e-3
 
-# Conver the field to floats so that they can actually be non-integer values
-field = field.astype('float32')
+# The file in which the wall time of every stage of the run and every sweep is
+# written, one JSON object per line (see `relaxation/profiling.py`). `None`
+# does not profile the run.
+PROFILE_FILENAME = None
 
 # ==============================================================================
-# Iterate for the relaxation algorithm
+# Build the electric potential, epsilon and mask
 # ==============================================================================
 
-if TEXT_FIELD:
-    print('Initial Field:')
-    print(field)
+# Time every stage of the run when profiling
+profiler = Profiler(PROFILE_FILENAME)
+profiler.stage('geometry')
 
 # The second half of the equation used to average points in the relaxation
 # algorithm is constant since the density across all points is constant:
 #   DENSITY * H_STEP_SIZE^2 / EPSILON_0 [Optional]
 relaxation_constant = H_STEP_SIZE**2
 if ADD_EPSILON_SCALING:
-    # Epislon has units of F * m^-1 (farads per meter)
-    relaxation_constant /= 8.8541878128e-12
+    relaxation_constant /= EPSILON_0
+
 # No charge density present
 if NO_CHARGE_DENSITY:
     relaxation_constant = 0
 
-for i in range(ITERATIONS):
-    # The four directions specify which side has an empty vector shifting the
-    # values over. So, `top` means that the top row has an empty vector and the
-    # other rows are all being shifted down one.
-    top = np.concatenate((empty_y_row, field[:-1]))
-    bottom = np.concatenate((field[1:], empty_y_row))
-    left = np.concatenate((empty_x_col, field[:, :-1]), axis=1)
-    right = np.concatenate((field[:, 1:], empty_x_col), axis=1)
-
-    # The same now for the epsilon field, except for epsilon is only a half
-    # step which means the points needs to be averaged together
-    def _find_avg_eps_field(shifted_tuple, axis=0):
-        return (epsilon_field + np.concatenate(shifted_tuple, axis=axis)) / 2
-
-    top_eps = _find_avg_eps_field((empty_y_row, epsilon_field[:-1]))
-    bottom_eps = _find_avg_eps_field((epsilon_field[1:], empty_y_row))
-    left_eps = _find_avg_eps_field((empty_x_col, epsilon_field[:, :-1]), 1)
-    right_eps = _find_avg_eps_field((epsilon_field[:, 1:], empty_x_col), 1)
-
-    # Do all the points at the same time:
-    # (   V_i+1,j * eps_i+0.5,j
-    #   + V_i-1,j * eps_i-0.5,j
-    #   + V_i,j+1 * eps_i,j+0.5
-    #   + V_i,j-1 * eps_i,j-0.5
-    #   + relaxation_constant
-    # ) / (   eps_i+0.5,j
-    #       + eps_i-0.5,j
-    #       + eps_i,j+0.5
-    #       + eps_i,j-0.5 )
-    summed = (top * top_eps + bottom * bottom_eps + left * left_eps +
-              right * right_eps + relaxation_constant) / (
-                  top_eps + bottom_eps + left_eps + right_eps)
-    field[inner_mask] = summed[inner_mask]
+# Only the points inside of the cylinder are relaxed, the rest of the field is
+# a boundary
+problem = polarizable_cylinder(H_STEP_SIZE, RADIUS, X_BOUNDS, Y_BOUNDS,
+                               relaxation_constant, OUT_OF_CORE_DIRECTORY,
+                               TILE_MB, RASTERIZE)
+x_coords, y_coords = problem.x_coords, problem.y_coords
+
+# ==============================================================================
+# Iterate for the relaxation algorithm
+# ==============================================================================
+
+profiler.stage('iterate')
+
+if TEXT_FIELD:
+    print('Initial Field:')
+    print(problem.field.astype(FIELD_DTYPE))
+
+parameters = SolveParameters(
+    iterations=ITERATIONS,
+    tolerance=TOLERANCE,
+    check_every=CHECK_EVERY,
+    time_budget=TIME_BUDGET,
+    warm_start=WARM_START,
+    solver=SOLVER,
+    solver_options=SOLVER_OPTIONS,
+    symmetry=SYMMETRY,
+    field_dtype=FIELD_DTYPE,
+    out_filename=OUT_FILENAME,
+    checkpoint_filename=CHECKPOINT_FILENAME,
+    checkpoint_every=CHECKPOINT_EVERY,
+    resume=RESUME,
+    refine_levels=REFINE_LEVELS,
+    refine_threshold=REFINE_THRESHOLD,
+)
+result = solve(problem, parameters, profiler)
+field = result.field
+if result.error_estimates is not None:
+    print('Estimated max error: '
+          f'{result.error_estimates["error_estimate"]:.3e}')
+if REFINE_LEVELS > 0:
+    print(f'Composite grid: {problem.composite.cells} points instead of '
+          f'{problem.composite.uniform_cells}')
 
 if TEXT_FIELD:
-    print(f'After {ITERATIONS} iterations:')
+    print(f'After {result.iterations} iterations:')
     print(field)
 
 # ==============================================================================
-# Plot out the final field using mpl
+# Save the computed field
 # ==============================================================================
 
-fig = plt.figure()
-ax = fig.add_subplot(111, projection='3d')
-x_mesh, y_mesh = np.meshgrid(x_coords, y_coords)
-ax.plot_surface(x_mesh, y_mesh, field)
+profiler.stage('save')
 
-ax.set_box_aspect(aspect=(X_BOUNDS[1], Y_BOUNDS[1], 1))
-plt.title('Relaxation Algorithm')
-plt.show()
+save(problem, result, OUT_FILENAME)
 
 # ==============================================================================
-# Save the computed field
+# Plot out the final field using mpl
 # ==============================================================================
 
-np.savez(OUT_FILENAME, x_coords=x_coords, y_coords=y_coords, field=field)
+profiler.stage('plot')
+
+if not HEADLESS:
+    import matplotlib.pyplot as plt
+    from mpl_toolkits.mplot3d import Axes3D
+
+    fig = plt.figure()
+    ax = fig.add_subplot(111, projection='3d')
+    x_mesh, y_mesh = np.meshgrid(x_coords, y_coords)
+    ax.plot_surface(x_mesh, y_mesh, field)
+
+    ax.set_box_aspect(aspect=(X_BOUNDS[1], Y_BOUNDS[1], 1))
+    plt.title('Relaxation Algorithm')
+    plt.show()
+
+profiler.finish()
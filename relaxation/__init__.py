@@ -0,0 +1,34 @@
+from .anytime import LEVEL_GROWTH, anytime_solve
+from .axisymmetric import axisymmetric_operator, radial_weights
+from .batch import BATCH_SOLVERS, BatchKernel
+from .checkpoint import Checkpoint
+from .compact import CompactKernel
+from .composite import CompositeSolver, refinement_indicator
+from .convergence import RelaxationResult, iterate, residual_norm
+from .dielectric import DielectricOperator, face_weights
+from .fast_poisson import (FastPoissonSolver, box_eigenvalues, dst1,
+                           inner_rectangle, solve_box)
+from .geometry import (RASTERIZERS, Disk, Geometry, HalfPlane, Rectangle, Shape,
+                       Wedge, grid_step, nearest_index)
+from .kernel import RelaxationKernel, reflect, relax
+from .krylov import KrylovSolver
+from .mixed import MixedPrecisionSolver
+from .multigrid import MultigridSolver, prolong, restrict
+from .out_of_core import (OutOfCoreKernel, build_tiles, copy_to_file,
+                          tile_rows)
+from .problems import (EPSILON_0, PROBLEMS, Problem, SolveParameters,
+                       init_coords, polarizable_cylinder, save, sine_2_10,
+                       solve, sphere_3_36, square_1_21, wedge_2_11,
+                       wedge_circle_2_26)
+from .profiling import Profiler, peak_memory
+from .series import (legendre_series_v1, legendre_series_v2, sine_series_2_10,
+                     sphere_2_22_3_33, sphere_exterior_3_36,
+                     wedge_series_2_11)
+from .solvers import KERNELS, SOLVERS, close_kernel, make_kernel
+from .sor import (SORKernel, grid_omega, grid_spectral_radius,
+                  optimal_omega)
+from .superposition import ResponseCache
+from .symmetry import SymmetricSolver, detect_symmetry
+from .threaded import ThreadedKernel, throughput
+from .warm_start import (WARM_STARTS, geometry_hash, load_warm_start,
+                         nested_start, problem_hash, warm_start)
@@ -0,0 +1,299 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Anytime Solves
+# Instead of a number of sweeps, the solve is given a wall clock budget in
+# seconds and returns the best field that it found within it. The problem is
+# first solved on the coarsest grid of every other point (recursively, like the
+# `nested` warm start, for as long as the grids still end on the edges of the
+# problem), which also measures how fast the solver is. Each grid
+# with half the step is expected to take LEVEL_GROWTH times as long as the last
+# one. After every grid, the finer grids that are expected to fit in the rest
+# of the budget are picked (the time of the last grid is measured again each
+# time) and the budget is split between them in that proportion. Each grid
+# starts from the last solution interpolated onto it and is swept until its
+# share of the budget is used up (the last grid takes what is left), its
+# residual is below the tolerance, or its algebraic error is below
+# ALGEBRAIC_FRACTION of its discretization error (both estimated as below), at
+# which point more sweeps would not make it any more accurate. The coarsest
+# grid is solved to COARSEST_TOLERANCE instead. When the grid of the problem is
+# not reached, the finest solution is interpolated onto it.
+# The field comes with an a-posteriori estimate of its max error, the sum of:
+#   algebraic: the error left by stopping the sweeps. When the residual (the
+#              largest change of a sweep) shrinks by a factor rho every sweep,
+#              the error is about residual * rho / (1 - rho). Rho is measured
+#              from the last two residual checks and is at most the Jacobi
+#              spectral radius of the grid (which is used when the residual
+#              stopped going down).
+#   discretization: from the difference d between the solution and the one of
+#                   the grid with twice the step, at the points they share.
+#                   For an error of order p, the error of the finer solution is
+#                   about d / (2^p - 1). The ratio of the last two differences
+#                   measures 2^p, which is kept between 2 (first order, as at
+#                   staircased edges) and 4 (second order).
+#   interpolation: only for a solution that is interpolated onto the grid of
+#                  the problem. Interpolating it onto each grid with half the
+#                  step is about a quarter as far off as interpolating the last
+#                  solution onto it was, so about a third of that in all.
+# ==============================================================================
+import time
+
+import numpy as np
+
+from .convergence import RelaxationResult, iterate, residual_norm
+from .multigrid import prolong
+from .solvers import close_kernel, make_kernel
+from .sor import grid_spectral_radius
+from .warm_start import NESTED_COARSEST_SIDE
+
+# How many times longer each grid with half the step takes to solve than the
+# last one: four times the points, times the growth in the number of sweeps
+LEVEL_GROWTH = {
+    'jacobi': 16,
+    'compact': 16,
+    'threaded': 16,
+    'out_of_core': 16,
+    'sor': 8,
+    'mixed': 8,
+    'multigrid': 4,
+    'krylov': 5,
+    'sparse': 5,
+}
+
+# The growth of the solvers that are not in LEVEL_GROWTH
+DEFAULT_LEVEL_GROWTH = 8
+
+# Each grid is swept until its algebraic error is below this fraction of its
+# discretization error, so that the differences between the grids come from
+# their discretization
+ALGEBRAIC_FRACTION = 0.1
+
+# The coarsest grid (which is too small to take any time) is solved until its
+# residual is below this fraction of the largest value of the field
+COARSEST_TOLERANCE = 1e-10
+
+# The finest grid is still solved when only this fraction of its expected time
+# fits in the budget, since it starts from the solution of the last grid and
+# every sweep makes it better
+FINEST_FRACTION = 0.25
+
+
+# The algebraic error of a solve from its residual history (see above)
+def algebraic_error(residual_history, spectral_radius):
+    if len(residual_history) == 0:
+        return np.inf
+    residual = residual_history[-1, 1]
+    rho = spectral_radius
+    if len(residual_history) > 1:
+        (last_iteration, last), (iteration, residual) = residual_history[-2:]
+        if residual <= 0:
+            return residual
+        # Once the residual stops going down (at round-off) the field can no
+        # longer move, so the error is bounded with the Jacobi spectral radius
+        if residual < last:
+            rho = min((residual / last)**(1 / (iteration - last_iteration)),
+                      spectral_radius)
+    return residual * rho / (1 - rho)
+
+
+# The discretization error from the differences between the solutions of
+# successive grids (see above), `nan` without any
+def discretization_error(differences):
+    if len(differences) == 0:
+        return np.nan
+    ratio = 2
+    if len(differences) > 1 and differences[-1] > 0:
+        ratio = min(max(differences[-2] / differences[-1], 2), 4)
+    return differences[-1] / (ratio - 1)
+
+
+class _Grid:
+
+    # The points of every `stride`th row and column of the problem. The grids
+    # are solved in double precision, so that their residuals do not stop at
+    # the round-off of a single precision field. The finest grid works on
+    # `field` itself when it already is, or when it is a memory-mapped file
+    # (which might not fit in memory twice).
+    def __init__(self, field, inner_mask, relaxation_constant, epsilon_field,
+                 stride):
+        self.stride = stride
+        points = slice(None, None, stride)
+        self.field = field
+        if stride > 1 or not (field.dtype == np.float64 or
+                              isinstance(field, np.memmap)):
+            self.field = np.array(field[points, points], dtype='float64')
+        self.inner_mask = np.ascontiguousarray(inner_mask[points, points])
+        # The equations are scaled by the step size squared
+        self.relaxation_constant = relaxation_constant
+        if isinstance(relaxation_constant, np.ndarray):
+            self.relaxation_constant = relaxation_constant[points, points]
+        self.relaxation_constant = self.relaxation_constant * stride**2
+        self.epsilon_field = None
+        if epsilon_field is not None:
+            self.epsilon_field = epsilon_field[points, points]
+
+    # Interpolate the field of the grid with twice the step onto the inner
+    # points, returns the interpolated field
+    def start_from(self, coarse):
+        padded = np.zeros(np.add(coarse.field.shape, 1), dtype='float64')
+        padded[:-1, :-1] = coarse.field
+        fine = np.empty(self.field.shape, dtype='float64')
+        prolong(padded, fine)
+        np.copyto(self.field, fine, casting='same_kind',
+                  where=self.inner_mask)
+        return fine
+
+    # The difference from the solution of the grid with twice the step at the
+    # inner points that they share, in the `norm` of the residual
+    def difference(self, coarse, norm='max'):
+        return residual_norm(self.field[::2, ::2] - coarse.field,
+                             coarse.inner_mask, norm)
+
+
+# Solve the problem (the same arguments as `make_kernel`) within `budget`
+# seconds, `field` is updated in place. Along with those:
+#   tolerance: the residual that the grid of the problem is solved to, `None`
+#              sweeps it until the end of the budget
+#   max_iterations: the max number of sweeps of each grid
+#   check_every / norm / profiler: same as `iterate`
+# Returns a `RelaxationResult` of the grid that was used, whose
+# `error_estimates` hold the `error_estimate` along with its
+# `algebraic_error`, `discretization_error` and `interpolation_error`, and the
+# `solved_stride` (the step of the grid that was used, in steps of the
+# problem).
+def anytime_solve(field, inner_mask, budget, relaxation_constant=0,
+                  epsilon_field=None, solver='sor', solver_options=None,
+                  tolerance=None, max_iterations=5000, check_every=10,
+                  norm='max', profiler=None):
+    deadline = time.perf_counter() + budget
+    solver_options = solver_options or {}
+    # Every stride whose grid is still large enough, from the coarsest. The
+    # grids must end on the last row and column of the problem, so that they
+    # all have the same edges.
+    strides = [1]
+    while True:
+        stride = strides[0] * 2
+        if any((size - 1) % stride for size in inner_mask.shape):
+            break
+        coarse_mask = inner_mask[::stride, ::stride]
+        if min(coarse_mask.shape) < NESTED_COARSEST_SIDE:
+            break
+        if not coarse_mask.any():
+            break
+        strides.insert(0, stride)
+    coarsest_tolerance = COARSEST_TOLERANCE * max(
+        float(np.abs(field).max()), 1e-12)
+
+    # Returns the result of the solve and whether it finished (converged or
+    # became accurate) before it ran out of time or sweeps
+    def solve_grid(grid, coarse, grid_deadline):
+        kernel = make_kernel(solver, grid.field, grid.inner_mask,
+                             grid.relaxation_constant, grid.epsilon_field,
+                             **solver_options)
+        try:
+            if coarse is None and len(strides) > 1:
+                result = iterate(kernel, max_iterations, coarsest_tolerance,
+                                 check_every, norm, profiler=profiler,
+                                 deadline=grid_deadline)
+                return result, result.converged
+            spectral_radius = grid_spectral_radius(grid.inner_mask)
+
+            def accurate(history):
+                if coarse is None:
+                    return False
+                algebraic = algebraic_error(np.array(history), spectral_radius)
+                discretization = discretization_error(
+                    differences + [grid.difference(coarse, norm)])
+                return algebraic <= ALGEBRAIC_FRACTION * discretization
+
+            result = iterate(kernel, max_iterations, tolerance, check_every,
+                             norm, profiler=profiler, deadline=grid_deadline,
+                             stop_when=accurate)
+            return result, (result.converged or
+                            accurate(result.residual_history))
+        finally:
+            close_kernel(kernel)
+
+    growth = LEVEL_GROWTH.get(solver, DEFAULT_LEVEL_GROWTH)
+    grid = None
+    differences = []
+    # Every grid that was solved, along with its result, error estimates and
+    # whether it finished
+    solved = []
+    for level, stride in enumerate(strides):
+        remaining = deadline - time.perf_counter()
+        # The expected time of this grid and the finer ones that fit in the
+        # rest of the budget, from the time of the last grid. The coarsest
+        # grid is always solved.
+        costs = [remaining]
+        if grid is not None:
+            costs = []
+            for finer in range(level, len(strides)):
+                cost = seconds * growth**(finer - level + 1)
+                if sum(costs) + cost > remaining:
+                    if sum(costs) + cost * FINEST_FRACTION <= remaining:
+                        costs.append(remaining - sum(costs))
+                    break
+                costs.append(cost)
+            if not costs:
+                break
+        # The last grid that fits takes the rest of the budget, the ones
+        # before it take their share of it
+        grid_deadline = deadline
+        if len(costs) > 1:
+            grid_deadline = (time.perf_counter() +
+                             remaining * costs[0] / sum(costs))
+        grid_start = time.perf_counter()
+        coarse = grid
+        grid = _Grid(field, inner_mask, relaxation_constant, epsilon_field,
+                     stride)
+        # The interpolated field is only kept on the coarser grids, which are
+        # interpolated onto the grid of the problem when they are used
+        interpolated = None
+        if coarse is not None:
+            interpolated = grid.start_from(coarse)
+            if stride == 1:
+                interpolated = None
+        result, finished = solve_grid(grid, coarse, grid_deadline)
+        seconds = time.perf_counter() - grid_start
+        if coarse is not None:
+            differences.append(grid.difference(coarse, norm))
+        estimates = {
+            'algebraic_error': algebraic_error(
+                result.residual_history,
+                grid_spectral_radius(grid.inner_mask)),
+            'discretization_error': discretization_error(differences),
+            'interpolation_error': 0.0,
+        }
+        # The interpolation error (see above)
+        if interpolated is not None:
+            estimates['interpolation_error'] = residual_norm(
+                interpolated - grid.field, grid.inner_mask, norm) / 3
+        estimates['error_estimate'] = sum(estimates.values())
+        solved.append((grid, result, estimates, finished))
+    # A grid that ran out of time can be worse than the one before it, so the
+    # finest grid that finished and the ones after it are compared by their
+    # estimated error (the finest grid is used when none of them have one)
+    finished = [level for level, solve in enumerate(solved) if solve[3]]
+    if finished:
+        solved = solved[finished[-1]:]
+    grid, result, estimates = min(
+        reversed(solved),
+        key=lambda solve: np.nan_to_num(solve[2]['error_estimate'],
+                                        nan=np.inf))[:3]
+    solved_stride = grid.stride
+    # Interpolate its solution onto the grid of the problem
+    while grid.stride > 1:
+        coarse = grid
+        grid = _Grid(field, inner_mask, relaxation_constant, epsilon_field,
+                     coarse.stride // 2)
+        grid.start_from(coarse)
+    if grid.field is not field:
+        np.copyto(field, grid.field, casting='same_kind', where=inner_mask)
+    # An interpolated field has not converged on the grid of the problem
+    anytime = RelaxationResult(field, result.iterations,
+                               result.residual_history,
+                               result.converged and solved_stride == 1,
+                               tolerance)
+    anytime.error_estimates = dict(estimates, solved_stride=solved_stride)
+    return anytime
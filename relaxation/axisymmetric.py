@@ -0,0 +1,53 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Axisymmetric Problems
+# A 3D problem that does not change with the angle around the z-axis is solved
+# on the (r, z) half plane, the columns of the grid are r and the rows are z.
+# The Laplacian in cylindrical coordinates:
+#   (1 / r) d/dr (r dV/dr) + d^2V/dz^2
+# becomes the same update as a dielectric once every point is weighted by its
+# radius. Each ring of points is a volume of r with the faces r +- h / 2 (the
+# faces between two rings, the average of their radii) and r (the faces above
+# and below the ring), so the update at every point is:
+#   (   V_r+h * (r + h / 2)
+#     + V_r-h * (r - h / 2)
+#     + V_z+h * r
+#     + V_z-h * r
+#     + relaxation_constant * r
+#   ) / (4 r)
+# which is the update of a `DielectricOperator` with an epsilon of r (times the
+# epsilon of the material), so every solver that takes an epsilon field solves
+# the axisymmetric problem. The points on the axis (r = 0) are only joined to
+# the first ring, their update is V = V_r+h. This is the regularity condition
+# dV/dr = 0 on the axis, and the solution stays second order accurate.
+# ==============================================================================
+import numpy as np
+
+
+# The weight of every column of the grid, its radius in steps. Raises a
+# `ValueError` for negative radii.
+def radial_weights(r_coords):
+    r_coords = np.asarray(r_coords, dtype='float64')
+    if len(r_coords) < 2:
+        raise ValueError('Axisymmetric problems need at least two radii')
+    step = np.min(np.diff(r_coords))
+    if r_coords[0] < -step * 1e-9:
+        raise ValueError('Axisymmetric problems can not have negative radii')
+    return np.maximum(r_coords / step, 0)
+
+
+# The epsilon field and relaxation constant that the kernels take to solve the
+# axisymmetric problem on a grid with the radii `r_coords` along its columns.
+# The `epsilon_field` of the material and the relaxation constant are both
+# weighted by the radius.
+def axisymmetric_operator(r_coords, shape, relaxation_constant=0,
+                          epsilon_field=None):
+    weights = np.broadcast_to(radial_weights(r_coords), shape)
+    if epsilon_field is None:
+        epsilon_field = np.array(weights)
+    else:
+        epsilon_field = epsilon_field * weights
+    if np.any(relaxation_constant):
+        relaxation_constant = relaxation_constant * weights
+    return epsilon_field, relaxation_constant
@@ -0,0 +1,244 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Batched Relaxation
+# Relaxes a whole stack of geometries that share the same grid at once, each
+# NumPy operation works on many members of the stack. The residual of every
+# member is checked on its own, and the members that have converged are written
+# out and dropped from the stack so that the rest keep iterating without them.
+# ==============================================================================
+import numpy as np
+
+from .convergence import NORMS, RelaxationResult
+from .dielectric import DielectricOperator
+from .kernel import RelaxationKernel
+from .sor import _Lattice, grid_omega
+
+BATCH_SOLVERS = ('jacobi', 'sor')
+
+# The stack is relaxed in chunks of members that together take about this many
+# bytes (in double precision). Each operation then still fits in the cache,
+# larger chunks end up slower than relaxing the members one at a time.
+CHUNK_BYTES = 1 << 20
+
+
+class _Chunk:
+
+    # The working arrays for the members `members` (indices into the stack),
+    # `values` holds their current fields
+    def __init__(self, members, values, masks, relaxation_constant,
+                 epsilon_fields, solver, omega):
+        self.members = members
+        self.masks = masks
+        self.inner_counts = np.maximum(np.count_nonzero(masks, axis=(-2, -1)),
+                                       1)
+        self.solver = solver
+        self.relaxation_constant = relaxation_constant
+        if solver == 'jacobi':
+            self.values = values
+            self.kernel = RelaxationKernel(values, masks, relaxation_constant,
+                                           epsilon_fields)
+            return
+        rows, cols = values.shape[-2:]
+        self.padded = np.zeros((len(members), rows + 2, cols + 2),
+                               dtype='float64')
+        self.values = self.padded[:, 1:-1, 1:-1]
+        self.values[...] = values
+        weights = None
+        if epsilon_fields is not None:
+            weights = DielectricOperator(epsilon_fields).weights
+        # Red points are the (even, even) and (odd, odd) sub-grids
+        self.lattices = [
+            _Lattice(self.padded, masks, weights, relaxation_constant, row, col)
+            for row, col in ((0, 0), (1, 1), (0, 1), (1, 0))
+        ]
+        if omega is None:
+            omega = [grid_omega(mask) for mask in masks]
+        else:
+            omega = np.full(len(members), float(omega))
+        self.omegas = np.reshape(omega, (-1, 1, 1))
+
+    # Red-black update of one lattice of every member. When `track` is set,
+    # returns the max and sum of squares of the residual of each member.
+    def _relax_lattice(self, lattice, track):
+        summed = lattice.summed
+        if lattice.weights is None:
+            np.add(lattice.top, lattice.bottom, out=summed)
+            np.add(summed, lattice.left, out=summed)
+            np.add(summed, lattice.right, out=summed)
+        else:
+            top_w, bottom_w, left_w, right_w, weight_sum = lattice.weights
+            scratch = lattice.scratch
+            np.multiply(lattice.top, top_w, out=summed)
+            np.multiply(lattice.bottom, bottom_w, out=scratch)
+            np.add(summed, scratch, out=summed)
+            np.multiply(lattice.left, left_w, out=scratch)
+            np.add(summed, scratch, out=summed)
+            np.multiply(lattice.right, right_w, out=scratch)
+            np.add(summed, scratch, out=summed)
+        if lattice.source is not None:
+            np.add(summed, lattice.source, out=summed)
+        elif self.relaxation_constant != 0:
+            np.add(summed, self.relaxation_constant, out=summed)
+        if lattice.weights is None:
+            np.multiply(summed, 0.25, out=summed)
+        else:
+            np.divide(summed, weight_sum, out=summed)
+        np.subtract(summed, lattice.center, out=summed)
+        residual = None
+        if track:
+            np.multiply(summed, lattice.mask, out=lattice.scratch)
+            residual = (
+                np.abs(lattice.scratch).max(axis=(-2, -1), initial=0),
+                np.einsum('...ij,...ij->...', lattice.scratch,
+                          lattice.scratch),
+            )
+        np.multiply(summed, self.omegas, out=summed)
+        np.add(summed, lattice.center, out=summed)
+        np.copyto(lattice.center, summed, where=lattice.mask)
+        return residual
+
+    # When `track` is set, returns the max and sum of squares of the residual
+    # of each member
+    def sweep(self, track):
+        if self.solver == 'sor':
+            residuals = [
+                self._relax_lattice(lattice, track)
+                for lattice in self.lattices
+            ]
+            if not track:
+                return None
+            return (np.max([res[0] for res in residuals], axis=0),
+                    np.sum([res[1] for res in residuals], axis=0))
+        kernel = self.kernel
+        summed = kernel.average(self.values, kernel.summed)
+        residual = None
+        if track:
+            update = np.subtract(summed, self.values)
+            np.abs(update, out=update)
+            np.multiply(update, self.masks, out=update)
+            residual = (update.max(axis=(-2, -1), initial=0),
+                        np.einsum('...ij,...ij->...', update, update))
+        np.copyto(self.values, summed, casting='same_kind', where=self.masks)
+        return residual
+
+
+class BatchKernel:
+
+    # `fields` and `inner_masks` stack the geometries along their first axis and
+    # the fields are updated in place. The relaxation constant can be a single
+    # value, one value per member or an array with the shape of the fields, and
+    # `epsilon_fields` (when given) is stacked like the fields.
+    #   solver: `jacobi` or `sor` (red-black successive over-relaxation)
+    #   omega: for `sor`, `None` picks it from the grid of every member
+    # The fields are written to whenever the residual is checked and at the end
+    # of `run`, `sync` writes them at any other time.
+    def __init__(self, fields, inner_masks, relaxation_constant=0,
+                 epsilon_fields=None, solver='sor', omega=None):
+        if solver not in BATCH_SOLVERS:
+            raise ValueError(f'Unknown solver `{solver}`, must be one of '
+                             f'{BATCH_SOLVERS}')
+        self.fields = fields
+        self.inner_masks = inner_masks
+        self.size = fields.shape[0]
+        if np.ndim(relaxation_constant) == 1:
+            relaxation_constant = np.reshape(relaxation_constant, (-1, 1, 1))
+        if np.ndim(relaxation_constant) > 0:
+            relaxation_constant = np.broadcast_to(
+                relaxation_constant, fields.shape).astype('float64')
+        self.relaxation_constant = relaxation_constant
+        self.epsilon_fields = epsilon_fields
+        self.solver = solver
+        self.omega = omega
+        self.chunk_size = max(CHUNK_BYTES // (8 * fields[0].size), 1)
+        # The members that are still being relaxed
+        self.active = np.arange(self.size)
+        self._build(fields.copy())
+
+    # Split the active members into chunks, `values` holds their current fields
+    def _build(self, values):
+        self.chunks = []
+        for start in range(0, len(self.active), self.chunk_size):
+            members = self.active[start:start + self.chunk_size]
+            constant = self.relaxation_constant
+            if isinstance(constant, np.ndarray):
+                constant = constant[members]
+            epsilon = None
+            if self.epsilon_fields is not None:
+                epsilon = self.epsilon_fields[members]
+            self.chunks.append(
+                _Chunk(members, values[start:start + self.chunk_size],
+                       self.inner_masks[members], constant, epsilon,
+                       self.solver, self.omega))
+
+    # Write the active members back to the fields
+    def sync(self):
+        for chunk in self.chunks:
+            self.fields[chunk.members] = chunk.values
+        return self.fields
+
+    # Returns the norm of the residual of every active member when `norm` is
+    # passed (in the same order as `active`)
+    def sweep(self, norm=None):
+        if norm is not None and norm not in NORMS:
+            raise ValueError(f'Unknown norm `{norm}`, must be one of {NORMS}')
+        track = norm is not None
+        residuals = [chunk.sweep(track) for chunk in self.chunks]
+        if not track:
+            return None
+        self.sync()
+        if len(self.chunks) == 0:
+            return np.zeros(0)
+        if norm == 'max':
+            return np.concatenate([res[0] for res in residuals])
+        squares = np.concatenate([res[1] for res in residuals])
+        inner_counts = np.concatenate(
+            [chunk.inner_counts for chunk in self.chunks])
+        return np.sqrt(squares / inner_counts)
+
+    # Stop relaxing the members that are not in `keep` (a mask over the active
+    # members), the fields should be synced first
+    def _drop(self, keep):
+        values = np.concatenate([chunk.values for chunk in self.chunks])
+        self.active = self.active[keep]
+        self._build(values[keep])
+
+    def run(self, iterations):
+        for i in range(iterations):
+            self.sweep()
+        return self.sync()
+
+    # Same as `convergence.iterate`, but each member stops on its own once its
+    # residual is below `tolerance`. Returns a `RelaxationResult` for every
+    # member.
+    def solve(self, max_iterations, tolerance=None, check_every=10,
+              norm='max'):
+        if norm not in NORMS:
+            raise ValueError(f'Unknown norm `{norm}`, must be one of {NORMS}')
+        check_every = max(int(check_every), 1)
+        histories = [[] for member in range(self.size)]
+        iterations = np.zeros(self.size, dtype='int64')
+        converged = np.zeros(self.size, dtype='bool')
+        for i in range(max_iterations):
+            if len(self.active) == 0:
+                break
+            iteration = i + 1
+            if iteration % check_every != 0 and iteration != max_iterations:
+                self.sweep()
+                continue
+            residuals = self.sweep(norm)
+            for member, residual in zip(self.active, residuals):
+                histories[member].append((iteration, residual))
+            iterations[self.active] = iteration
+            if tolerance is not None:
+                done = residuals <= tolerance
+                converged[self.active[done]] = True
+                if done.any():
+                    self._drop(~done)
+        return [
+            RelaxationResult(self.fields[member], int(iterations[member]),
+                             np.array(histories[member],
+                                      dtype='float64').reshape(-1, 2),
+                             bool(converged[member]), tolerance)
+            for member in range(self.size)
+        ]
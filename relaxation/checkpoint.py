@@ -0,0 +1,117 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Checkpoints
+# Long solves save their state every so often, so that a solve that was stopped
+# part of the way through can pick up where it left off. The state is whatever
+# the kernel needs to continue with the exact same values (such as the double
+# precision working copy of the SOR kernel), along with the iteration count and
+# residual history. Memory-mapped state (such as the field of the out-of-core
+# kernel) is copied a tile of rows at a time into a `.npy` file of its own next
+# to the checkpoint, and is mapped again when resuming, so neither saving nor
+# resuming needs the whole array in memory.
+# ==============================================================================
+import os
+
+import numpy as np
+
+from .out_of_core import copy_to_file
+
+
+class Checkpoint:
+
+    # The state is saved to `filename` once at least `every` iterations have
+    # passed since the last save (on the next residual check, where the field
+    # is up to date) and at the end of the solve. With `resume`, a solve starts
+    # from the state in `filename` when the file exists.
+    def __init__(self, filename, every=1000, resume=False):
+        self.filename = filename
+        self.every = max(int(every), 1)
+        self.resume = resume
+        self.last_saved = 0
+
+    def due(self, iterations):
+        return iterations - self.last_saved >= self.every
+
+    # The file is written next to the checkpoint and then moved over it, so a
+    # job that is stopped while saving still leaves the previous checkpoint.
+    # `stopped` marks a solve that ended on its own (it converged or stalled)
+    # rather than running out of iterations, so it is not continued.
+    def save(self, kernel, iterations, residual_history, converged=False,
+             stopped=False):
+        old_files = self._files()
+        state = {}
+        files = {}
+        for key, val in kernel.state().items():
+            if isinstance(val, np.memmap):
+                files[f'file_{key}'] = self._save_file(key, val, iterations)
+            else:
+                state[f'state_{key}'] = val
+        temp_filename = f'{self.filename}.tmp'
+        with open(temp_filename, 'wb') as temp_file:
+            np.savez(temp_file,
+                     kernel=type(kernel).__name__,
+                     iterations=iterations,
+                     residual_history=np.array(residual_history,
+                                               dtype='float64').reshape(-1, 2),
+                     converged=converged,
+                     stopped=stopped,
+                     **state, **files)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_filename, self.filename)
+        # The files of the previous checkpoint are only removed once the new
+        # one is in place
+        for filename in set(old_files) - set(files.values()):
+            if os.path.exists(filename):
+                os.remove(filename)
+        self.last_saved = iterations
+
+    # Copy the memory-mapped `array` to a `.npy` file next to the checkpoint,
+    # named by the iteration so that it never replaces the file of the
+    # checkpoint that is still in place. Returns the name of the file.
+    def _save_file(self, key, array, iterations):
+        filename = f'{self.filename}.{key}_{iterations}.npy'
+        temp_filename = f'{filename}.tmp'
+        copy_to_file(array, temp_filename)
+        with open(temp_filename, 'rb+') as temp_file:
+            os.fsync(temp_file.fileno())
+        os.replace(temp_filename, filename)
+        return filename
+
+    # The names of the `.npy` files of the checkpoint in `filename`
+    def _files(self):
+        if not os.path.exists(self.filename):
+            return []
+        with np.load(self.filename) as saved:
+            return [str(saved[key]) for key in saved.files
+                    if key.startswith('file_')]
+
+    # Restore the kernel from the checkpoint when resuming. Returns the
+    # iteration count, residual history (as a list of rows), whether it had
+    # converged and whether it had stopped, or `None` when there is nothing to
+    # resume from.
+    def load(self, kernel):
+        if not self.resume or not os.path.exists(self.filename):
+            return None
+        with np.load(self.filename) as saved:
+            if str(saved['kernel']) != type(kernel).__name__:
+                raise ValueError(f'The checkpoint `{self.filename}` was saved '
+                                 f'by `{saved["kernel"]}`, not '
+                                 f'`{type(kernel).__name__}`')
+            state = {
+                key[len('state_'):]: saved[key]
+                for key in saved.files if key.startswith('state_')
+            }
+            # Only mapped, the kernel reads them a tile at a time
+            state.update({
+                key[len('file_'):]: np.load(str(saved[key]), mmap_mode='r')
+                for key in saved.files if key.startswith('file_')
+            })
+            kernel.restore(state)
+            iterations = int(saved['iterations'])
+            history = [tuple(row) for row in saved['residual_history']]
+            converged = bool(saved['converged'])
+            stopped = bool(saved['stopped'])
+        self.last_saved = iterations
+        return iterations, history, converged, stopped
@@ -0,0 +1,131 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Compact Relaxation Kernel
+# The same Jacobi update as the `RelaxationKernel`, but only the points inside
+# of the boundary are stored. They are kept in a flat array along with the
+# boundary points next to them, and each point has the index of its four
+# neighbors in that array. Both the memory and the work of a sweep scale with
+# the number of inner points instead of the size of the whole grid.
+# ==============================================================================
+import numpy as np
+
+from .convergence import NORMS, iterate
+from .dielectric import DielectricOperator
+
+# (row, col) offsets of the top, bottom, left and right neighbors
+_OFFSETS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+
+class CompactKernel:
+
+    # Same arguments as the `RelaxationKernel`. The boundary values are copied
+    # out of `field` when the kernel is built. The field is written to whenever
+    # the residual is checked and at the end of `run`, `sync` writes it at any
+    # other time.
+    def __init__(self, field, inner_mask, relaxation_constant=0,
+                 epsilon_field=None):
+        self.field = field
+        self.inner_mask = inner_mask
+        self.shape = inner_mask.shape
+        self.rows, self.cols = np.nonzero(inner_mask)
+        self.size = len(self.rows)
+        # The values start with the inner points, followed by the boundary
+        # points that neighbor them and a single zero for outside of the grid
+        index = np.full(self.shape, -1, dtype=np.intp)
+        index[self.rows, self.cols] = np.arange(self.size)
+        positions = [self._neighbor(offset) for offset in _OFFSETS]
+        boundary = np.zeros(self.shape, dtype='bool')
+        for rows, cols, inside in positions:
+            boundary[rows[inside], cols[inside]] = True
+        boundary &= ~inner_mask
+        boundary_rows, boundary_cols = np.nonzero(boundary)
+        boundary_count = len(boundary_rows)
+        index[boundary_rows, boundary_cols] = (self.size +
+                                               np.arange(boundary_count))
+        self.values = np.zeros(self.size + boundary_count + 1,
+                               dtype='float64')
+        self.values[:self.size] = field[self.rows, self.cols]
+        self.values[self.size:-1] = field[boundary_rows, boundary_cols]
+        outside = len(self.values) - 1
+        self.neighbors = [
+            np.where(inside, index[rows, cols], outside)
+            for rows, cols, inside in positions
+        ]
+        self.weights = None
+        if epsilon_field is not None:
+            operator = DielectricOperator(epsilon_field)
+            self.weights = [w[self.rows, self.cols] for w in operator.weights]
+        if isinstance(relaxation_constant, np.ndarray):
+            relaxation_constant = relaxation_constant[self.rows, self.cols]
+        self.relaxation_constant = relaxation_constant
+        self.add_constant = bool(np.any(relaxation_constant))
+        self.summed = np.empty(self.size, dtype='float64')
+        self.scratch = np.empty(self.size, dtype='float64')
+
+    # The grid position of the neighbor in the direction of `offset` for every
+    # inner point, along with a mask of the ones that are inside of the grid
+    def _neighbor(self, offset):
+        rows = self.rows + offset[0]
+        cols = self.cols + offset[1]
+        inside = ((rows >= 0) & (rows < self.shape[0]) & (cols >= 0) &
+                  (cols < self.shape[1]))
+        return np.where(inside, rows, 0), np.where(inside, cols, 0), inside
+
+    # Write the inner points back to the field
+    def sync(self):
+        self.field[self.rows, self.cols] = self.values[:self.size]
+        return self.field
+
+    def sweep(self, norm=None):
+        if norm is not None and norm not in NORMS:
+            raise ValueError(f'Unknown norm `{norm}`, must be one of {NORMS}')
+        summed = self.summed
+        scratch = self.scratch
+        # Same order of operations as the full grid kernels
+        np.take(self.values, self.neighbors[0], out=summed)
+        if self.weights is None:
+            for neighbor in self.neighbors[1:]:
+                np.take(self.values, neighbor, out=scratch)
+                np.add(summed, scratch, out=summed)
+        else:
+            np.multiply(summed, self.weights[0], out=summed)
+            for neighbor, weight in zip(self.neighbors[1:], self.weights[1:4]):
+                np.take(self.values, neighbor, out=scratch)
+                np.multiply(scratch, weight, out=scratch)
+                np.add(summed, scratch, out=summed)
+        if self.add_constant:
+            np.add(summed, self.relaxation_constant, out=summed)
+        if self.weights is None:
+            np.multiply(summed, 0.25, out=summed)
+        else:
+            np.divide(summed, self.weights[4], out=summed)
+        inner = self.values[:self.size]
+        if norm is None:
+            inner[...] = summed
+            return None
+        np.subtract(summed, inner, out=scratch)
+        inner[...] = summed
+        self.sync()
+        np.abs(scratch, out=scratch)
+        if norm == 'max':
+            return float(scratch.max(initial=0))
+        return float(np.sqrt(np.vdot(scratch, scratch) / max(self.size, 1)))
+
+    def run(self, iterations):
+        for i in range(iterations):
+            self.sweep()
+        return self.sync()
+
+    # The values are stored in double precision, which the field may not be
+    def state(self):
+        return {'values': self.values[:self.size]}
+
+    def restore(self, state):
+        self.values[:self.size] = state['values']
+        self.sync()
+
+    def solve(self, max_iterations, tolerance=None, check_every=10,
+              norm='max', checkpoint=None, profiler=None):
+        return iterate(self, max_iterations, tolerance, check_every, norm,
+                       checkpoint=checkpoint, profiler=profiler)
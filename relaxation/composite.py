@@ -0,0 +1,531 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Composite Grids
+# Most of the error of a relaxation solve comes from small regions, such as the
+# staircased edge of a conductor or a jump in epsilon. Instead of making the
+# whole grid finer, patches with half the step size are placed over the points
+# with the largest truncation error, and the patches can be refined again. Each
+# patch takes its edges from the overlapping patches of the same level (or by
+# interpolating its parent), and each parent holds the points that its patches
+# cover at their values. Solving the levels in turn until the field stops
+# changing gives the composite solution.
+# ==============================================================================
+import numpy as np
+
+from .convergence import RelaxationResult
+from .kernel import RelaxationKernel
+from .solvers import close_kernel, make_kernel
+
+# Inner points are refined where the estimated truncation error (see
+# `refinement_indicator`) is larger than this fraction of the largest potential
+REFINE_THRESHOLD = 1e-3
+
+# Boxes of flagged points are split (see `flag_boxes`) until at least this
+# fraction of their points are flagged
+BOX_EFFICIENCY = 0.7
+
+# Boxes are not split into boxes with fewer than this many points on a side
+MIN_BOX_SIZE = 8
+
+# Each patch reaches this many (parent) points past its flagged points. The
+# parent only takes the values of the patch this far inside of its edges, so
+# that the levels overlap and pass the solution between them.
+PATCH_MARGIN = 4
+
+# Patches of the same level that are next to each other overlap by this many
+# points on each side, so that each one takes its edges from well inside of
+# the other
+PATCH_OVERLAP = 3
+
+# The max number of times that every level is solved in turn
+MAX_CYCLES = 200
+
+# While the levels still change a lot between cycles, there is no use in
+# solving the patches much further than that. Each cycle solves them until
+# their residual is this fraction of the change in the last cycle.
+CYCLE_REDUCTION = 0.3
+
+# Without a tolerance, the patches are solved until their max residual is below
+# this fraction of the largest potential
+DEFAULT_TOLERANCE = 1e-6
+
+
+# An estimate of the truncation error of a solved field: the change that a
+# Jacobi sweep on the grid with every other point (twice the step size) would
+# make to it. Where the field is smooth, it also solves the coarser equations
+# up to a small error, but not near corners, staircased walls and jumps in
+# epsilon, where the two step sizes see different geometries. The estimate is
+# placed on the points shared with the coarser grid and is zero elsewhere.
+def refinement_indicator(field, inner_mask, relaxation_constant=0,
+                         epsilon_field=None):
+    coarse = np.array(field[::2, ::2], dtype='float64')
+    coarse_mask = np.array(inner_mask[::2, ::2])
+    # With an even number of points the last row (or column) is not on the
+    # coarser grid, which would take it as zero potential
+    if inner_mask.shape[0] % 2 == 0:
+        coarse_mask[-1] = False
+    if inner_mask.shape[1] % 2 == 0:
+        coarse_mask[:, -1] = False
+    coarse_epsilon = None
+    if epsilon_field is not None:
+        coarse_epsilon = epsilon_field[::2, ::2]
+    # The equations are scaled by the step size squared
+    kernel = RelaxationKernel(coarse, coarse_mask, relaxation_constant * 4,
+                              coarse_epsilon)
+    summed = kernel.average(coarse, np.empty(coarse.shape, dtype='float64'))
+    indicator = np.zeros(inner_mask.shape, dtype='float64')
+    indicator[::2, ::2] = np.where(coarse_mask, np.abs(summed - coarse), 0)
+    return indicator
+
+
+# Where to split a box with the `signature` (the number of flagged points in
+# each of its rows or columns), so that both sides have at least `min_size`
+# rows. Returns `(rank, index)` where the rank is 0 for a row without any flags
+# (the one closest to the middle), 1 for the largest jump in the second
+# difference of the signature and 2 for the middle, or `None` when the box is
+# too small to split.
+def _split(signature, min_size):
+    size = len(signature)
+    if size < 2 * min_size:
+        return None
+    allowed = np.arange(min_size, size - min_size + 1)
+    holes = allowed[signature[allowed] == 0]
+    if len(holes) > 0:
+        return 0, int(holes[np.argmin(np.abs(holes - size / 2))])
+    # The second difference at `i` belongs to row `i + 1`, an edge of the flags
+    # is where it changes sign
+    laplacian = np.diff(signature.astype('float64'), 2)
+    jumps = np.abs(np.diff(laplacian))
+    crossings = (laplacian[:-1] * laplacian[1:] < 0)
+    # Splitting between rows `i + 1` and `i + 2` is index `i + 2`
+    index = np.arange(len(jumps)) + 2
+    usable = crossings & (index >= min_size) & (index <= size - min_size)
+    if usable.any():
+        return 1, int(index[usable][np.argmax(jumps[usable])])
+    return 2, size // 2
+
+
+# Grow the flagged points by `margin` points in every direction
+def _dilate(flags, margin):
+    grown = np.array(flags)
+    for axis in range(2):
+        spread = grown.copy()
+        for shift in range(1, margin + 1):
+            if shift >= grown.shape[axis]:
+                break
+            lead = [slice(None)] * 2
+            trail = [slice(None)] * 2
+            lead[axis], trail[axis] = slice(shift, None), slice(None, -shift)
+            spread[tuple(lead)] |= grown[tuple(trail)]
+            spread[tuple(trail)] |= grown[tuple(lead)]
+        grown = spread
+    return grown
+
+
+def _area(box):
+    return (box[1] - box[0] + 1) * (box[3] - box[2] + 1)
+
+
+# Group the flagged points into boxes of `(row_start, row_stop, col_start,
+# col_stop)` (inclusive) on the grid of `flags`. The flags are grown by
+# `margin` and then clustered like Berger and Rigoutsos: the bounding box of
+# the flags is split (at a row or column without flags, else at an edge of the
+# flags, else in the middle) until at least `efficiency` of its points are
+# flagged or it is too small to split. The boxes are then grown by `overlap`,
+# so that every patch holds the edges of the patches next to it, and boxes that
+# overlap or touch are merged whenever their bounding box has no more points
+# than the two of them.
+def flag_boxes(flags, min_size=MIN_BOX_SIZE, margin=PATCH_MARGIN,
+               overlap=PATCH_OVERLAP, efficiency=BOX_EFFICIENCY):
+    rows, cols = flags.shape
+    grown = _dilate(flags, margin)
+    clusters = []
+    pending = [(0, rows - 1, 0, cols - 1)]
+    while pending:
+        row_start, row_stop, col_start, col_stop = pending.pop()
+        region = grown[row_start:row_stop + 1, col_start:col_stop + 1]
+        flagged_rows = np.flatnonzero(region.any(axis=1))
+        if len(flagged_rows) == 0:
+            continue
+        flagged_cols = np.flatnonzero(region.any(axis=0))
+        # Shrink the box to its flags
+        row_start, row_stop = (row_start + flagged_rows[0],
+                               row_start + flagged_rows[-1])
+        col_start, col_stop = (col_start + flagged_cols[0],
+                               col_start + flagged_cols[-1])
+        region = grown[row_start:row_stop + 1, col_start:col_stop + 1]
+        box = (row_start, row_stop, col_start, col_stop)
+        if region.mean() >= efficiency:
+            clusters.append(box)
+            continue
+        splits = [(split, axis) for axis, split in enumerate(
+            (_split(region.sum(axis=1), min_size),
+             _split(region.sum(axis=0), min_size))) if split is not None]
+        if not splits:
+            clusters.append(box)
+            continue
+        # The best rank, then the longer side
+        (rank, index), axis = min(
+            splits, key=lambda split: (split[0][0], -region.shape[split[1]]))
+        if axis == 0:
+            pending.append((row_start, row_start + index - 1, col_start,
+                            col_stop))
+            pending.append((row_start + index, row_stop, col_start, col_stop))
+        else:
+            pending.append((row_start, row_stop, col_start,
+                            col_start + index - 1))
+            pending.append((row_start, row_stop, col_start + index, col_stop))
+    boxes = [(max(row_start - overlap, 0), min(row_stop + overlap, rows - 1),
+              max(col_start - overlap, 0), min(col_stop + overlap, cols - 1))
+             for row_start, row_stop, col_start, col_stop in clusters]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                first, second = boxes[i], boxes[j]
+                if (first[0] > second[1] + 1 or second[0] > first[1] + 1 or
+                        first[2] > second[3] + 1 or second[2] > first[3] + 1):
+                    continue
+                joined = (min(first[0], second[0]), max(first[1], second[1]),
+                          min(first[2], second[2]), max(first[3], second[3]))
+                if _area(joined) <= _area(first) + _area(second):
+                    boxes[i] = joined
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [box for box in boxes
+            if box[1] - box[0] >= 2 and box[3] - box[2] >= 2]
+
+
+# Bilinear interpolation of `coarse` onto a grid with half the step size
+def _interpolate(coarse):
+    rows, cols = coarse.shape
+    fine = np.empty((2 * rows - 1, 2 * cols - 1), dtype='float64')
+    fine[::2, ::2] = coarse
+    fine[1::2, ::2] = (coarse[:-1] + coarse[1:]) / 2
+    fine[:, 1::2] = (fine[:, :-2:2] + fine[:, 2::2]) / 2
+    return fine
+
+
+class _Patch:
+
+    # `row`/`col` is the index of the first point on the full grid of `level`
+    # and `box` the (inclusive) rows and columns of the parent that it covers
+    def __init__(self, level, parent, row, col, field, inner_mask,
+                 epsilon_field, relaxation_constant, box=None):
+        self.level = level
+        self.parent = parent
+        self.row = row
+        self.col = col
+        self.box = box
+        self.field = np.array(field, dtype='float64')
+        self.inner_mask = inner_mask
+        self.epsilon_field = epsilon_field
+        self.relaxation_constant = relaxation_constant
+        # Edge points that take their values from the other patches
+        self.edge = np.zeros(inner_mask.shape, dtype=bool)
+        # Points that take their values from the finer patches
+        self.covered = np.zeros(inner_mask.shape, dtype=bool)
+        self.x_coords = None
+        self.y_coords = None
+        # Filled in once the patches of the level are known (see `_link`)
+        self.edge_points = None
+        self.from_parent = None
+        self.siblings = []
+        self.injections = []
+
+    @property
+    def shape(self):
+        return self.field.shape
+
+    # Whether the point on the full grid of the level is strictly inside
+    def contains(self, rows, cols):
+        return ((rows > self.row) & (rows < self.row + self.shape[0] - 1) &
+                (cols > self.col) & (cols < self.col + self.shape[1] - 1))
+
+    def solve_mask(self):
+        return self.inner_mask & ~self.edge & ~self.covered
+
+
+class CompositeSolver:
+
+    # Arguments:
+    #   build: called with the X and Y coordinates of a uniform grid over any
+    #          part of the domain, returns the `(field, inner_mask,
+    #          epsilon_field)` of that grid (the epsilon field can be `None`).
+    #          It is called for the base grid and for every patch on its own
+    #          coordinates, so the finer levels are never built in full.
+    #   x_coords / y_coords: the coordinates of the base grid
+    #   relaxation_constant: the (scalar) relaxation constant of the base
+    #                        grid, it is scaled by the step size squared on
+    #                        every finer level
+    #   levels: the max number of levels of refinement on top of the base grid
+    #   threshold: see `REFINE_THRESHOLD`
+    #   solver / solver_options: the kernel used to solve each patch
+    def __init__(self, build, x_coords, y_coords, relaxation_constant=0,
+                 levels=1, threshold=REFINE_THRESHOLD, solver='sor',
+                 solver_options=None):
+        self.build = build
+        self.max_levels = levels
+        self.threshold = threshold
+        self.solver = solver
+        self.solver_options = solver_options or {}
+        self.relaxation_constant = relaxation_constant
+        field, inner_mask, epsilon_field = build(x_coords, y_coords)
+        root = _Patch(0, None, 0, 0, field, inner_mask, epsilon_field,
+                      relaxation_constant)
+        root.x_coords = np.asarray(x_coords, dtype='float64')
+        root.y_coords = np.asarray(y_coords, dtype='float64')
+        self.levels = [[root]]
+        # The largest potential, for the default tolerance and the threshold
+        self.scale = max(float(np.abs(root.field).max()), 1e-12)
+        self.sweeps = 0
+        self.profiler = None
+
+    @property
+    def root(self):
+        return self.levels[0][0]
+
+    # The number of points stored over all of the patches, and the number a
+    # uniform grid with the step size of the finest level would need
+    @property
+    def cells(self):
+        return sum(patch.field.size for level in self.levels for patch in level)
+
+    @property
+    def uniform_cells(self):
+        return self._uniform_cells(len(self.levels) - 1)
+
+    def _level_coords(self, level):
+        scale = 2**level
+        root = self.root
+        return (np.linspace(root.x_coords[0], root.x_coords[-1],
+                            (len(root.x_coords) - 1) * scale + 1),
+                np.linspace(root.y_coords[0], root.y_coords[-1],
+                            (len(root.y_coords) - 1) * scale + 1))
+
+    # The number of points of a uniform grid with the step size of `level`
+    def _uniform_cells(self, level):
+        scale = 2**level
+        rows, cols = self.root.shape
+        return ((rows - 1) * scale + 1) * ((cols - 1) * scale + 1)
+
+    # Add patches over the flagged points of the finest level, returns `False`
+    # when nothing was flagged or when the composite grid would hold as many
+    # points as a uniform grid with the step size of the new level
+    def _refine(self, tolerance):
+        level = len(self.levels)
+        boxes = []
+        for parent in self.levels[-1]:
+            indicator = refinement_indicator(
+                parent.field, parent.inner_mask & ~parent.edge,
+                parent.relaxation_constant, parent.epsilon_field)
+            # The indicator can not be trusted below the tolerance that the
+            # patches were solved to
+            flags = indicator > max(self.threshold * self.scale, tolerance)
+            boxes.extend((parent, box) for box in flag_boxes(flags))
+        if not boxes:
+            return False
+        cells = sum((2 * (row_stop - row_start) + 1) *
+                    (2 * (col_stop - col_start) + 1)
+                    for parent, (row_start, row_stop, col_start,
+                                 col_stop) in boxes)
+        if self.cells + cells >= self._uniform_cells(level):
+            return False
+        x_coords, y_coords = self._level_coords(level)
+        grid_shape = (len(y_coords), len(x_coords))
+        patches = []
+        for parent, (row_start, row_stop, col_start, col_stop) in boxes:
+            row = 2 * (parent.row + row_start)
+            col = 2 * (parent.col + col_start)
+            rows = slice(row, 2 * (parent.row + row_stop) + 1)
+            cols = slice(col, 2 * (parent.col + col_stop) + 1)
+            field, inner_mask, epsilon_field = self.build(x_coords[cols],
+                                                          y_coords[rows])
+            patch = _Patch(level, parent, row, col, field, inner_mask,
+                           epsilon_field, self.relaxation_constant / 4**level,
+                           (row_start, row_stop, col_start, col_stop))
+            patch.x_coords = x_coords[cols]
+            patch.y_coords = y_coords[rows]
+            # Edges on the outside of the whole grid are solved as usual
+            edge = patch.edge
+            edge[0, :] = row > 0
+            edge[-1, :] = rows.stop < grid_shape[0]
+            edge[:, 0] |= col > 0
+            edge[:, -1] |= cols.stop < grid_shape[1]
+            edge &= patch.inner_mask
+            patches.append(patch)
+        self.levels.append(patches)
+        self._link(level)
+        return True
+
+    # Work out which points each patch of `level` takes from the others
+    def _link(self, level):
+        patches = self.levels[level]
+        for patch in patches:
+            rows, cols = np.nonzero(patch.edge)
+            patch.edge_points = (rows, cols)
+            patch.siblings = []
+            taken = np.zeros(len(rows), dtype=bool)
+            for sibling in patches:
+                if sibling is patch:
+                    continue
+                inside = sibling.contains(rows + patch.row, cols + patch.col)
+                inside &= ~taken
+                if inside.any():
+                    taken |= inside
+                    patch.siblings.append(
+                        (sibling, inside, rows[inside] + patch.row -
+                         sibling.row, cols[inside] + patch.col - sibling.col))
+            patch.from_parent = ~taken
+        # The coarser level holds the points that are far enough inside of the
+        # finer patches
+        for coarse in self.levels[level - 1]:
+            coarse.injections = []
+            for patch in patches:
+                row_start = -(-patch.row // 2) - coarse.row + PATCH_MARGIN
+                col_start = -(-patch.col // 2) - coarse.col + PATCH_MARGIN
+                row_stop = ((patch.row + patch.shape[0] - 1) // 2 -
+                            coarse.row - PATCH_MARGIN)
+                col_stop = ((patch.col + patch.shape[1] - 1) // 2 -
+                            coarse.col - PATCH_MARGIN)
+                row_start, col_start = max(row_start, 0), max(col_start, 0)
+                row_stop = min(row_stop, coarse.shape[0] - 1)
+                col_stop = min(col_stop, coarse.shape[1] - 1)
+                if row_stop < row_start or col_stop < col_start:
+                    continue
+                coarse_rows = slice(row_start, row_stop + 1)
+                coarse_cols = slice(col_start, col_stop + 1)
+                fine_rows = slice(2 * (coarse.row + row_start) - patch.row,
+                                  2 * (coarse.row + row_stop) - patch.row + 1,
+                                  2)
+                fine_cols = slice(2 * (coarse.col + col_start) - patch.col,
+                                  2 * (coarse.col + col_stop) - patch.col + 1,
+                                  2)
+                coarse.covered[coarse_rows, coarse_cols] = True
+                coarse.injections.append(
+                    (patch, coarse_rows, coarse_cols, fine_rows, fine_cols))
+
+    # Fill the edges of the patch from its siblings and parent
+    def _take_edges(self, patch):
+        rows, cols = patch.edge_points
+        if patch.from_parent.any():
+            row_start, row_stop, col_start, col_stop = patch.box
+            interpolated = _interpolate(
+                patch.parent.field[row_start:row_stop + 1,
+                                   col_start:col_stop + 1])
+            from_parent = patch.from_parent
+            patch.field[rows[from_parent], cols[from_parent]] = interpolated[
+                rows[from_parent], cols[from_parent]]
+        for sibling, inside, sibling_rows, sibling_cols in patch.siblings:
+            patch.field[rows[inside], cols[inside]] = sibling.field[
+                sibling_rows, sibling_cols]
+
+    def _inject(self, coarse):
+        for injection in coarse.injections:
+            patch, coarse_rows, coarse_cols, fine_rows, fine_cols = injection
+            coarse.field[coarse_rows, coarse_cols] = patch.field[fine_rows,
+                                                                 fine_cols]
+
+    def _solve_patch(self, patch, max_iterations, tolerance, check_every,
+                     norm):
+        kernel = make_kernel(self.solver, patch.field, patch.solve_mask(),
+                             patch.relaxation_constant, patch.epsilon_field,
+                             **self.solver_options)
+        try:
+            result = kernel.solve(max_iterations, tolerance, check_every, norm,
+                                  profiler=self.profiler)
+        finally:
+            close_kernel(kernel)
+        self.sweeps += result.iterations
+
+    # Solve every level in turn, returns the largest change to any patch
+    def _cycle(self, max_iterations, tolerance, check_every, norm):
+        change = 0
+        for level in self.levels:
+            for patch in level:
+                if patch.parent is not None:
+                    self._take_edges(patch)
+                before = patch.field.copy()
+                self._solve_patch(patch, max_iterations, tolerance,
+                                  check_every, norm)
+                change = max(change, float(np.abs(patch.field - before).max()))
+        for level in reversed(self.levels[:-1]):
+            for coarse in level:
+                self._inject(coarse)
+        return change
+
+    # `max_iterations`, `tolerance`, `check_every` and `norm` are passed on to
+    # the solve of every patch. The levels are added one at a time, and after
+    # each one every level is solved in turn until no patch changes by more
+    # than the tolerance. The residual history has the largest change of every
+    # cycle, and the field of the result is the composite solution on the base
+    # grid. An enabled `Profiler` records every solve of a patch.
+    def solve(self, max_iterations, tolerance=None, check_every=10,
+              norm='max', profiler=None):
+        self.profiler = profiler
+        if tolerance is None:
+            tolerance = DEFAULT_TOLERANCE * self.scale
+        history = []
+        converged = True
+        self._solve_patch(self.root, max_iterations, tolerance, check_every,
+                          norm)
+        # The threshold is relative to the solution, the starting values of the
+        # inner points can be far off
+        self.scale = max(float(np.abs(self.root.field).max()), 1e-12)
+        while (len(self.levels) <= self.max_levels and
+               self._refine(tolerance)):
+            patch_tolerance = tolerance
+            for _ in range(MAX_CYCLES):
+                change = self._cycle(max_iterations, patch_tolerance,
+                                     check_every, norm)
+                history.append((self.sweeps, change))
+                if change <= tolerance and patch_tolerance <= tolerance:
+                    break
+                patch_tolerance = max(CYCLE_REDUCTION * change, tolerance)
+            else:
+                converged = False
+        field = self.sample(self.root.x_coords, self.root.y_coords)
+        return RelaxationResult(field, self.sweeps,
+                                np.array(history,
+                                         dtype='float64').reshape(-1, 2),
+                                converged, tolerance)
+
+    # The composite solution on a uniform grid with the given coordinates,
+    # every point is interpolated from the finest patch that holds it
+    def sample(self, x_coords, y_coords):
+        x_mesh, y_mesh = np.meshgrid(np.asarray(x_coords, dtype='float64'),
+                                     np.asarray(y_coords, dtype='float64'))
+        out = np.zeros(x_mesh.shape, dtype='float64')
+        for level in self.levels:
+            for patch in level:
+                xs, ys = patch.x_coords, patch.y_coords
+                step_x = (xs[-1] - xs[0]) / (len(xs) - 1)
+                step_y = (ys[-1] - ys[0]) / (len(ys) - 1)
+                # Allow for round-off in the coordinates
+                slack_x, slack_y = step_x * 1e-6, step_y * 1e-6
+                inside = ((x_mesh >= xs[0] - slack_x) &
+                          (x_mesh <= xs[-1] + slack_x) &
+                          (y_mesh >= ys[0] - slack_y) &
+                          (y_mesh <= ys[-1] + slack_y))
+                if not inside.any():
+                    continue
+                col = (x_mesh[inside] - xs[0]) / step_x
+                row = (y_mesh[inside] - ys[0]) / step_y
+                col_idx = np.clip(np.floor(col + 1e-6), 0, len(xs) - 2)
+                row_idx = np.clip(np.floor(row + 1e-6), 0, len(ys) - 2)
+                col_frac = np.clip(col - col_idx, 0, 1)
+                row_frac = np.clip(row - row_idx, 0, 1)
+                col_idx = col_idx.astype(int)
+                row_idx = row_idx.astype(int)
+                field = patch.field
+                out[inside] = (
+                    field[row_idx, col_idx] * (1 - row_frac) * (1 - col_frac) +
+                    field[row_idx, col_idx + 1] * (1 - row_frac) * col_frac +
+                    field[row_idx + 1, col_idx] * row_frac * (1 - col_frac) +
+                    field[row_idx + 1, col_idx + 1] * row_frac * col_frac)
+        return out
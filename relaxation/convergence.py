@@ -0,0 +1,149 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Convergence Checks
+# Instead of always doing a fixed number of iterations, the residual is checked
+# every few sweeps and the iterations stop once it falls below a tolerance.
+# ==============================================================================
+import time
+
+import numpy as np
+
+# Norms that the residual can be measured with
+NORMS = ('max', 'l2')
+
+
+# For the Jacobi update the residual of the discretized equation (divided by
+# the diagonal) is exactly the update that a sweep makes, so the same number
+# measures both the residual and how much the field is still changing.
+# `update` is overwritten. The `l2` norm is divided by the number of inner
+# points so that the tolerance does not depend on the grid size.
+def residual_norm(update, inner_mask, norm='max'):
+    np.abs(update, out=update)
+    np.multiply(update, inner_mask, out=update)
+    if norm == 'max':
+        return float(update.max())
+    if norm == 'l2':
+        inner_count = max(int(np.count_nonzero(inner_mask)), 1)
+        return float(np.sqrt(np.vdot(update, update) / inner_count))
+    raise ValueError(f'Unknown norm `{norm}`, must be one of {NORMS}')
+
+
+class RelaxationResult:
+
+    # `limiting_precision` is set by solvers that can tell when the residual
+    # stopped going down because of round-off (`float32` or `float64`)
+    def __init__(self, field, iterations, residual_history, converged,
+                 tolerance, limiting_precision=None):
+        self.field = field
+        self.iterations = iterations
+        # Each row contains (iteration, residual)
+        self.residual_history = residual_history
+        self.converged = converged
+        self.tolerance = tolerance
+        self.limiting_precision = limiting_precision
+        # Set by the anytime solve (see `anytime.py`), a dict of the estimated
+        # error of the field along with where it came from
+        self.error_estimates = None
+
+    @property
+    def residual(self):
+        if len(self.residual_history) == 0:
+            return np.inf
+        return self.residual_history[-1, 1]
+
+    # The values that should be saved alongside the field so that it is known
+    # how converged the field actually is
+    def certificate(self):
+        certificate = {
+            'iterations': self.iterations,
+            'residual_history': self.residual_history,
+            'converged': self.converged,
+            'tolerance': np.nan if self.tolerance is None else self.tolerance,
+        }
+        if self.limiting_precision is not None:
+            certificate['limiting_precision'] = self.limiting_precision
+        if self.error_estimates is not None:
+            certificate.update(self.error_estimates)
+        return certificate
+
+
+# Sweep the kernel until the residual is below the tolerance or the max number
+# of iterations is reached. The residual is only computed every `check_every`
+# sweeps (and on the last sweep) since it takes extra passes over the grid.
+# When `tolerance` is `None` all of the iterations are done, but the residual
+# history is still recorded. With `stop_on_stall`, the iterations also stop once
+# a check no longer lowers the residual (it has reached round-off). With a
+# `Checkpoint`, the state of the kernel is saved every so often and the solve
+# can resume from the last save with the same results as an uninterrupted run.
+# An enabled `Profiler` records the time of every sweep and the solve. With a
+# `deadline` (a `time.perf_counter()` value), the sweep that is expected to be
+# the last one to finish before the deadline checks the residual and the
+# iterations stop there (the solve is not marked as stopped, so a checkpoint
+# still continues it). `stop_when` is called with the residual history (a list
+# of `(iteration, residual)`) after every check, the iterations stop once it
+# returns `True`.
+def iterate(kernel, max_iterations, tolerance=None, check_every=10,
+            norm='max', stop_on_stall=False, checkpoint=None, profiler=None,
+            deadline=None, stop_when=None):
+    if norm not in NORMS:
+        raise ValueError(f'Unknown norm `{norm}`, must be one of {NORMS}')
+    check_every = max(int(check_every), 1)
+    history = []
+    converged = False
+    iterations = 0
+    stopped = False
+    if checkpoint is not None:
+        resumed = checkpoint.load(kernel)
+        if resumed is not None:
+            iterations, history, converged, stopped = resumed
+            # A solve that converged or stalled is not continued
+            if stopped:
+                max_iterations = iterations
+    if profiler is not None and not profiler.enabled:
+        profiler = None
+    if profiler is not None:
+        profiler.start_solve(kernel, iterations)
+    first_iteration = iterations
+    solve_start = time.perf_counter()
+    for i in range(iterations, max_iterations):
+        iterations = i + 1
+        last = False
+        if deadline is not None:
+            # Another sweep after this one would run past the deadline
+            now = time.perf_counter()
+            sweeps = iterations - 1 - first_iteration
+            last = now >= deadline or (
+                sweeps > 0 and
+                now + 2 * (now - solve_start) / sweeps > deadline)
+        if (iterations % check_every != 0 and iterations != max_iterations and
+                not last):
+            kernel.sweep()
+            if profiler is not None:
+                profiler.sweep(iterations)
+            continue
+        residual = kernel.sweep(norm)
+        if profiler is not None:
+            profiler.sweep(iterations, residual)
+        history.append((iterations, residual))
+        if tolerance is not None and residual <= tolerance:
+            converged = stopped = True
+            break
+        if stop_on_stall and len(history) > 1 and residual >= history[-2][1]:
+            stopped = True
+            break
+        if stop_when is not None and stop_when(history):
+            stopped = True
+            break
+        if last:
+            break
+        if checkpoint is not None and checkpoint.due(iterations):
+            checkpoint.save(kernel, iterations, history)
+    if checkpoint is not None:
+        checkpoint.save(kernel, iterations, history, converged, stopped)
+    residual_history = np.array(history, dtype='float64').reshape(-1, 2)
+    result = RelaxationResult(kernel.field, iterations, residual_history,
+                              converged, tolerance)
+    if profiler is not None:
+        profiler.end_solve(result)
+    return result
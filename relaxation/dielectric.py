@@ -0,0 +1,76 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Dielectric Operator
+# With a variable epsilon, every neighbor is weighted by the epsilon at the
+# half step between the two points. The epsilon field never changes while
+# iterating, so the weights and their sum are computed a single time.
+# ==============================================================================
+import numpy as np
+
+
+# The weight of each of the four faces around every point, these are the
+# epsilon values averaged at the half steps. Points past the edge of the grid
+# have an epsilon of zero. Returns (top, bottom, left, right, sum of weights).
+def face_weights(epsilon_field, dtype='float64'):
+    shape = epsilon_field.shape
+    eps = np.zeros(shape[:-2] + (shape[-2] + 2, shape[-1] + 2), dtype=dtype)
+    eps[..., 1:-1, 1:-1] = epsilon_field
+    center = eps[..., 1:-1, 1:-1]
+    top = (center + eps[..., :-2, 1:-1]) / 2
+    bottom = (center + eps[..., 2:, 1:-1]) / 2
+    left = (center + eps[..., 1:-1, :-2]) / 2
+    right = (center + eps[..., 1:-1, 2:]) / 2
+    return top, bottom, left, right, top + bottom + left + right
+
+
+class DielectricOperator:
+
+    # The weights are kept in `dtype`, which is also the precision that the
+    # weighted average is computed in
+    def __init__(self, epsilon_field, dtype='float64'):
+        self.dtype = np.dtype(dtype)
+        self._set_weights(face_weights(epsilon_field, self.dtype))
+
+    # An operator with the `weights` of `face_weights` that were already
+    # computed, such as the rows of a tile that are kept in files
+    @classmethod
+    def of(cls, weights):
+        operator = cls.__new__(cls)
+        operator.dtype = weights[0].dtype
+        operator._set_weights(weights)
+        return operator
+
+    def _set_weights(self, weights):
+        self.weights = tuple(weights)
+        self.top, self.bottom, self.left, self.right, self.normalizer = (
+            self.weights)
+
+    # Write the weighted average of the neighbors of `field` to `out`:
+    # (   V_i+1,j * eps_i+0.5,j
+    #   + V_i-1,j * eps_i-0.5,j
+    #   + V_i,j+1 * eps_i,j+0.5
+    #   + V_i,j-1 * eps_i,j-0.5
+    #   + relaxation_constant
+    # ) / (   eps_i+0.5,j
+    #       + eps_i-0.5,j
+    #       + eps_i,j+0.5
+    #       + eps_i,j-0.5 )
+    # Points outside of the grid are zero potential. `scratch` must have the
+    # same shape as `out`, both are only written to.
+    def average(self, field, out, scratch, relaxation_constant=0):
+        # Any leading axes hold a stack of fields that are averaged together
+        out[..., 0, :] = 0
+        np.multiply(field[..., :-1, :], self.top[..., 1:, :],
+                    out=out[..., 1:, :])
+        np.multiply(field[..., 1:, :], self.bottom[..., :-1, :],
+                    out=scratch[..., :-1, :])
+        np.add(out[..., :-1, :], scratch[..., :-1, :], out=out[..., :-1, :])
+        np.multiply(field[..., :-1], self.left[..., 1:], out=scratch[..., 1:])
+        np.add(out[..., 1:], scratch[..., 1:], out=out[..., 1:])
+        np.multiply(field[..., 1:], self.right[..., :-1], out=scratch[..., :-1])
+        np.add(out[..., :-1], scratch[..., :-1], out=out[..., :-1])
+        if np.any(relaxation_constant):
+            np.add(out, relaxation_constant, out=out)
+        np.divide(out, self.normalizer, out=out)
+        return out
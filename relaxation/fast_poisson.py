@@ -0,0 +1,137 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Fast Poisson Solver
+# When the inner points fill a rectangle (and there is no dielectric), the
+# discrete sine transform diagonalizes the relaxation update. Every mode
+#   sin(pi k (i + 1) / (m + 1)) sin(pi l (j + 1) / (n + 1))
+# of an m by n rectangle is an eigenvector of 4 V - (the sum of the neighbors)
+# with the eigenvalue:
+#   4 - 2 cos(pi k / (m + 1)) - 2 cos(pi l / (n + 1))
+# So the field that the relaxation sweeps converge to is found directly with a
+# transform of the right hand side, a division by the eigenvalues and the
+# inverse transform, in O(N log N). The transforms are built from the real FFT
+# of `numpy`, so `scipy` is not needed.
+# ==============================================================================
+import numpy as np
+
+from .convergence import iterate, residual_norm
+from .kernel import RelaxationKernel
+
+
+# The type I discrete sine transform along `axis`:
+#   X_k = sum_j x_j sin(pi (j + 1) (k + 1) / (n + 1))
+# It is its own inverse up to a factor of 2 / (n + 1). It is taken from the FFT
+# of the odd extension [0, x, 0, -reversed(x)], whose imaginary part is -2 X.
+def dst1(values, axis=-1):
+    values = np.moveaxis(np.asarray(values, dtype='float64'), axis, -1)
+    size = values.shape[-1]
+    extended = np.zeros(values.shape[:-1] + (2 * (size + 1),))
+    extended[..., 1:size + 1] = values
+    extended[..., size + 2:] = -values[..., ::-1]
+    transformed = np.fft.rfft(extended)[..., 1:size + 1].imag * -0.5
+    return np.moveaxis(transformed, -1, axis)
+
+
+# The (row, col) slices of the inner points when they fill a rectangle,
+# otherwise `None`
+def inner_rectangle(inner_mask):
+    rows = np.flatnonzero(inner_mask.any(axis=1))
+    cols = np.flatnonzero(inner_mask.any(axis=0))
+    if len(rows) == 0:
+        return None
+    region = (slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1))
+    if not inner_mask[region].all():
+        return None
+    return region
+
+
+# The eigenvalues of 4 V - (the sum of the neighbors) for the sine modes of a
+# box of `shape`
+def box_eigenvalues(shape):
+    modes = [np.pi * np.arange(1, size + 1) / (size + 1) for size in shape]
+    return (4 - 2 * np.cos(modes[0])[:, None] -
+            2 * np.cos(modes[1])[None, :])
+
+
+# Solves 4 V - (the sum of the neighbors) = rhs on a box with zero potential
+# all around it, `eigenvalues` are the `box_eigenvalues` of its shape
+def solve_box(rhs, eigenvalues):
+    scale = 4 / ((rhs.shape[0] + 1) * (rhs.shape[1] + 1))
+    transformed = dst1(dst1(rhs, 0), 1) / eigenvalues
+    return dst1(dst1(transformed, 0), 1) * scale
+
+
+class FastPoissonSolver:
+
+    # Same arguments as the `RelaxationKernel`. Raises a `ValueError` when the
+    # inner points do not fill a rectangle or there is an epsilon field, since
+    # the sine modes are then no longer eigenvectors of the update.
+    def __init__(self, field, inner_mask, relaxation_constant=0,
+                 epsilon_field=None):
+        if epsilon_field is not None:
+            raise ValueError('The `fast` solver does not support an epsilon '
+                             'field, use another solver')
+        self.region = inner_rectangle(inner_mask)
+        if self.region is None:
+            raise ValueError('The `fast` solver needs the inner points to '
+                             'fill a rectangle, use another solver')
+        self.field = field
+        self.inner_mask = inner_mask
+        self.relaxation_constant = relaxation_constant
+        rows, cols = self.region
+        self.shape = (rows.stop - rows.start, cols.stop - cols.start)
+        self.eigenvalues = box_eigenvalues(self.shape)
+        # Only used to measure the residual
+        self.kernel = RelaxationKernel(field, inner_mask, relaxation_constant)
+        self.update = None
+
+    # The right hand side of 4 V - (the sum of the neighbors) = constant, with
+    # the neighbors that are boundary points moved over to it (the points
+    # outside of the grid are zero potential)
+    def _rhs(self):
+        rows, cols = self.region
+        rhs = np.zeros(self.shape)
+        constant = self.relaxation_constant
+        if isinstance(constant, np.ndarray):
+            constant = constant[self.region]
+        rhs += constant
+        if rows.start > 0:
+            rhs[0] += self.field[rows.start - 1, cols]
+        if rows.stop < self.field.shape[0]:
+            rhs[-1] += self.field[rows.stop, cols]
+        if cols.start > 0:
+            rhs[:, 0] += self.field[rows, cols.start - 1]
+        if cols.stop < self.field.shape[1]:
+            rhs[:, -1] += self.field[rows, cols.stop]
+        return rhs
+
+    # Every sweep is the whole solve, so it gives the exact solution of the
+    # discrete problem. With a `norm`, the residual that is left (the update
+    # that a Jacobi sweep would still make, only round-off) is returned.
+    def sweep(self, norm=None):
+        solution = solve_box(self._rhs(), self.eigenvalues)
+        np.copyto(self.field[self.region], solution, casting='same_kind')
+        if norm is not None:
+            summed = self.kernel.average(self.field, self.kernel.summed)
+            if self.update is None:
+                self.update = np.empty(self.field.shape, dtype='float64')
+            np.subtract(summed, self.field, out=self.update)
+            return residual_norm(self.update, self.inner_mask, norm)
+
+    def run(self, iterations):
+        if iterations > 0:
+            self.sweep()
+        return self.field
+
+    def state(self):
+        return {'field': self.field}
+
+    def restore(self, state):
+        self.field[...] = state['field']
+
+    # One sweep solves the field, so at most one iteration is done
+    def solve(self, max_iterations, tolerance=None, check_every=10,
+              norm='max', checkpoint=None, profiler=None):
+        return iterate(self, min(max_iterations, 1), tolerance, check_every,
+                       norm, checkpoint=checkpoint, profiler=profiler)
@@ -0,0 +1,127 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Shared Relaxation Kernel
+# Performs the Jacobi relaxation update in place. Every sweep only works on
+# slice views of the field and a single preallocated buffer, so no full-grid
+# arrays are allocated while iterating.
+# ==============================================================================
+import numpy as np
+
+from .convergence import iterate, residual_norm
+from .dielectric import DielectricOperator
+
+
+class RelaxationKernel:
+
+    # `field` is updated in place and `inner_mask` marks the points that are
+    # relaxed (every other point is a fixed boundary). The relaxation constant
+    # is added to the sum of the four neighbors before it is divided by four:
+    #   (V_i+1,j + V_i-1,j + V_i,j+1 + V_i,j-1 + relaxation_constant) / 4
+    # The relaxation constant can also be an array with the shape of the field.
+    # When an `epsilon_field` is given, the neighbors are instead weighted by
+    # the epsilon values at the half steps (see `DielectricOperator`).
+    # With a `mirror` of `(row, col)`, the last row of the field is set to a
+    # copy of `row` before every sweep (and the last column to a copy of `col`,
+    # either can be `None`), which is how `SymmetricSolver` keeps its ghost
+    # rows. The ghost rows should not be in the inner mask.
+    def __init__(self, field, inner_mask, relaxation_constant=0,
+                 epsilon_field=None, mirror=None):
+        self.field = field
+        self.mirror = mirror
+        self.inner_mask = inner_mask
+        self.relaxation_constant = relaxation_constant
+        self.add_constant = bool(np.any(relaxation_constant))
+        # The sum of the neighbors is done in double precision, this matches
+        # the old `np.concatenate` approach which upcasted to float64
+        self.summed = np.empty(field.shape, dtype='float64')
+        self.operator = None
+        if epsilon_field is not None:
+            self.operator = DielectricOperator(epsilon_field)
+            self.scratch = np.empty(field.shape, dtype='float64')
+        # Only allocated once the residual is first checked
+        self.update = None
+
+    # When a `norm` is passed, the norm of the update over the inner points is
+    # returned (see `convergence.residual_norm`)
+    def sweep(self, norm=None):
+        field = self.field
+        summed = self.summed
+        if self.mirror is not None:
+            reflect(field, self.mirror)
+        self.average(field, summed)
+        if norm is not None:
+            if self.update is None:
+                self.update = np.empty(field.shape, dtype='float64')
+            np.subtract(summed, field, out=self.update)
+        # Only the points inside of the boundary are written back
+        np.copyto(field, summed, casting='same_kind', where=self.inner_mask)
+        if norm is not None:
+            return residual_norm(self.update, self.inner_mask, norm)
+
+    # The average of the four neighbors of `field` (weighted by epsilon when
+    # there is an epsilon field) written to `summed`
+    def average(self, field, summed):
+        if self.operator is not None:
+            return self.operator.average(field, summed, self.scratch,
+                                         self.relaxation_constant)
+        return average_neighbors(
+            field, summed,
+            self.relaxation_constant if self.add_constant else None)
+
+    def run(self, iterations):
+        for i in range(iterations):
+            self.sweep()
+        return self.field
+
+    # The arrays needed to continue from this point (see `Checkpoint`)
+    def state(self):
+        return {'field': self.field}
+
+    def restore(self, state):
+        self.field[...] = state['field']
+
+    # Iterate until the residual is below `tolerance`, returns a
+    # `RelaxationResult` with the iteration count and residual history
+    def solve(self, max_iterations, tolerance=None, check_every=10,
+              norm='max', checkpoint=None, profiler=None):
+        return iterate(self, max_iterations, tolerance, check_every, norm,
+                       checkpoint=checkpoint, profiler=profiler)
+
+
+# The average of the four neighbors of `field` written to `summed`, along with
+# a quarter of the relaxation constant unless it is `None`. Points outside of
+# the grid act as zero potential, so the edges simply do not receive a
+# contribution from that direction. Any leading axes hold a stack of fields
+# that are averaged together.
+def average_neighbors(field, summed, relaxation_constant=None):
+    # V_i-1,j (the `top` neighbor)
+    summed[..., 0, :] = 0
+    summed[..., 1:, :] = field[..., :-1, :]
+    # V_i+1,j (the `bottom` neighbor)
+    np.add(summed[..., :-1, :], field[..., 1:, :], out=summed[..., :-1, :])
+    # V_i,j-1 (the `left` neighbor)
+    np.add(summed[..., 1:], field[..., :-1], out=summed[..., 1:])
+    # V_i,j+1 (the `right` neighbor)
+    np.add(summed[..., :-1], field[..., 1:], out=summed[..., :-1])
+    if relaxation_constant is not None:
+        np.add(summed, relaxation_constant, out=summed)
+    np.multiply(summed, 0.25, out=summed)
+    return summed
+
+
+# Copy the mirrored rows of `field` (see `RelaxationKernel`) to its ghost rows
+def reflect(field, mirror):
+    row, col = mirror
+    if row is not None:
+        field[-1] = field[row]
+    if col is not None:
+        field[:, -1] = field[:, col]
+
+
+# Relax the field in place for a fixed number of iterations
+def relax(field, inner_mask, iterations, relaxation_constant=0,
+          epsilon_field=None):
+    kernel = RelaxationKernel(field, inner_mask, relaxation_constant,
+                              epsilon_field)
+    return kernel.run(iterations)
@@ -0,0 +1,158 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Krylov Solver
+# Conjugate gradient on the linear system that the relaxation converges to, one
+# row for every inner point:
+#   sum(weight) * V - sum(weight * V_neighbor) = relaxation_constant
+# The system is never stored, the operator is applied with the same weighted
+# average as the kernels on full-grid arrays that are zero outside of the inner
+# points. The preconditioner is the fictitious domain one: the residual is
+# extended by zero to the whole grid, the Laplacian of the whole grid is solved
+# with the sine transform of `fast_poisson.py` and the result is restricted
+# back to the inner points. The whole grid is one box, so this works for any
+# shape of the inner points, and it takes care of the long wavelengths that
+# make plain relaxation slow.
+# ==============================================================================
+import numpy as np
+
+from .convergence import iterate, residual_norm
+from .fast_poisson import box_eigenvalues, solve_box
+from .kernel import RelaxationKernel
+
+PRECONDITIONERS = (None, 'jacobi', 'fft')
+
+
+# The smallest size of at least `size` whose sine transform is fast, which is
+# when size + 1 has no prime factors above 5. The box of the preconditioner can
+# be any box that holds the grid, so it is grown to these sizes.
+def fast_size(size):
+    while True:
+        remaining = size + 1
+        for factor in (2, 3, 5):
+            while remaining % factor == 0:
+                remaining //= factor
+        if remaining == 1:
+            return size
+        size += 1
+
+
+class KrylovSolver:
+
+    # Same arguments as the `RelaxationKernel`, along with:
+    #   preconditioner: `fft` (the sine transform of the whole grid), `jacobi`
+    #                   (divides by the diagonal) or `None`
+    def __init__(self, field, inner_mask, relaxation_constant=0,
+                 epsilon_field=None, preconditioner='fft'):
+        if preconditioner not in PRECONDITIONERS:
+            raise ValueError(f'Unknown preconditioner `{preconditioner}`, '
+                             f'must be one of {PRECONDITIONERS}')
+        self.field = field
+        self.inner_mask = inner_mask
+        self.preconditioner = preconditioner
+        # Applies the weighted average of the neighbors without the constant
+        self.kernel = RelaxationKernel(field, inner_mask, 0, epsilon_field)
+        # The sum of the weights of every point, the diagonal of the system
+        self.diagonal = 4.0
+        if self.kernel.operator is not None:
+            self.diagonal = self.kernel.operator.normalizer
+        # What the constant adds to the average, the Jacobi update is
+        # average + offset - V
+        self.offset = relaxation_constant / self.diagonal
+        self.mask = inner_mask.astype('float64')
+        if preconditioner == 'fft':
+            self.box = np.zeros([fast_size(size) for size in field.shape])
+            self.eigenvalues = box_eigenvalues(self.box.shape)
+            # With an epsilon field, the box is solved between a scaling by
+            # the square root of 4 / sum(weight) on both sides, so that the
+            # preconditioner stays symmetric and matches the size of epsilon
+            self.scaling = self.mask * np.sqrt(4 / self.diagonal)
+        self.product = np.empty(field.shape, dtype='float64')
+        self.update = np.empty(field.shape, dtype='float64')
+        # The conjugate gradient state, set up on the first sweep so that it
+        # starts from the field after any warm start
+        self.solution = None
+        self.residual = None
+        self.direction = None
+        self.rz = None
+
+    # sum(weight) * p - sum(weight * p_neighbor) over the inner points
+    def _apply(self, direction, out):
+        self.kernel.average(direction, out)
+        np.subtract(direction, out, out=out)
+        np.multiply(out, self.diagonal, out=out)
+        np.multiply(out, self.mask, out=out)
+        return out
+
+    def _precondition(self, residual):
+        if self.preconditioner == 'fft':
+            rows, cols = self.field.shape
+            np.multiply(residual, self.scaling, out=self.box[:rows, :cols])
+            solution = solve_box(self.box, self.eigenvalues)
+            return solution[:rows, :cols] * self.scaling
+        if self.preconditioner == 'jacobi':
+            return residual / self.diagonal
+        return residual.copy()
+
+    def _start(self):
+        self.solution = self.field.astype('float64')
+        self.kernel.average(self.solution, self.product)
+        np.add(self.product, self.offset, out=self.product)
+        np.subtract(self.product, self.solution, out=self.product)
+        self.residual = self.product * self.diagonal * self.mask
+        self.direction = self._precondition(self.residual)
+        self.rz = float(np.vdot(self.residual, self.direction))
+
+    # Each sweep is one conjugate gradient iteration. With a `norm`, the
+    # residual is the update that a Jacobi sweep would make to the stored
+    # field, the same as the other kernels.
+    def sweep(self, norm=None):
+        if self.residual is None:
+            self._start()
+        # Once the residual is exactly zero there is nothing left to do
+        if self.rz > 0:
+            product = self._apply(self.direction, self.product)
+            alpha = self.rz / float(np.vdot(self.direction, product))
+            self.solution += alpha * self.direction
+            self.residual -= alpha * product
+            preconditioned = self._precondition(self.residual)
+            rz = float(np.vdot(self.residual, preconditioned))
+            preconditioned += (rz / self.rz) * self.direction
+            self.direction = preconditioned
+            self.rz = rz
+            np.copyto(self.field, self.solution, casting='same_kind',
+                      where=self.inner_mask)
+        if norm is not None:
+            update = self.kernel.average(self.field, self.update)
+            np.add(update, self.offset, out=update)
+            np.subtract(update, self.field, out=update)
+            return residual_norm(update, self.inner_mask, norm)
+
+    def run(self, iterations):
+        for i in range(iterations):
+            self.sweep()
+        return self.field
+
+    # The arrays needed to continue from this point (see `Checkpoint`)
+    def state(self):
+        if self.residual is None:
+            self._start()
+        return {
+            'solution': self.solution,
+            'residual': self.residual,
+            'direction': self.direction,
+            'rz': self.rz,
+        }
+
+    def restore(self, state):
+        self.solution = np.array(state['solution'], dtype='float64')
+        self.residual = np.array(state['residual'], dtype='float64')
+        self.direction = np.array(state['direction'], dtype='float64')
+        self.rz = float(state['rz'])
+        np.copyto(self.field, self.solution, casting='same_kind',
+                  where=self.inner_mask)
+
+    def solve(self, max_iterations, tolerance=None, check_every=10,
+              norm='max', checkpoint=None, profiler=None):
+        return iterate(self, max_iterations, tolerance, check_every, norm,
+                       checkpoint=checkpoint, profiler=profiler)
@@ -0,0 +1,209 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Mixed Precision Relaxation
+# Sweeps in single precision move half the memory of double precision sweeps,
+# but their residual cannot get much below 1e-7 of the field. The solution is
+# kept in double precision and only its residual is computed in double
+# precision. The single precision sweeps then solve for a correction to the
+# solution, which is added on in double precision (iterative refinement). Each
+# correction lowers the residual by about as much as single precision allows,
+# so a few of them reach double precision accuracy.
+# ==============================================================================
+import warnings
+
+import numpy as np
+
+from .convergence import NORMS, RelaxationResult, residual_norm
+from .sor import SORKernel
+
+# Each correction is solved until its residual is this fraction of the residual
+# that it corrects
+INNER_REDUCTION = 1e-4
+
+# A correction has stalled once this many residual checks in a row did not
+# lower its residual
+INNER_STALL_CHECKS = 3
+
+# The max number of sweeps for a single correction when calling `sweep`
+MAX_INNER_SWEEPS = 10000
+
+# The residual has reached the double precision round-off once a correction
+# lowers it by less than this factor
+OUTER_STALL_FACTOR = 0.5
+
+
+class MixedPrecisionSolver:
+
+    # Same arguments as the `SORKernel` with the addition of:
+    #   inner_reduction: how far each correction is solved (see
+    #                    `INNER_REDUCTION`)
+    # The field should be `float64` to keep the extra precision. With a
+    # residual of:
+    #   r = relaxation_constant + sum(weight * V_neighbor) - sum(weight) * V
+    # the correction E solves the same equation with r as the relaxation
+    # constant, and V + E is the next solution.
+    def __init__(self, field, inner_mask, relaxation_constant=0,
+                 epsilon_field=None, omega=None,
+                 inner_reduction=INNER_REDUCTION, mirror=None):
+        if field.dtype.itemsize < 8:
+            warnings.warn(f'The solution is rounded to the `{field.dtype}` '
+                          f'field, pass a `float64` field to keep the double '
+                          f'precision', stacklevel=2)
+        self.field = field
+        self.inner_mask = inner_mask
+        self.inner_reduction = inner_reduction
+        # Holds the double precision solution, it is only used for the residual
+        # and never sweeps
+        self.outer = SORKernel(field, inner_mask, relaxation_constant,
+                               epsilon_field, omega=1.0, mirror=mirror)
+        self.solution = self.outer.padded[1:-1, 1:-1]
+        self.residual = np.empty(inner_mask.shape, dtype='float64')
+        self.scaled = np.empty(inner_mask.shape, dtype='float64')
+        # The relaxation constant of the correction is a view in the lattices,
+        # so it is filled in place for every correction
+        self.source = np.zeros(inner_mask.shape, dtype='float32')
+        self.correction = np.zeros(inner_mask.shape, dtype='float32')
+        self.inner = SORKernel(self.correction, inner_mask, self.source,
+                               epsilon_field, omega, dtype='float32',
+                               mirror=mirror)
+
+    # The residual of the solution divided by the diagonal, the unscaled
+    # residual is kept for the next correction
+    def _residual_norm(self, norm):
+        self.outer.residual(self.residual)
+        np.divide(self.residual, self.outer.diagonal(), out=self.scaled)
+        return residual_norm(self.scaled, self.inner_mask, norm)
+
+    # Solve for the correction in single precision (starting from zero) until
+    # its residual is below `target`, then add it to the solution. Returns the
+    # number of sweeps and whether the correction stalled before the target
+    # (it reached the single precision round-off).
+    def _correct(self, target, max_sweeps, check_every, norm):
+        self.source[...] = self.residual
+        self.inner.padded.fill(0)
+        sweeps = 0
+        best = np.inf
+        stalled_checks = 0
+        while sweeps < max_sweeps:
+            count = min(check_every, max_sweeps - sweeps)
+            self.inner.smooth(count - 1)
+            residual = self.inner.sweep(norm)
+            sweeps += count
+            if residual <= target:
+                break
+            if residual < best:
+                best = residual
+                stalled_checks = 0
+            else:
+                stalled_checks += 1
+            if stalled_checks >= INNER_STALL_CHECKS:
+                break
+        np.add(self.solution, self.inner.padded[1:-1, 1:-1],
+               out=self.solution)
+        np.copyto(self.field, self.solution, casting='same_kind',
+                  where=self.inner_mask)
+        return sweeps, stalled_checks >= INNER_STALL_CHECKS
+
+    # One correction, returns the norm of the new residual when `norm` is
+    # passed
+    def sweep(self, norm=None):
+        residual = self._residual_norm(norm or 'max')
+        self._correct(self.inner_reduction * residual, MAX_INNER_SWEEPS, 10,
+                      norm or 'max')
+        if norm is not None:
+            return self._residual_norm(norm)
+
+    def run(self, iterations):
+        self.solve(iterations)
+        return self.field
+
+    # The double precision solution and the omega estimate of the corrections
+    # (the corrections themselves start from zero)
+    def state(self):
+        inner = self.inner.state()
+        return {
+            'padded': self.outer.padded,
+            'omega': inner['omega'],
+            'estimating': inner['estimating'],
+            'residuals': inner['residuals'],
+        }
+
+    def restore(self, state):
+        self.outer.padded[...] = state['padded']
+        np.copyto(self.field, self.solution, casting='same_kind',
+                  where=self.inner_mask)
+        self.inner.omega = float(state['omega'])
+        self.inner.estimating = bool(state['estimating'])
+        self.inner.residuals = [float(val) for val in state['residuals']]
+
+    # `max_iterations` limits the total single precision sweeps. The residual
+    # history has the residual of the solution after every correction. Without
+    # a tolerance the corrections stop once the residual reaches the double
+    # precision round-off. The result also reports the precision that limited
+    # the field once the residual stopped going down: `float32` when the last
+    # correction stalled at the single precision round-off before its target,
+    # otherwise `float64`, or the dtype of the field when it is stored in less
+    # than double precision (`None` when the iterations or tolerance stopped it
+    # first).
+    # With a `Checkpoint`, the state is saved after the corrections. An enabled
+    # `Profiler` records the time of every correction.
+    def solve(self, max_iterations, tolerance=None, check_every=10,
+              norm='max', checkpoint=None, profiler=None):
+        if norm not in NORMS:
+            raise ValueError(f'Unknown norm `{norm}`, must be one of {NORMS}')
+        check_every = max(int(check_every), 1)
+        residual = self._residual_norm(norm)
+        history = [(0, residual)]
+        sweeps = 0
+        converged = False
+        stopped = False
+        limiting_precision = None
+        if checkpoint is not None:
+            resumed = checkpoint.load(self)
+            if resumed is not None:
+                sweeps, history, converged, stopped = resumed
+                # Also keeps the unscaled residual for the next correction
+                residual = self._residual_norm(norm)
+                if stopped and not converged:
+                    limiting_precision = 'float64'
+        if profiler is not None and not profiler.enabled:
+            profiler = None
+        if profiler is not None:
+            profiler.start_solve(self, sweeps)
+        while not stopped:
+            if tolerance is not None and residual <= tolerance:
+                converged = stopped = True
+                break
+            if sweeps >= max_iterations:
+                break
+            used, inner_stalled = self._correct(
+                self.inner_reduction * residual, max_iterations - sweeps,
+                check_every, norm)
+            sweeps += used
+            new_residual = self._residual_norm(norm)
+            if profiler is not None:
+                profiler.sweep(sweeps, new_residual)
+            history.append((sweeps, new_residual))
+            stalled = new_residual > OUTER_STALL_FACTOR * residual
+            residual = new_residual
+            if stalled:
+                # The single precision corrections can no longer lower the
+                # residual when they stall, otherwise the residual itself is at
+                # the double precision round-off
+                limiting_precision = 'float32' if inner_stalled else 'float64'
+                stopped = True
+                break
+            if checkpoint is not None and checkpoint.due(sweeps):
+                checkpoint.save(self, sweeps, history)
+        if checkpoint is not None:
+            checkpoint.save(self, sweeps, history, converged, stopped)
+        if limiting_precision is not None and self.field.dtype.itemsize < 8:
+            limiting_precision = str(self.field.dtype)
+        result = RelaxationResult(self.field, sweeps,
+                                  np.array(history,
+                                           dtype='float64').reshape(-1, 2),
+                                  converged, tolerance, limiting_precision)
+        if profiler is not None:
+            profiler.end_solve(result)
+        return result
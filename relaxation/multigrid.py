@@ -0,0 +1,253 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Geometric Multigrid
+# Relaxation quickly smooths out the error, but the smooth error that is left
+# takes many sweeps to remove. Multigrid moves the smooth error onto a coarser
+# grid (where it is no longer smooth) and corrects it there. Each grid level has
+# every other point of the level above it, and the inner mask and epsilon field
+# are coarsened the same way, so irregular domains are handled as well.
+# ==============================================================================
+import numpy as np
+
+from .convergence import iterate, residual_norm
+from .sor import SORKernel, grid_omega
+
+# Levels stop being added once a side of the grid would be smaller than this
+COARSEST_SIDE = 5
+
+# Red-black Gauss-Seidel sweeps before and after the coarse grid correction
+PRE_SWEEPS = 2
+POST_SWEEPS = 2
+
+CYCLES = ('v', 'fmg')
+
+
+# Full weighting restriction. `fine_padded` has a ring of zeros around the fine
+# grid and each coarse point is the weighted average of the 3x3 block of fine
+# points around it.
+def restrict(fine_padded, out):
+    rows, cols = out.shape
+
+    def _shifted(row, col):
+        return fine_padded[1 + row:2 * rows + row:2, 1 + col:2 * cols + col:2]
+
+    np.add(_shifted(-1, 0), _shifted(1, 0), out=out)
+    np.add(out, _shifted(0, -1), out=out)
+    np.add(out, _shifted(0, 1), out=out)
+    np.add(out, _shifted(0, 0), out=out)
+    np.add(out, _shifted(0, 0), out=out)
+    np.multiply(out, 2, out=out)
+    for row, col in ((-1, -1), (-1, 1), (1, -1), (1, 1)):
+        np.add(out, _shifted(row, col), out=out)
+    np.multiply(out, 1 / 16, out=out)
+    return out
+
+
+# Bilinear interpolation onto the fine grid. `coarse_padded` needs an extra row
+# and column of zeros after the coarse grid (the points past the edge).
+def prolong(coarse_padded, out):
+    rows, cols = out.shape
+    even_rows, odd_rows = (rows + 1) // 2, rows // 2
+    even_cols, odd_cols = (cols + 1) // 2, cols // 2
+    coarse = coarse_padded
+    out[0::2, 0::2] = coarse[:even_rows, :even_cols]
+    # Points between two coarse points in the same column
+    between_rows = out[1::2, 0::2]
+    np.add(coarse[:odd_rows, :even_cols],
+           coarse[1:odd_rows + 1, :even_cols],
+           out=between_rows)
+    np.multiply(between_rows, 0.5, out=between_rows)
+    # Points between two coarse points in the same row
+    between_cols = out[0::2, 1::2]
+    np.add(coarse[:even_rows, :odd_cols],
+           coarse[:even_rows, 1:odd_cols + 1],
+           out=between_cols)
+    np.multiply(between_cols, 0.5, out=between_cols)
+    # Points in the middle of four coarse points
+    middle = out[1::2, 1::2]
+    np.add(coarse[:odd_rows, :odd_cols],
+           coarse[1:odd_rows + 1, :odd_cols],
+           out=middle)
+    np.add(middle, coarse[:odd_rows, 1:odd_cols + 1], out=middle)
+    np.add(middle, coarse[1:odd_rows + 1, 1:odd_cols + 1], out=middle)
+    np.multiply(middle, 0.25, out=middle)
+    return out
+
+
+class _Level:
+
+    def __init__(self, field, inner_mask, relaxation_constant, epsilon_field):
+        self.inner_mask = inner_mask
+        # The right hand side of the equation being solved on this level
+        self.source = np.empty(inner_mask.shape, dtype='float64')
+        self.source[...] = relaxation_constant
+        self.kernel = SORKernel(field, inner_mask, self.source, epsilon_field,
+                                omega=1.0)
+        # The residual is kept inside of a ring of zeros for the restriction
+        self.residual_padded = np.zeros(np.add(inner_mask.shape, 2))
+        self.residual = self.residual_padded[1:-1, 1:-1]
+        self.correction_padded = np.zeros(np.add(inner_mask.shape, 2))
+        self.correction = self.correction_padded[1:-1, 1:-1]
+        self.stencil = np.empty(inner_mask.shape, dtype='float64')
+
+    @property
+    def values(self):
+        return self.kernel.padded[1:-1, 1:-1]
+
+
+class MultigridSolver:
+
+    # Same arguments as the `SORKernel` with the addition of:
+    #   cycle: `v` does V-cycles, `fmg` (full multigrid) starts by solving on
+    #          the coarsest grid and interpolates up before doing V-cycles
+    #   pre_sweeps / post_sweeps: smoothing sweeps on each level
+    #   step_length: scale the coarse grid corrections (see `_step_length`)
+    # Every call to `sweep` does one cycle.
+    def __init__(self, field, inner_mask, relaxation_constant=0,
+                 epsilon_field=None, cycle='v', pre_sweeps=PRE_SWEEPS,
+                 post_sweeps=POST_SWEEPS, step_length=True):
+        if cycle not in CYCLES:
+            raise ValueError(f'Unknown cycle `{cycle}`, must be one of '
+                             f'{CYCLES}')
+        self.field = field
+        self.inner_mask = inner_mask
+        self.cycle = cycle
+        self.pre_sweeps = pre_sweeps
+        self.post_sweeps = post_sweeps
+        self.step_length = step_length
+        self.levels = [
+            _Level(field, inner_mask, relaxation_constant, epsilon_field)
+        ]
+        # Each coarser level takes every other point. The boundary values and
+        # relaxation constant are only needed for full multigrid, since the
+        # V-cycles solve for the error on the coarser levels.
+        step = 1
+        while min(self.levels[-1].inner_mask.shape) >= 2 * COARSEST_SIDE - 1:
+            step *= 2
+            mask = np.ascontiguousarray(inner_mask[::step, ::step])
+            if not mask.any():
+                break
+            epsilon = None
+            if epsilon_field is not None:
+                epsilon = epsilon_field[::step, ::step]
+            constant = relaxation_constant
+            if isinstance(constant, np.ndarray):
+                constant = constant[::step, ::step]
+            # The equations are scaled by the step size squared, so every
+            # coarser level has four times the relaxation constant
+            constant = constant * step**2
+            self.levels.append(
+                _Level(field[::step, ::step], mask, constant, epsilon))
+        # The coarsest level is solved with many SOR sweeps
+        coarsest = self.levels[-1]
+        coarsest.kernel.omega = float(grid_omega(coarsest.inner_mask))
+        self.coarsest_sweeps = max(2 * sum(coarsest.inner_mask.shape), 20)
+        self.started = False
+        self.update = np.empty(inner_mask.shape, dtype='float64')
+
+    def _vcycle(self, idx):
+        level = self.levels[idx]
+        if idx == len(self.levels) - 1:
+            level.kernel.smooth(self.coarsest_sweeps)
+            return
+        level.kernel.smooth(self.pre_sweeps)
+        level.kernel.residual(level.residual)
+        # The coarse level solves for the error, which is zero on the boundary
+        coarse = self.levels[idx + 1]
+        restrict(level.residual_padded, coarse.source)
+        np.multiply(coarse.source, 4, out=coarse.source)
+        np.multiply(coarse.source, coarse.inner_mask, out=coarse.source)
+        coarse.kernel.padded.fill(0)
+        self._vcycle(idx + 1)
+        prolong(coarse.kernel.padded[1:, 1:], level.correction)
+        np.multiply(level.correction, level.inner_mask, out=level.correction)
+        np.add(level.values,
+               self._step_length(level) * level.correction,
+               out=level.values)
+        level.kernel.smooth(self.post_sweeps)
+
+    # The coarse grids do not follow the boundary exactly (a coarse point can
+    # sit past a boundary that falls between fine points), which can make the
+    # coarse grid correction too large. The correction is scaled by the step
+    # length that minimizes the energy of the error along it:
+    #   alpha = (r . c) / (c . A c)
+    def _step_length(self, level):
+        if not self.step_length:
+            return 1.0
+        correction = level.correction
+        level.kernel.apply_stencil(level.correction_padded, level.stencil)
+        np.multiply(level.stencil, level.inner_mask, out=level.stencil)
+        energy = -np.vdot(correction, level.stencil)
+        if energy <= 0:
+            return 1.0
+        return np.vdot(level.residual, correction) / energy
+
+    # Solve on the coarsest grid first, then interpolate the solution onto the
+    # next finer grid as its starting point and do a V-cycle there
+    def _full_multigrid(self):
+        coarsest = self.levels[-1]
+        coarsest.kernel.smooth(self.coarsest_sweeps)
+        for idx in range(len(self.levels) - 2, -1, -1):
+            level = self.levels[idx]
+            coarse = self.levels[idx + 1]
+            prolong(coarse.kernel.padded[1:, 1:], level.correction)
+            np.copyto(level.values, level.correction, where=level.inner_mask)
+            # The V-cycle reuses the coarser levels for the error equations,
+            # they are no longer needed for their own solutions
+            self._vcycle(idx)
+
+    def sweep(self, norm=None):
+        if self.cycle == 'fmg' and not self.started:
+            self._full_multigrid()
+        else:
+            self._vcycle(0)
+        self.started = True
+        finest = self.levels[0]
+        np.copyto(self.field, finest.values, casting='same_kind',
+                  where=self.inner_mask)
+        if norm is None:
+            return None
+        # Report the residual divided by the diagonal, which matches the update
+        # that a Jacobi sweep would make
+        finest.kernel.residual(self.update)
+        np.divide(self.update, finest.kernel.diagonal(), out=self.update)
+        return residual_norm(self.update, self.inner_mask, norm)
+
+    # One V-cycle for the error equation with the right hand side `source`
+    # (zero on the boundary), starting from zero. This approximates the inverse
+    # of the system, so it can be used as a preconditioner.
+    def vcycle(self, source):
+        finest = self.levels[0]
+        finest.source[...] = source
+        finest.kernel.padded.fill(0)
+        self._vcycle(0)
+        return finest.values
+
+    def run(self, cycles):
+        for i in range(cycles):
+            self.sweep()
+        return self.field
+
+    # The coarser levels start from zero every cycle, so only the finest one
+    # is needed to continue
+    def state(self):
+        return {
+            'padded': self.levels[0].kernel.padded,
+            'started': self.started,
+        }
+
+    def restore(self, state):
+        finest = self.levels[0]
+        finest.kernel.padded[...] = state['padded']
+        np.copyto(self.field, finest.values, casting='same_kind',
+                  where=self.inner_mask)
+        self.started = bool(state['started'])
+
+    # Every cycle lowers the residual by a large factor, so it is checked after
+    # each one. Without a tolerance the cycles stop once the residual stalls.
+    def solve(self, max_iterations, tolerance=None, check_every=1,
+              norm='max', checkpoint=None, profiler=None):
+        return iterate(self, max_iterations, tolerance, 1, norm,
+                       stop_on_stall=tolerance is None, checkpoint=checkpoint,
+                       profiler=profiler)
@@ -0,0 +1,322 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Out-of-Core Relaxation
+# For grids whose field, inner mask and epsilon field do not fit in memory.
+# The arrays are kept in files that are mapped once for the whole kernel, and
+# a sweep only reads and writes a tile of rows (along with one halo row on each
+# side) at a time. The operating system can then drop the pages of the other
+# tiles, so the memory that a sweep needs is set by the tile budget instead of
+# by the size of the grid. Each tile is relaxed with the same operations as the
+# `RelaxationKernel` and written back in place. The halo row above a tile has
+# already been written by the tile before it, so its old values are carried
+# over from that tile. The sweeps are then the same Jacobi sweeps as an
+# in-memory solve. The weights of the dielectric operator are computed once
+# into files of their own, and every tile shares the same buffers.
+# `build_tiles` builds the arrays of a problem a tile of rows at a time into
+# `.npy` files, which `np.load(filename, mmap_mode='r+')` opens again later.
+# ==============================================================================
+import mmap
+import os
+import shutil
+import tempfile
+import weakref
+
+import numpy as np
+
+from .convergence import NORMS, iterate, residual_norm
+from .dielectric import DielectricOperator, face_weights
+from .kernel import average_neighbors
+
+# The memory budget of a tile in MB
+TILE_MB = 64
+
+# The bytes that a tile takes for every one of its points: the field, inner
+# mask, epsilon field and relaxation constant, the sum of the neighbors, the
+# update and the weights of the dielectric operator, with some room to spare
+BYTES_PER_POINT = 128
+
+# The names of the arrays that `build_tiles` writes, in the order that the
+# problems build them
+BUILT_ARRAYS = ('field', 'inner_mask', 'epsilon_field')
+
+# The names of the files of the dielectric weights, in the order of
+# `face_weights`
+FACE_WEIGHTS = ('top', 'bottom', 'left', 'right', 'normalizer')
+
+
+# The number of rows of `cols` points that fit in a tile of `tile_mb` MB
+def tile_rows(cols, tile_mb=TILE_MB):
+    return max(int(tile_mb * 2**20 // (max(cols, 1) * BYTES_PER_POINT)), 1)
+
+
+# Whether `array` is a whole memory-mapped file (not a view of one) whose file
+# can be mapped again a few rows at a time
+def _is_mapped(array, modes=('r', 'r+', 'w+')):
+    return (isinstance(array, np.memmap) and
+            isinstance(array.base, mmap.mmap) and array.mode in modes and
+            array.flags.c_contiguous)
+
+
+class _MappedRows:
+
+    # The 2D array of `shape` stored in `filename` from `offset` bytes on. Only
+    # the rows that are read or written are mapped, and only for that long.
+    def __init__(self, filename, dtype, shape, offset=0):
+        self.filename = filename
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+        self.offset = offset
+        self.row_bytes = self.shape[1] * self.dtype.itemsize
+
+    # Mapped straight from an existing memory-mapped array
+    @classmethod
+    def of(cls, array):
+        return cls(array.filename, array.dtype, array.shape, array.offset)
+
+    def _map(self, start, stop, mode):
+        return np.memmap(self.filename, self.dtype, mode,
+                         self.offset + start * self.row_bytes,
+                         (stop - start, self.shape[1]))
+
+    # A copy of the rows `start:stop`
+    def read(self, start, stop):
+        return np.array(self._map(start, stop, 'r'))
+
+    def write(self, start, values):
+        rows = self._map(start, start + len(values), 'r+')
+        rows[...] = values
+        del rows
+
+
+# A new `.npy` file of `shape` that is written a few rows at a time
+def _create(filename, dtype, shape):
+    header = np.lib.format.open_memmap(filename, 'w+', dtype, shape)
+    rows = _MappedRows(filename, dtype, shape, header.offset)
+    del header
+    return rows
+
+
+# The rows `start:stop` of `array`, without mapping the rest of its file
+def _read(array, start, stop):
+    if _is_mapped(array):
+        return _MappedRows.of(array).read(start, stop)
+    return np.array(array[start:stop])
+
+
+# Copy `array` to the `.npy` file `filename` (in `dtype`, which defaults to the
+# one of `array`) a tile of rows at a time. Returns the memory-mapped copy.
+def copy_to_file(array, filename, dtype=None, tile_mb=TILE_MB):
+    if dtype is None:
+        dtype = array.dtype
+    rows = _create(filename, dtype, array.shape)
+    step = tile_rows(array.shape[1], tile_mb)
+    for start in range(0, array.shape[0], step):
+        stop = min(start + step, array.shape[0])
+        rows.write(start, _read(array, start, stop).astype(dtype))
+    return np.load(filename, mmap_mode='r+')
+
+
+# Build the `(field, inner_mask, epsilon_field)` of a problem (see `Problem`)
+# a tile of rows at a time into the `.npy` files of BUILT_ARRAYS in
+# `directory`. Returns the memory-mapped arrays. `build` is called with the Y
+# coordinates of each tile, so it must not depend on anything other than the
+# coordinates (such as setting the first and last rows of the field).
+def build_tiles(build, x_coords, y_coords, directory, tile_mb=TILE_MB):
+    os.makedirs(directory, exist_ok=True)
+    shape = (len(y_coords), len(x_coords))
+    step = tile_rows(shape[1], tile_mb)
+    stored = None
+    for start in range(0, shape[0], step):
+        arrays = build(x_coords, y_coords[start:start + step])
+        if stored is None:
+            stored = [
+                None if array is None else _create(
+                    os.path.join(directory, f'{name}.npy'), array.dtype,
+                    shape) for name, array in zip(BUILT_ARRAYS, arrays)
+            ]
+        for rows, array in zip(stored, arrays):
+            if rows is not None:
+                rows.write(start, array)
+    return tuple(None if rows is None else
+                 np.load(rows.filename, mmap_mode='r+') for rows in stored)
+
+
+class _Tile:
+
+    # The rows `start:stop` of the grid, `halo` also includes the neighboring
+    # row on each side (when there is one). The field, mask, relaxation
+    # constant and weights are views of the mapped arrays, which are taken
+    # once for the whole kernel (as plain arrays, which skip the bookkeeping
+    # of `np.memmap` on every operation).
+    def __init__(self, start, stop, field, inner_mask, relaxation_constant,
+                 weights):
+        rows = slice(start, stop)
+        halo_start = max(start - 1, 0)
+        halo_stop = min(stop + 1, inner_mask.shape[0])
+        halo = slice(halo_start, halo_stop)
+        self.size = halo_stop - halo_start
+        # The rows of the tile within the halo
+        self.inner = slice(start - halo_start, stop - halo_start)
+        self.field = np.asarray(field[rows])
+        self.halo_field = np.asarray(field[halo])
+        self.inner_mask = np.asarray(inner_mask[rows])
+        if isinstance(relaxation_constant, np.ndarray):
+            relaxation_constant = np.asarray(relaxation_constant[halo])
+        self.relaxation_constant = relaxation_constant
+        self.add_constant = bool(np.any(relaxation_constant))
+        self.operator = None
+        if weights is not None:
+            self.operator = DielectricOperator.of(
+                [np.asarray(weight[halo]) for weight in weights])
+
+
+class OutOfCoreKernel:
+
+    # Same arguments as the `RelaxationKernel`, along with:
+    #   directory: the folder for the arrays that are not already memory-mapped
+    #              files, which are copied there. `None` uses a temporary
+    #              folder that is removed along with the kernel.
+    #   tile_mb: the memory budget of a tile in MB
+    # A memory-mapped field (opened with `r+` or `w+`) is relaxed in its own
+    # file. Any other field is copied to a file, and is written to whenever the
+    # residual is checked and at the end of `run` (`sync` writes it at any
+    # other time).
+    def __init__(self, field, inner_mask, relaxation_constant=0,
+                 epsilon_field=None, directory=None, tile_mb=TILE_MB):
+        self.field = field
+        self.inner_mask = inner_mask
+        self.directory = directory
+        if directory is None:
+            self.directory = tempfile.mkdtemp(prefix='relaxation_')
+            weakref.finalize(self, shutil.rmtree, self.directory, True)
+        self.tile_rows = tile_rows(field.shape[1], tile_mb)
+        # Every file is mapped once for the whole kernel, and a sweep only
+        # touches the rows of one tile at a time
+        self.in_place = _is_mapped(field, ('r+', 'w+'))
+        if self.in_place:
+            self.stored_field = field
+        else:
+            self.stored_field = self._store(field, 'field')
+        self.stored_mask = self._store(inner_mask, 'inner_mask')
+        self.relaxation_constant = relaxation_constant
+        if isinstance(relaxation_constant, np.ndarray):
+            self.relaxation_constant = self._store(relaxation_constant,
+                                                   'relaxation_constant')
+        self.weights = None
+        if epsilon_field is not None:
+            self.weights = self._store_weights(epsilon_field)
+        self._tiles = [
+            _Tile(start, stop, self.stored_field, self.stored_mask,
+                  self.relaxation_constant, self.weights)
+            for start, stop in self.tiles()
+        ]
+        # The buffers of the largest tile along with its halo rows, which are
+        # shared by every tile
+        rows = min(self.tile_rows + 2, field.shape[0])
+        self.block = np.empty((rows, field.shape[1]),
+                              dtype=self.stored_field.dtype)
+        self.summed = np.empty((rows, field.shape[1]), dtype='float64')
+        if self.weights is not None:
+            self.scratch = np.empty(self.summed.shape, dtype='float64')
+        self.inner_count = sum(int(np.count_nonzero(tile.inner_mask))
+                               for tile in self._tiles)
+
+    # `array` mapped from a file, copied to the directory unless it already is
+    # one
+    def _store(self, array, name):
+        if _is_mapped(array):
+            return array
+        filename = os.path.join(self.directory, f'out_of_core_{name}.npy')
+        return copy_to_file(array, filename)
+
+    # The weights of the dielectric operator mapped from files, computed a
+    # tile at a time along with a halo row on each side. The weights of every
+    # row then match the ones of the whole grid.
+    def _store_weights(self, epsilon_field):
+        stored = [_create(os.path.join(self.directory,
+                                       f'out_of_core_{name}.npy'),
+                          'float64', epsilon_field.shape)
+                  for name in FACE_WEIGHTS]
+        for start, stop in self.tiles():
+            halo_start = max(start - 1, 0)
+            halo_stop = min(stop + 1, epsilon_field.shape[0])
+            inner = slice(start - halo_start, stop - halo_start)
+            weights = face_weights(_read(epsilon_field, halo_start, halo_stop))
+            for rows, weight in zip(stored, weights):
+                rows.write(start, weight[inner])
+        return [np.load(rows.filename, mmap_mode='r') for rows in stored]
+
+    # The `(start, stop)` rows of every tile
+    def tiles(self):
+        rows = self.field.shape[0]
+        for start in range(0, rows, self.tile_rows):
+            yield start, min(start + self.tile_rows, rows)
+
+    def sweep(self, norm=None):
+        if norm is not None and norm not in NORMS:
+            raise ValueError(f'Unknown norm `{norm}`, must be one of {NORMS}')
+        track = norm is not None
+        largest = 0.0
+        squares = 0.0
+        # The row above the current tile from before this sweep
+        above = None
+        for tile in self._tiles:
+            # The old values of the tile and its halo rows, the row above has
+            # already been written by the tile before
+            block = self.block[:tile.size]
+            np.copyto(block, tile.halo_field)
+            if above is not None:
+                block[0] = above
+            # The halo rows are averaged with their neighbors on the other side
+            # missing, which is wrong for them but they are never written back
+            summed = self.summed[:len(block)]
+            if tile.operator is None:
+                average_neighbors(block, summed,
+                                  tile.relaxation_constant
+                                  if tile.add_constant else None)
+            else:
+                tile.operator.average(block, summed, self.scratch[:len(block)],
+                                      tile.relaxation_constant)
+            summed = summed[tile.inner]
+            rows = block[tile.inner]
+            above = rows[-1].copy()
+            if track:
+                update = np.subtract(summed, rows)
+                largest = max(largest, residual_norm(update, tile.inner_mask))
+                squares += float(np.vdot(update, update))
+            np.copyto(tile.field, summed, casting='same_kind',
+                      where=tile.inner_mask)
+        if not track:
+            return None
+        self.sync()
+        if norm == 'max':
+            return largest
+        return float(np.sqrt(squares / max(self.inner_count, 1)))
+
+    # Write the newest values to the field
+    def sync(self):
+        if not self.in_place:
+            for start, stop in self.tiles():
+                self.field[start:stop] = self.stored_field[start:stop]
+        return self.field
+
+    def run(self, iterations):
+        for i in range(iterations):
+            self.sweep()
+        return self.sync()
+
+    def state(self):
+        return {'field': self.sync()}
+
+    # The field of the state can be memory-mapped (see `Checkpoint`), only a
+    # tile of it is read at a time
+    def restore(self, state):
+        for start, stop in self.tiles():
+            self.stored_field[start:stop] = _read(state['field'], start, stop)
+        self.sync()
+
+    def solve(self, max_iterations, tolerance=None, check_every=10,
+              norm='max', checkpoint=None, profiler=None):
+        return iterate(self, max_iterations, tolerance, check_every, norm,
+                       checkpoint=checkpoint, profiler=profiler)
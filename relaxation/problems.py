@@ -0,0 +1,456 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Problems
+# The relaxation problems of the homework as functions, so that they can be
+# solved in batch jobs without running the scripts (which plot their fields
+# and block until the plots are closed). Nothing here imports `matplotlib`.
+# Each problem function builds the grid and boundaries of its problem, `solve`
+# relaxes a problem with the options of a `SolveParameters` and `save` writes
+# the same file as the scripts:
+#   problem = wedge_2_11(h_step_size=0.01)
+#   result = solve(problem, SolveParameters(solver='sor', tolerance=1e-6))
+#   save(problem, result, 'numerical211.npz')
+# ==============================================================================
+import os
+
+import numpy as np
+
+from .anytime import anytime_solve
+from .axisymmetric import axisymmetric_operator
+from .checkpoint import Checkpoint
+from .composite import REFINE_THRESHOLD, CompositeSolver
+from .geometry import (RASTERIZERS, Disk, Geometry, HalfPlane, Wedge,
+                       grid_step, nearest_index)
+from .out_of_core import TILE_MB, build_tiles, copy_to_file
+from .solvers import close_kernel, make_kernel
+from .superposition import ResponseCache
+from .symmetry import SymmetricSolver
+from .warm_start import problem_hash, warm_start
+
+# Epsilon naught, has units of F * m^-1 (farads per meter)
+EPSILON_0 = 8.8541878128e-12
+
+
+# Evenly spaced coordinates between the bounds
+def init_coords(bounds, h_step_size):
+    # Add one to the total number of steps so that the end bound is exclusive
+    # and does not contribute to the step size
+    total_steps = int(np.diff(bounds)[0] / h_step_size) + 1
+    return np.linspace(*bounds, total_steps)
+
+
+# The options of a solve, every argument has the same meaning and default as
+# the upper case constant of the scripts
+class SolveParameters:
+
+    def __init__(self, iterations=5000, tolerance=None, check_every=10,
+                 warm_start=None, solver='jacobi', solver_options=None,
+                 field_dtype='float32', out_filename=None,
+                 checkpoint_filename=None, checkpoint_every=1000,
+                 resume=False, refine_levels=0,
+                 refine_threshold=REFINE_THRESHOLD, response_filename=None,
+                 symmetry=None, time_budget=None):
+        self.iterations = iterations
+        self.tolerance = tolerance
+        self.check_every = check_every
+        self.warm_start = warm_start
+        self.solver = solver
+        self.solver_options = solver_options or {}
+        self.field_dtype = field_dtype
+        # Only read by the `cache` warm start, `save` is given its own filename
+        self.out_filename = out_filename
+        self.checkpoint_filename = checkpoint_filename
+        self.checkpoint_every = checkpoint_every
+        self.resume = resume
+        self.refine_levels = refine_levels
+        self.refine_threshold = refine_threshold
+        self.response_filename = response_filename
+        self.symmetry = symmetry
+        self.time_budget = time_budget
+
+
+class Problem:
+
+    # Arguments:
+    #   x_coords / y_coords: the coordinates of the grid
+    #   build: called with the X and Y coordinates of a grid, returns its
+    #          `(field, inner_mask, epsilon_field)` like `Geometry.build` (so
+    #          that the composite solver can build finer grids)
+    #   relaxation_constant: same as the kernels
+    #   driven: `(shape, voltage)` pairs of boundaries that the field is
+    #           superposed over when solving with a response file
+    #   axisymmetric: the X coordinates are the radii and the Y coordinates are
+    #                 the heights of a problem that is symmetric about the
+    #                 z-axis, the epsilon field and relaxation constant are
+    #                 then weighted by the radius (see `axisymmetric.py`)
+    #   directory: build the field, inner mask and epsilon field a tile of rows
+    #              at a time into memory-mapped files in this folder instead of
+    #              in memory (see `out_of_core.py`), `build` must then only
+    #              depend on the coordinates
+    #   tile_mb: the memory budget of each tile of rows in MB
+    def __init__(self, x_coords, y_coords, build, relaxation_constant=0,
+                 driven=(), axisymmetric=False, directory=None,
+                 tile_mb=TILE_MB):
+        if axisymmetric and directory is not None:
+            raise ValueError('Axisymmetric problems can not be built out of '
+                             'core')
+        self.x_coords = x_coords
+        self.y_coords = y_coords
+        self.build = build
+        self.driven = list(driven)
+        self.axisymmetric = axisymmetric
+        self.directory = directory
+        self.tile_mb = tile_mb
+        if directory is None:
+            self.field, self.inner_mask, self.epsilon_field = build(x_coords,
+                                                                    y_coords)
+        else:
+            self.field, self.inner_mask, self.epsilon_field = build_tiles(
+                build, x_coords, y_coords, directory, tile_mb)
+        if axisymmetric:
+            self.epsilon_field, relaxation_constant = axisymmetric_operator(
+                x_coords, self.field.shape, relaxation_constant,
+                self.epsilon_field)
+        self.relaxation_constant = relaxation_constant
+        self.geometry_hash = problem_hash(x_coords, y_coords, self.field,
+                                          self.inner_mask, self.epsilon_field,
+                                          relaxation_constant)
+        # The composite solver of the last solve with refinement levels
+        self.composite = None
+
+    # The masks of the driven boundary points
+    def segments(self):
+        geometry = Geometry(self.x_coords, self.y_coords)
+        return [geometry.mask(shape) & ~self.inner_mask
+                for shape, _ in self.driven]
+
+
+# Problem 1.21, a uniform charge density inside of a grounded square. The
+# relaxation constant defaults to:
+#   4 * (DENSITY * H_STEP_SIZE^2 / (4 * EPSILON_0))
+# since the kernels divide it by four along with the neighbors.
+def square_1_21(h_step_size=0.05, x_bounds=(0, 1), y_bounds=(0, 1),
+                relaxation_constant=None):
+    if relaxation_constant is None:
+        relaxation_constant = 4 * (1 * h_step_size**2 / (4 * EPSILON_0))
+
+    def build(x_coords, y_coords):
+        # The sides of the square are set to zero potential, the inner points
+        # start from one
+        field = np.full((len(y_coords), len(x_coords)), 1.0)
+        field[0] = 0
+        field[-1] = 0
+        field[0:, 0] = 0
+        field[0:, -1] = 0
+        inner_mask = field == 1
+        return field, inner_mask, None
+
+    return Problem(init_coords(x_bounds, h_step_size),
+                   init_coords(y_bounds, h_step_size), build,
+                   relaxation_constant)
+
+
+# Section 2.10, a grounded box with a sine on the bottom
+def sine_2_10(h_step_size=0.02, x_bounds=(0, 1), y_bounds=(0, 5),
+              relaxation_constant=0):
+
+    def build(x_coords, y_coords):
+        field = np.full((len(y_coords), len(x_coords)), np.inf)
+        field[0] = [np.sin(x * np.pi / x_bounds[1]) for x in x_coords]
+        field[-1] = 0
+        field[0:, 0] = 0
+        field[0:, -1] = 0
+        # The points that are still `inf` are not on a boundary
+        inner_mask = field == np.inf
+        field[inner_mask] = 0
+        return field, inner_mask, None
+
+    return Problem(init_coords(x_bounds, h_step_size),
+                   init_coords(y_bounds, h_step_size), build,
+                   relaxation_constant)
+
+
+# Raises a `ValueError` for an unknown way of rasterizing the edges
+def _check_rasterize(rasterize):
+    if rasterize not in RASTERIZERS:
+        raise ValueError(f'Unknown rasterize `{rasterize}`, must be one of '
+                         f'{RASTERIZERS}')
+
+
+# Section 2.11, the wedge between the bottom and the wall at `beta_angle`
+# (in degrees) closed by the right wall at `right_voltage`. `rasterize` is one
+# of RASTERIZERS (see `geometry.py`).
+def wedge_2_11(h_step_size=0.02, beta_angle=35, right_voltage=40,
+               x_bounds=(0, 2), y_bounds=(0, 1), relaxation_constant=0,
+               rasterize='nearest'):
+    return _wedge(h_step_size, beta_angle, 0, right_voltage, x_bounds,
+                  y_bounds, relaxation_constant, rasterize)
+
+
+# Question 2.26, the wedge of section 2.11 along with the circle of radius
+# `a_rad` about the origin
+def wedge_circle_2_26(h_step_size=0.02, beta_angle=35, a_rad=0.5,
+                      right_voltage=5, x_bounds=(0, 2), y_bounds=(0, 1),
+                      relaxation_constant=0, rasterize='nearest'):
+    return _wedge(h_step_size, beta_angle, a_rad, right_voltage, x_bounds,
+                  y_bounds, relaxation_constant, rasterize)
+
+
+def _wedge(h_step_size, beta_angle, a_rad, right_voltage, x_bounds, y_bounds,
+           relaxation_constant, rasterize):
+    _check_rasterize(rasterize)
+    right_wall = HalfPlane((x_bounds[1], 0), (-1, 0))
+    slope = np.tan(np.radians(beta_angle))
+
+    def build(x_coords, y_coords):
+        if rasterize == 'nearest':
+            return _wedge_staircase(x_coords, y_coords)
+        geometry = Geometry(x_coords, y_coords)
+        # Set the bottom to be zero potential
+        geometry.boundary(HalfPlane((0, y_bounds[0]), (0, 1)))
+        # Set all pixels on or above the slope (the other wall) to be a
+        # boundary
+        geometry.boundary(Wedge((0, 0), np.radians(beta_angle), np.pi))
+        # Circle about the origin: x^2 + y^2 = a^2
+        if a_rad > 0:
+            geometry.boundary(Disk((0, 0), a_rad))
+        geometry.boundary(right_wall, right_voltage)
+        return geometry.build()
+
+    def _wedge_staircase(x_coords, y_coords):
+        step = grid_step(x_coords, y_coords)
+        rows = np.arange(len(y_coords))[:, None]
+        columns = np.arange(len(x_coords))
+        # Set the bottom to be zero potential
+        boundary = np.zeros((len(y_coords), len(x_coords)), dtype=bool)
+        boundary[y_coords <= y_bounds[0]] = True
+        # Set all pixels on or above the slope to be a boundary. If the slope
+        # has continued outside of the Y bounds, the column is left alone.
+        slope_y = slope * x_coords
+        boundary |= ((rows >= nearest_index(y_coords, slope_y, step)) &
+                     (slope_y <= y_bounds[1]))
+        # Circle about the origin: x^2 + y^2 = a^2, the pixels below it are a
+        # boundary up to the column nearest to its radius
+        if a_rad > 0:
+            circle_y = np.sqrt(np.maximum(a_rad**2 - x_coords**2, 0))
+            boundary |= ((rows < nearest_index(y_coords, circle_y, step)) &
+                         (columns <= nearest_index(x_coords, a_rad, step)))
+        right = x_coords >= x_bounds[1]
+        boundary[:, right] = True
+        field = np.zeros(boundary.shape, dtype='float64')
+        field[:, right] = right_voltage
+        return field, ~boundary, None
+
+    return Problem(init_coords(x_bounds, h_step_size),
+                   init_coords(y_bounds, h_step_size), build,
+                   relaxation_constant, [(right_wall, right_voltage)])
+
+
+# Homework 4, a dielectric cylinder (epsilon of 5) whose rim starts at 10 volts
+# inside of a grounded field. With a `directory`, the problem is built out of
+# core (see `Problem`). `rasterize` is one of RASTERIZERS (see `geometry.py`).
+def polarizable_cylinder(h_step_size=0.005, radius=0.75, x_bounds=(-1, 1),
+                         y_bounds=(-1, 1), relaxation_constant=0,
+                         directory=None, tile_mb=TILE_MB, rasterize='nearest'):
+    _check_rasterize(rasterize)
+    x_coords = init_coords(x_bounds, h_step_size)
+    y_coords = init_coords(y_bounds, h_step_size)
+    # The staircase is centered on the middle point of the grid
+    middle_idx = (len(x_coords) - 1) // 2
+    x_middle = x_coords[middle_idx]
+    y_middle = y_coords[(len(y_coords) - 1) // 2]
+    grid_x_coords = x_coords
+
+    def build(x_coords, y_coords):
+        if rasterize == 'nearest':
+            return _cylinder_staircase(x_coords, y_coords)
+        geometry = Geometry(x_coords, y_coords)
+        # The cylinder is centered in the middle of the field
+        center = (np.mean(x_bounds), np.mean(y_bounds))
+        cylinder = Disk(center, radius)
+        # Only the points inside of the cylinder are updated by the relaxation
+        # algorithm, the rest of the field is a boundary
+        geometry.boundary(~cylinder)
+        # The boundaries of the cylinder (the points within a step of its edge)
+        geometry.start(cylinder - Disk(center, radius - geometry.step), 10)
+        # The epsilon inside the cylinder, it defaults to a value of 1
+        geometry.dielectric(cylinder, 5)
+        return geometry.build()
+
+    def _cylinder_staircase(x_coords, y_coords):
+        step = grid_step(x_coords, y_coords)
+        rows = np.arange(len(y_coords))[:, None]
+        # Solving for y: y = sqrt(a^2 - x^2), every column within the radius is
+        # inside of the cylinder from the row nearest to its bottom up to the
+        # row nearest to its top
+        rel_x = np.abs(x_coords - x_middle)
+        # The columns of the grid left of the middle are the mirror images of
+        # the ones to the right, so that the staircase is symmetric
+        x_idx = nearest_index(grid_x_coords, x_coords)
+        mirror_x_idx = 2 * middle_idx - x_idx
+        mirrored = ((x_idx >= 0) & (x_idx < middle_idx) &
+                    (mirror_x_idx < len(grid_x_coords)))
+        mirrored[mirrored] = (grid_x_coords[x_idx[mirrored]] ==
+                              x_coords[mirrored])
+        rel_x[mirrored] = (grid_x_coords[mirror_x_idx[mirrored]] - x_middle)
+        y_val = np.sqrt(np.maximum(radius**2 - rel_x**2, 0))
+        below = nearest_index(y_coords, y_middle - y_val, step)
+        above = nearest_index(y_coords, y_middle + y_val, step)
+        # Only the points inside of the cylinder are updated by the relaxation
+        # algorithm, the rest of the field is a boundary
+        inner_mask = (rel_x <= radius) & (rows >= below) & (rows <= above)
+        field = np.zeros(inner_mask.shape, dtype='float64')
+        # The boundaries of the cylinder
+        field[inner_mask & ((rows == below) | (rows == above))] = 10
+        # The epsilon inside the cylinder, it defaults to a value of 1
+        epsilon_field = np.ones(inner_mask.shape, dtype='float64')
+        epsilon_field[inner_mask & (rows < above)] = 5
+        return field, inner_mask, epsilon_field
+
+    return Problem(x_coords, y_coords, build, relaxation_constant,
+                   directory=directory, tile_mb=tile_mb)
+
+
+# Equations 2.22 and 3.33, the sphere with its hemispheres held at plus and
+# minus `voltage`, solved on the (r, z) half plane. The edges of the grid away
+# from the axis are held at the exterior series of equation 3.36.
+def sphere_3_36(h_step_size=0.05, radius=1, voltage=1, r_bounds=(0, 4),
+                z_bounds=(-4, 4), relaxation_constant=0):
+    # Imported here since the series import `init_coords` from this file
+    from .series import sphere_exterior_3_36
+
+    def build(r_coords, z_coords):
+        geometry = Geometry(r_coords, z_coords)
+        exterior = voltage * sphere_exterior_3_36(r_coords, z_coords, radius)
+        geometry.boundary(HalfPlane((0, z_bounds[0]), (0, 1)), exterior)
+        geometry.boundary(HalfPlane((0, z_bounds[1]), (0, -1)), exterior)
+        geometry.boundary(HalfPlane((r_bounds[1], 0), (-1, 0)), exterior)
+        # The points of the sphere above and below the equator, which is
+        # between the two hemispheres at zero potential
+        sphere = Disk((0, 0), radius)
+        half_step = geometry.step / 2
+        geometry.boundary(sphere, 0)
+        geometry.boundary(sphere & HalfPlane((0, half_step), (0, -1)), voltage)
+        geometry.boundary(sphere & HalfPlane((0, -half_step), (0, 1)),
+                          -voltage)
+        return geometry.build()
+
+    return Problem(init_coords(r_bounds, h_step_size),
+                   init_coords(z_bounds, h_step_size), build,
+                   relaxation_constant, axisymmetric=True)
+
+
+# The problem functions by the names that sweeps use for them (see
+# `scenarios.py`)
+PROBLEMS = {
+    '1.21': square_1_21,
+    '2.10': sine_2_10,
+    '2.11': wedge_2_11,
+    '2.26': wedge_circle_2_26,
+    'cylinder': polarizable_cylinder,
+    'sphere': sphere_3_36,
+}
+
+
+# Relaxes the field of `problem` (which is replaced by the field in
+# `parameters.field_dtype`), the result holds the relaxed field
+def solve(problem, parameters=None, profiler=None):
+    if parameters is None:
+        parameters = SolveParameters()
+    options = dict(parameters.solver_options)
+    if problem.directory is None:
+        problem.field = problem.field.astype(parameters.field_dtype)
+    else:
+        # Converted a tile at a time into a file of its own, and the kernel
+        # keeps its files next to the ones of the problem
+        if problem.field.dtype != parameters.field_dtype:
+            problem.field = copy_to_file(
+                problem.field,
+                os.path.join(problem.directory,
+                             f'field_{parameters.field_dtype}.npy'),
+                parameters.field_dtype, problem.tile_mb)
+        if parameters.solver == 'out_of_core':
+            options.setdefault('directory', problem.directory)
+            options.setdefault('tile_mb', problem.tile_mb)
+    field = problem.field
+    if parameters.refine_levels > 0:
+        if problem.axisymmetric:
+            raise ValueError('Refinement levels do not support axisymmetric '
+                             'problems')
+        # Solve the uniform grid along with finer patches, then sample the
+        # composite solution back onto the uniform grid
+        problem.composite = CompositeSolver(
+            problem.build, problem.x_coords, problem.y_coords,
+            problem.relaxation_constant, parameters.refine_levels,
+            parameters.refine_threshold, parameters.solver,
+            parameters.solver_options)
+        result = problem.composite.solve(
+            parameters.iterations, parameters.tolerance,
+            parameters.check_every, profiler=profiler)
+    elif parameters.response_filename is not None and problem.driven:
+        # Scale the responses to the driven boundaries instead of relaxing
+        # the field
+        responses = ResponseCache(
+            field, problem.inner_mask, problem.segments(),
+            problem.relaxation_constant, problem.epsilon_field,
+            filename=parameters.response_filename)
+        result = responses.result(
+            [voltage for _, voltage in problem.driven])
+    elif parameters.time_budget is not None:
+        if parameters.symmetry is not None:
+            raise ValueError('Time budgets do not support symmetric solves')
+        # Solve on successively finer grids until the budget runs out, the
+        # result comes with an estimate of its error
+        result = anytime_solve(field, problem.inner_mask,
+                               parameters.time_budget,
+                               problem.relaxation_constant,
+                               problem.epsilon_field, parameters.solver,
+                               options, parameters.tolerance,
+                               parameters.iterations, parameters.check_every,
+                               profiler=profiler)
+    else:
+        # Start the inner points from a coarser solution or an earlier run
+        warm_start(parameters.warm_start, field, problem.inner_mask,
+                   problem.relaxation_constant, problem.epsilon_field,
+                   filename=parameters.out_filename,
+                   geometry_hash=problem.geometry_hash)
+        if parameters.symmetry is None:
+            kernel = make_kernel(parameters.solver, field, problem.inner_mask,
+                                 problem.relaxation_constant,
+                                 problem.epsilon_field, **options)
+        else:
+            # Only relax the half (or quarter) of the field that is not a
+            # mirror image
+            kernel = SymmetricSolver(parameters.solver, field,
+                                     problem.inner_mask,
+                                     problem.relaxation_constant,
+                                     problem.epsilon_field,
+                                     parameters.symmetry, **options)
+        checkpoint = None
+        if parameters.checkpoint_filename is not None:
+            checkpoint = Checkpoint(parameters.checkpoint_filename,
+                                    parameters.checkpoint_every,
+                                    parameters.resume)
+        try:
+            return kernel.solve(parameters.iterations, parameters.tolerance,
+                                parameters.check_every, checkpoint=checkpoint,
+                                profiler=profiler)
+        finally:
+            close_kernel(kernel)
+    field[...] = result.field
+    result.field = field
+    return result
+
+
+# Saves the field of a solve along with its coordinates, geometry hash and
+# convergence certificate
+def save(problem, result, filename):
+    np.savez(
+        filename,
+        x_coords=problem.x_coords,
+        y_coords=problem.y_coords,
+        field=result.field,
+        geometry_hash=problem.geometry_hash,
+        **result.certificate(),
+    )
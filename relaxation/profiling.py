@@ -0,0 +1,127 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Profiling
+# An opt-in record of where the time of a run goes. Every event is written as
+# one line of JSON: the wall time of each stage of a script (building the
+# coordinates and geometry, iterating, plotting and saving), the wall time,
+# residual and cell updates per second of the sweeps, and a summary of every
+# solve. The peak memory of the process is added to the stages and solves. A
+# profiler without a file is disabled and the solvers skip it entirely.
+# ==============================================================================
+import json
+import sys
+import time
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, the peak memory is left out there
+    resource = None
+
+
+# The largest resident memory the process has used so far in MB, `None` when
+# it cannot be measured
+def peak_memory():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports it in KB, macOS in bytes
+    if sys.platform == 'darwin':
+        return peak / 2**20
+    return peak / 2**10
+
+
+class Profiler:
+
+    # The events are written to `filename`, `None` disables the profiler.
+    # A sweep event is only written every `every` sweeps (the sweeps with a
+    # residual check are always written), its time and cell updates cover all
+    # of the sweeps since the last event.
+    def __init__(self, filename=None, every=1):
+        self.filename = filename
+        self.enabled = filename is not None
+        self.every = max(int(every), 1)
+        self.file = None
+        self.current = None
+        self.solve_start = None
+        if self.enabled:
+            self.file = open(filename, 'w')
+            self.start = time.perf_counter()
+
+    def _write(self, event, **values):
+        record = {'event': event,
+                  'time': time.perf_counter() - self.start}
+        record.update(values)
+        self.file.write(json.dumps(record) + '\n')
+
+    # End the stage that is running (if any) and start the stage `name`
+    def stage(self, name):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self.current is not None:
+            current_name, current_start = self.current
+            self._write('stage', stage=current_name,
+                        seconds=now - current_start,
+                        peak_memory_mb=peak_memory())
+        self.current = (name, now)
+
+    # End the last stage, write the total time and close the file
+    def finish(self):
+        if not self.enabled or self.file is None:
+            return
+        self.stage(None)
+        self._write('total', seconds=time.perf_counter() - self.start,
+                    peak_memory_mb=peak_memory())
+        self.file.close()
+        self.file = None
+
+    # Called by the solvers before their first sweep. `inner_points` is the
+    # number of points that each sweep updates, which defaults to the points
+    # in the inner mask of the kernel.
+    def start_solve(self, kernel, iterations=0, inner_points=None):
+        if inner_points is None:
+            inner_points = int(np.count_nonzero(kernel.inner_mask))
+        self.kernel_name = type(kernel).__name__
+        self.inner_points = inner_points
+        self.solve_start = self.last_time = time.perf_counter()
+        self.first_iteration = self.last_iteration = iterations
+
+    # Called by the solvers after a sweep (or a group of sweeps) that brought
+    # the solve up to `iterations`, along with the residual when it was checked
+    def sweep(self, iterations, residual=None):
+        if (residual is None and
+                iterations - self.last_iteration < self.every):
+            return
+        now = time.perf_counter()
+        seconds = now - self.last_time
+        sweeps = iterations - self.last_iteration
+        values = {
+            'iteration': iterations,
+            'sweeps': sweeps,
+            'seconds': seconds,
+            'cell_updates_per_second':
+                self.inner_points * sweeps / max(seconds, 1e-12),
+        }
+        if residual is not None:
+            values['residual'] = residual
+        self._write('sweep', **values)
+        # The time that was spent writing is not counted against the sweeps
+        self.last_time = time.perf_counter()
+        self.last_iteration = iterations
+
+    # Called by the solvers with their `RelaxationResult`
+    def end_solve(self, result):
+        seconds = time.perf_counter() - self.solve_start
+        sweeps = result.iterations - self.first_iteration
+        self._write('solve', kernel=self.kernel_name,
+                    iterations=result.iterations, seconds=seconds,
+                    inner_points=self.inner_points,
+                    cell_updates_per_second=(self.inner_points * sweeps /
+                                             max(seconds, 1e-12)),
+                    converged=bool(result.converged),
+                    residual=float(result.residual),
+                    peak_memory_mb=peak_memory())
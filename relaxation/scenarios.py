@@ -0,0 +1,279 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Scenarios
+# Runs a sweep over the problems of `problems.py` on a pool of processes. A
+# sweep spec (a dict, usually loaded from JSON) gives the problems, the values
+# that are swept and the values that are fixed:
+#   {
+#     "problems": ["2.11", "2.26", "cylinder"],
+#     "sweep": {"H_STEP_SIZE": [0.02, 0.01], "BETA_ANGLE": [20, 35],
+#               "RADIUS": [0.5, 0.75], "SOLVER": ["jacobi", "sor"]},
+#     "fixed": {"TOLERANCE": 1e-6, "ITERATIONS": 100000}
+#   }
+# The problems are `1.21`, `2.10`, `2.11`, `2.26`, `cylinder` and `sphere` (see
+# `PROBLEMS`), all of them when the spec has none.
+# The names are the constants of the scripts (in either case), which are the
+# arguments of the problem functions and of `SolveParameters`. Every problem is
+# run for every combination of the swept values that it takes, so the cylinder
+# is not run once for every `BETA_ANGLE`. The spec can also have
+# `"save_fields": false` to only keep the records of the scenarios, and
+# `"memory_mb"` to replace the estimated memory of every scenario.
+# Each scenario runs in a new process, so that its peak memory is its own, and
+# scenarios are only started while their estimated memory fits in the memory
+# budget along with the scenarios that are already running.
+# ==============================================================================
+import inspect
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from .out_of_core import TILE_MB
+from .problems import PROBLEMS, SolveParameters, init_coords, save, solve
+from .profiling import peak_memory
+
+# The memory of a process that has imported the package, in MB
+BASE_MEMORY_MB = 60
+
+# The bytes that each solver takes for every point of the grid, roughly twice
+# what was measured so that the estimates are on the safe side (the `sparse`
+# solver is sized for its `direct` method)
+MEMORY_PER_POINT = {
+    'jacobi': 64,
+    'compact': 224,
+    'threaded': 64,
+    'sor': 64,
+    'mixed': 128,
+    'multigrid': 224,
+    'fast': 160,
+    'krylov': 256,
+    'out_of_core': 64,
+    'sparse': 2048,
+}
+
+# The default memory budget is this fraction of the physical memory
+MEMORY_FRACTION = 0.75
+
+# The file in the output folder that holds the results of the sweep
+RESULTS_FILENAME = 'results.json'
+
+
+def _arguments(function):
+    return [name for name in inspect.signature(function).parameters
+            if name != 'self']
+
+
+# The arguments of `SolveParameters`, every other name belongs to a problem
+SOLVE_ARGUMENTS = _arguments(SolveParameters.__init__)
+
+
+# Returns the list of scenarios of a sweep spec, each one is a dict with its
+# `index`, `problem` and `arguments` (by their lower case names)
+def expand_sweep(spec):
+    problems = spec.get('problems', list(PROBLEMS))
+    for problem in problems:
+        if problem not in PROBLEMS:
+            raise ValueError(f'Unknown problem `{problem}`, must be one of '
+                             f'{tuple(PROBLEMS)}')
+    sweep = {name.lower(): list(values)
+             for name, values in spec.get('sweep', {}).items()}
+    fixed = {name.lower(): value
+             for name, value in spec.get('fixed', {}).items()}
+    known = set(SOLVE_ARGUMENTS)
+    for problem in problems:
+        known.update(_arguments(PROBLEMS[problem]))
+    for name in list(sweep) + list(fixed):
+        if name not in known:
+            raise ValueError(f'Unknown parameter `{name}`, must be one of '
+                             f'{tuple(sorted(known))}')
+    scenarios = []
+    for problem in problems:
+        takes = set(_arguments(PROBLEMS[problem])) | set(SOLVE_ARGUMENTS)
+        axes = [name for name in sweep if name in takes]
+        for values in itertools.product(*(sweep[name] for name in axes)):
+            arguments = {name: value for name, value in fixed.items()
+                         if name in takes}
+            arguments.update(zip(axes, values))
+            scenarios.append({
+                'index': len(scenarios),
+                'problem': problem,
+                'arguments': arguments,
+            })
+    return scenarios
+
+
+# The estimated peak memory of a scenario in MB, from the size of its grid
+def estimate_memory(scenario):
+    function = PROBLEMS[scenario['problem']]
+    arguments = {name: parameter.default for name, parameter in
+                 inspect.signature(function).parameters.items()}
+    arguments.update(scenario['arguments'])
+    # The bounds of both axes, such as `x_bounds` and `y_bounds`
+    points = np.prod([len(init_coords(value, arguments['h_step_size']))
+                      for name, value in arguments.items()
+                      if name.endswith('_bounds')])
+    solver = arguments.get('solver', 'jacobi')
+    # An out-of-core problem and solver only keep a few tiles in memory
+    if solver == 'out_of_core' and arguments.get('directory') is not None:
+        return BASE_MEMORY_MB + 2 * arguments.get('tile_mb', TILE_MB)
+    per_point = MEMORY_PER_POINT.get(solver, max(MEMORY_PER_POINT.values()))
+    # A time budget also solves a double precision copy of the field
+    if arguments.get('time_budget') is not None:
+        per_point += 8
+    return BASE_MEMORY_MB + points * per_point / 2**20
+
+
+# The physical memory of the machine in MB, `None` when it is not known
+def physical_memory():
+    try:
+        return (os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') /
+                2**20)
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+# Solves one scenario (in a worker process) and returns its record. The field
+# is saved in `out_dir` when it is given.
+def run_scenario(scenario, out_dir=None):
+    start = time.perf_counter()
+    function = PROBLEMS[scenario['problem']]
+    takes = _arguments(function)
+    problem = function(**{name: value for name, value in
+                          scenario['arguments'].items() if name in takes})
+    parameters = SolveParameters(**{
+        name: value for name, value in scenario['arguments'].items()
+        if name not in takes})
+    solve_start = time.perf_counter()
+    result = solve(problem, parameters)
+    record = dict(scenario)
+    record.update({
+        'status': 'ok',
+        'points': int(problem.field.size),
+        'iterations': int(result.iterations),
+        'converged': bool(result.converged),
+        'residual': float(result.residual),
+        'solve_seconds': time.perf_counter() - solve_start,
+    })
+    if result.error_estimates is not None:
+        record.update({name: np.asarray(value).item() for name, value in
+                       result.error_estimates.items()})
+    if out_dir is not None:
+        filename = f'scenario_{scenario["index"]:04}.npz'
+        save(problem, result, os.path.join(out_dir, filename))
+        record['filename'] = filename
+    record['seconds'] = time.perf_counter() - start
+    record['peak_memory_mb'] = peak_memory()
+    return record
+
+
+# Every scenario gets a new worker. Where there is a fork server, the workers
+# are forked from it after it imports the package, which saves importing
+# `numpy` again for every scenario.
+def _executor(workers):
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+    else:
+        context = multiprocessing.get_context('spawn')
+    try:
+        return ProcessPoolExecutor(workers, context, max_tasks_per_child=1)
+    except TypeError:
+        # Before Python 3.11 the workers are reused, so the peak memory of a
+        # scenario is the peak of its worker so far
+        return ProcessPoolExecutor(workers, context)
+
+
+# Runs every scenario of a sweep spec and writes their records to
+# `RESULTS_FILENAME` in `out_dir` (along with the field of every scenario when
+# the spec does not turn `save_fields` off).
+# Arguments:
+#   workers: the max number of scenarios that run at once, defaults to the
+#            number of cores
+#   memory_budget_mb: the max total estimated memory of the scenarios that run
+#                     at once, defaults to MEMORY_FRACTION of the physical
+#                     memory. A scenario that does not fit on its own still
+#                     runs, but by itself.
+#   log: called with a line for every finished scenario, `None` is silent
+# Returns the records in the order of the scenarios.
+def run_sweep(spec, out_dir, workers=None, memory_budget_mb=None, log=print):
+    start = time.perf_counter()
+    scenarios = expand_sweep(spec)
+    workers = max(int(workers or os.cpu_count() or 1), 1)
+    if memory_budget_mb is None:
+        memory = physical_memory()
+        memory_budget_mb = (float('inf') if memory is None else
+                            memory * MEMORY_FRACTION)
+    os.makedirs(out_dir, exist_ok=True)
+    fields_dir = out_dir if spec.get('save_fields', True) else None
+    memory = {scenario['index']: spec.get('memory_mb') or
+              estimate_memory(scenario) for scenario in scenarios}
+    pending = list(scenarios)
+    running = {}
+    records = []
+    executor = _executor(workers)
+    try:
+        while pending or running:
+            # Start the pending scenarios that fit (in order, skipping the ones
+            # that do not fit yet), at least one scenario is always running
+            used = sum(memory[scenario['index']]
+                       for scenario in running.values())
+            for scenario in list(pending):
+                if len(running) >= workers:
+                    break
+                needed = memory[scenario['index']]
+                if running and used + needed > memory_budget_mb:
+                    continue
+                future = executor.submit(run_scenario, scenario, fields_dir)
+                running[future] = scenario
+                used += needed
+                pending.remove(scenario)
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                scenario = running.pop(future)
+                try:
+                    record = future.result()
+                except BrokenProcessPool as error:
+                    # A worker was killed (such as by running out of memory),
+                    # which stops the whole pool
+                    broken = True
+                    record = dict(scenario, status='failed', error=repr(error))
+                except Exception as error:
+                    record = dict(scenario, status='failed', error=repr(error))
+                record['estimated_memory_mb'] = memory[scenario['index']]
+                records.append(record)
+                if log is not None:
+                    log(_summary(record))
+            if broken:
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = _executor(workers)
+    finally:
+        executor.shutdown()
+    records.sort(key=lambda record: record['index'])
+    with open(os.path.join(out_dir, RESULTS_FILENAME), 'w') as results_file:
+        json.dump({
+            'spec': spec,
+            'workers': workers,
+            'memory_budget_mb': memory_budget_mb,
+            'seconds': time.perf_counter() - start,
+            'results': records,
+        }, results_file, indent=2)
+    return records
+
+
+def _summary(record):
+    arguments = ' '.join(f'{name}={value}'
+                         for name, value in record['arguments'].items())
+    line = f'[{record["index"]:4}] {record["problem"]:8} {arguments}'
+    if record['status'] != 'ok':
+        return f'{line}  {record["status"]}: {record["error"]}'
+    line += f'  {record["seconds"]:.3f} s'
+    if record['peak_memory_mb'] is not None:
+        line += f'  {record["peak_memory_mb"]:.1f} MB'
+    return f'{line}  {record["iterations"]} iterations'
@@ -0,0 +1,165 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Analytical Series
+# The analytical series of the homework as functions, which return the
+# coordinates and fields that the series scripts plot and save. Nothing here
+# imports `matplotlib`.
+# ==============================================================================
+import numpy as np
+
+from .problems import init_coords
+
+
+# Section 2.10, the series for the box with a sine on the bottom. A threshold
+# of `inf` uses only the first term of the series.
+def sine_series_2_10(h_step_size=0.02, x_bounds=(0, 1), y_bounds=(0, 5),
+                     threshold=np.inf, field_dtype='float32'):
+    x_coords = init_coords(x_bounds, h_step_size)
+    y_coords = init_coords(y_bounds, h_step_size)
+    field = np.full((len(y_coords), len(x_coords)), 1).astype(field_dtype)
+    for x_idx, x_val in enumerate(x_coords):
+        # Handle the case of y = 0 differently, this is the boundary condition
+        field[0, x_idx] = np.sin(np.pi * x_val / x_bounds[1])
+        for y_idx, y_val in enumerate(y_coords[1:]):
+            n = 1
+            pixel_value = 0
+            while True:
+                shared = n * np.pi / x_bounds[1]
+                iter_val = np.exp(-shared * y_val) * np.sin(shared * x_val) / n
+                pixel_value += iter_val
+                if iter_val < threshold:
+                    break
+                n += 2
+            # Scaling like in the textbook skewes the matchup
+            # pixel_value *= 4 / np.pi
+            field[y_idx + 1, x_idx] = pixel_value
+    return x_coords, y_coords, field
+
+
+# Section 2.11, the first term of the series for the wedge at `beta_angle`
+# (in degrees)
+def wedge_series_2_11(h_step_size=0.02, beta_angle=35, x_bounds=(0, 2),
+                      y_bounds=(0, 1), field_dtype='float32'):
+    x_coords = init_coords(x_bounds, h_step_size)
+    y_coords = init_coords(y_bounds, h_step_size)
+    field = np.full((len(y_coords), len(x_coords)), 0).astype(field_dtype)
+    beta = np.radians(beta_angle)
+    pi_over_beta = np.pi / beta
+    for x_idx, x_val in enumerate(x_coords[1:]):
+        for y_idx, y_val in enumerate(y_coords[1:]):
+            rho = np.sqrt(x_val**2 + y_val**2)
+            phi = np.arctan(y_val / x_val)
+            if phi > beta:
+                pixel_value = 0
+            else:
+                pixel_value = rho**(pi_over_beta) * np.sin(phi * pi_over_beta)
+            field[y_idx, x_idx] = pixel_value
+    return x_coords, y_coords, field
+
+
+# Legendre of degree n integrated between 0 and 1
+def _legendre_int(n):
+    basis = np.polynomial.legendre.Legendre.basis(n, domain=[0, 1],
+                                                  window=[0, 1])
+    return np.sum(basis.integ(1).coef)
+
+
+# Figure 3.2, the Legendre series of the step function. Terms are added to
+# every point until one is below `threshold` (or past the 100th degree).
+def legendre_series_v1(h_step_size=0.01, x_bounds=(-1, 1), threshold=1e-6):
+    x_coords = init_coords(x_bounds, h_step_size)
+    field = np.full(len(x_coords), 1).astype('float32')
+    for x_idx, x_val in enumerate(x_coords):
+        if x_idx == 0:
+            field[x_idx] = -1
+            continue
+        n = 1
+        pixel_value = 0
+        while True:
+            # Equations 3.25 and 3.23
+            basis = np.polynomial.legendre.Legendre.basis(n)
+            iter_val = ((2 * n + 1) * _legendre_int(n) *
+                        basis.linspace(1, [x_val, x_val])[1][0])
+            pixel_value += iter_val
+            if abs(iter_val) < threshold or n > 100:
+                break
+            n += 2
+        field[x_idx] = pixel_value
+    return x_coords, field
+
+
+# Figure 3.2, the Legendre series of the step function for every number of
+# terms up to `n_terms` (each row of the field adds one more term)
+def legendre_series_v2(h_step_size=0.01, x_bounds=(-1, 1), n_terms=100):
+    x_coords = init_coords(x_bounds, h_step_size)
+    x_steps = len(x_coords)
+    field = np.full([n_terms, x_steps], 1).astype('float32')
+    Legendre = np.polynomial.legendre.Legendre
+    for n_idx in range(n_terms):
+        # Equation 3.25
+        A_n = (2 * n_idx + 1) * _legendre_int(n_idx)
+        # Equation 3.23
+        x_vals = A_n * Legendre.basis(n_idx).linspace(x_steps, x_bounds)[1]
+        # Add on the previous terms
+        if n_idx > 0:
+            x_vals += field[n_idx - 1, :]
+        field[n_idx, :] = x_vals
+    # Field was between 0 and 2
+    field -= 1
+    return x_coords, field
+
+
+# Equations 2.22 and 3.33, the potential along the z-axis outside of a sphere
+# with its hemispheres held at opposite potentials, between the `bounds` (from
+# the radius out to 20 by default). Returns the coordinates and the field of
+# both equations.
+def sphere_2_22_3_33(step_size=0.01, radius=1, bounds=None, n_terms=100):
+    if bounds is None:
+        bounds = [radius, 20]
+    coords = init_coords(bounds, step_size)
+    radius_sq = radius**2
+    # Equation 2.22
+    numerator = coords**2 - radius_sq
+    denominator = coords * (coords**2 + radius_sq)**0.5
+    field_2_22 = 1 - (numerator / denominator)
+    # Equation 3.33, the infinite series solution
+    field_3_33 = np.full(len(coords), 0).astype('float32')
+    for term, n_idx in enumerate(range(1, n_terms * 2, 2)):
+        rad_over_z = (radius / coords)**(n_idx + 1)
+        # Technically, we should be dividing by the LCD of each Legendre
+        # polynomial, but I could not figure out how to easily obtain this.
+        coef = ((2 * n_idx) + 1) / (2**n_idx)
+        term_val = rad_over_z * coef
+        if term % 2 == 1:
+            term_val *= -1
+        field_3_33 += term_val
+    return coords, field_2_22, field_3_33
+
+
+# Equation 3.36, the potential (for hemispheres at +-1 volt) outside of the
+# sphere of equations 2.22 and 3.33 on a grid of radii `r_coords` (the columns)
+# and heights `z_coords` (the rows), from the first `n_terms` odd terms of:
+#   sum(A_l * (radius / distance)^(l + 1) * P_l(cos(theta)))
+#   A_l = (-1 / 2)^((l - 1) / 2) * (2 l + 1) * (l - 2)!! / (2 * ((l + 1) / 2)!)
+# Points inside of the sphere are given the potential of their hemisphere.
+def sphere_exterior_3_36(r_coords, z_coords, radius=1, n_terms=20):
+    r_mesh, z_mesh = np.meshgrid(r_coords, z_coords)
+    distance = np.hypot(r_mesh, z_mesh)
+    outside = distance >= radius
+    distance = np.where(outside, distance, radius)
+    cos_theta = z_mesh / distance
+    field = np.zeros(distance.shape)
+    # (l - 2)!! and ((l + 1) / 2)! for l = 1
+    double_factorial = 1
+    factorial = 1
+    for term in range(n_terms):
+        n_idx = 2 * term + 1
+        if term > 0:
+            double_factorial *= n_idx - 2
+            factorial *= term + 1
+        coef = ((-0.5)**term * (2 * n_idx + 1) * double_factorial /
+                (2 * factorial))
+        basis = np.polynomial.legendre.Legendre.basis(n_idx)
+        field += coef * (radius / distance)**(n_idx + 1) * basis(cos_theta)
+    return np.where(outside, field, np.sign(z_mesh))
@@ -0,0 +1,56 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Solver Selection
+# The relaxation scripts pick their solver by name through `make_kernel`.
+# ==============================================================================
+from .compact import CompactKernel
+from .fast_poisson import FastPoissonSolver
+from .kernel import RelaxationKernel
+from .krylov import KrylovSolver
+from .mixed import MixedPrecisionSolver
+from .multigrid import MultigridSolver
+from .out_of_core import OutOfCoreKernel
+from .sor import SORKernel
+from .threaded import ThreadedKernel
+
+KERNELS = {
+    'jacobi': RelaxationKernel,
+    'compact': CompactKernel,
+    'threaded': ThreadedKernel,
+    'sor': SORKernel,
+    'multigrid': MultigridSolver,
+    'mixed': MixedPrecisionSolver,
+    'fast': FastPoissonSolver,
+    'krylov': KrylovSolver,
+    'out_of_core': OutOfCoreKernel,
+}
+
+# All of the solver names, including the ones with optional dependencies
+SOLVERS = tuple(KERNELS) + ('sparse',)
+
+
+# Build the kernel for the `solver` name. Any extra options (such as `omega`
+# for the `sor` solver or `cycle` for `multigrid`) are passed through to the
+# kernel.
+def make_kernel(solver, field, inner_mask, relaxation_constant=0,
+                epsilon_field=None, **options):
+    if solver not in SOLVERS:
+        raise ValueError(
+            f'Unknown solver `{solver}`, must be one of {SOLVERS}')
+    if solver == 'sparse':
+        # Only imported when used since it needs `scipy`
+        from .sparse import SparseSolver
+        kernel_class = SparseSolver
+    else:
+        kernel_class = KERNELS[solver]
+    if epsilon_field is not None:
+        options['epsilon_field'] = epsilon_field
+    return kernel_class(field, inner_mask, relaxation_constant, **options)
+
+
+# Stop the threads of a kernel that has any (see `ThreadedKernel.close`)
+def close_kernel(kernel):
+    close = getattr(kernel, 'close', None)
+    if close is not None:
+        close()
@@ -0,0 +1,282 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Red-Black Successive Over-Relaxation
+# The grid is split into a checkerboard. All of the red points only depend on
+# black points (and vice versa), so each color can be updated at once with
+# NumPy while still using the newest values like Gauss-Seidel does. The update
+# is then pushed further than the plain average by the factor omega.
+# ==============================================================================
+import numpy as np
+
+from .convergence import NORMS, iterate
+from .dielectric import DielectricOperator
+from .kernel import reflect
+
+# The number of sweeps between each estimate of the spectral radius when omega
+# is set to `estimate`
+ESTIMATE_SWEEPS = 30
+
+# Omega is no longer estimated once a new estimate changes it by less than
+# this fraction of the distance to 2
+ESTIMATE_SETTLED = 0.05
+
+
+# The Jacobi spectral radius for a rectangle with `rows` by `cols` points that
+# are being relaxed (the boundary is one point past each side)
+def jacobi_spectral_radius(rows, cols):
+    return (np.cos(np.pi / (rows + 1)) + np.cos(np.pi / (cols + 1))) / 2
+
+
+# Optimal over-relaxation factor given the Jacobi spectral radius:
+#   omega = 2 / (1 + sqrt(1 - rho^2))
+def optimal_omega(spectral_radius):
+    rho_sq = min(spectral_radius**2, 1 - 1e-12)
+    return 2 / (1 + np.sqrt(1 - rho_sq))
+
+
+# The Jacobi spectral radius of the box that surrounds all of the inner points.
+# For irregular domains the true spectral radius is a bit smaller.
+def grid_spectral_radius(inner_mask):
+    rows = np.flatnonzero(np.any(inner_mask, axis=1))
+    cols = np.flatnonzero(np.any(inner_mask, axis=0))
+    if len(rows) == 0:
+        return 0.0
+    return jacobi_spectral_radius(rows[-1] - rows[0] + 1,
+                                  cols[-1] - cols[0] + 1)
+
+
+# Omega from the spectral radius of the box around the inner points, which only
+# makes this omega slightly too large for irregular domains (it still converges)
+def grid_omega(inner_mask):
+    return optimal_omega(grid_spectral_radius(inner_mask))
+
+
+class _Lattice:
+
+    # One of the four strided sub-grids, (`row`, `col`) gives the parity of the
+    # rows and columns that belong to it. Any leading axes of `padded` hold a
+    # stack of fields.
+    def __init__(self, padded, inner_mask, weights, relaxation_constant, row,
+                 col):
+        rows, cols = inner_mask.shape[-2:]
+        row_slice = slice(1 + row, rows + 1, 2)
+        col_slice = slice(1 + col, cols + 1, 2)
+        self.center = padded[..., row_slice, col_slice]
+        self.top = padded[..., row:rows:2, col_slice]
+        self.bottom = padded[..., 2 + row:rows + 2:2, col_slice]
+        self.left = padded[..., row_slice, col:cols:2]
+        self.right = padded[..., row_slice, 2 + col:cols + 2:2]
+        self.mask = np.ascontiguousarray(inner_mask[..., row::2, col::2])
+        self.weights = None
+        if weights is not None:
+            self.weights = [
+                np.ascontiguousarray(w[..., row::2, col::2]) for w in weights
+            ]
+        # A relaxation constant that varies across the grid is kept as a view so
+        # that changes to it are seen by the lattice
+        self.source = None
+        if isinstance(relaxation_constant, np.ndarray):
+            self.source = relaxation_constant[..., row::2, col::2]
+        self.summed = np.empty(self.center.shape, dtype=padded.dtype)
+        self.scratch = np.empty(self.center.shape, dtype=padded.dtype)
+
+
+class SORKernel:
+
+    # Same arguments as the `RelaxationKernel` with the addition of:
+    #   epsilon_field: when given, the variable epsilon update is used
+    # The relaxation constant can also be an array with the shape of the field.
+    #   omega: the over-relaxation factor, `None` picks it from the grid
+    #          dimensions and `estimate` measures it while iterating
+    #   dtype: the precision of the working copy and the updates
+    #   mirror: the ghost rows of the working copy are kept as mirror images,
+    #           same as the `RelaxationKernel`
+    def __init__(self, field, inner_mask, relaxation_constant=0,
+                 epsilon_field=None, omega=None, dtype='float64',
+                 mirror=None):
+        self.field = field
+        self.inner_mask = inner_mask
+        self.relaxation_constant = relaxation_constant
+        self.inner_count = max(int(np.count_nonzero(inner_mask)), 1)
+        # Working copy of the field with a ring of zero potential around it
+        self.padded = np.zeros(np.add(field.shape, 2), dtype=dtype)
+        self.padded[1:-1, 1:-1] = field
+        self.mirror = mirror
+        self.operator = None
+        self.weights = None
+        if epsilon_field is not None:
+            self.operator = DielectricOperator(epsilon_field, dtype)
+            self.weights = self.operator.weights
+        # Red points are the (even, even) and (odd, odd) sub-grids
+        self.lattices = [
+            _Lattice(self.padded, inner_mask, self.weights,
+                     relaxation_constant, row, col)
+            for row, col in ((0, 0), (1, 1), (0, 1), (1, 0))
+        ]
+        # Only allocated once the full residual is first computed
+        self.scratch = None
+        self.estimating = omega == 'estimate'
+        self.residuals = []
+        # Omega is kept as a Python float, so that a single precision working
+        # copy is also updated in single precision
+        if self.estimating:
+            self.omega = 1.0
+        elif omega is None:
+            self.omega = float(grid_omega(inner_mask))
+        else:
+            self.omega = float(omega)
+
+    def _add_source(self, lattice, summed):
+        if lattice.source is not None:
+            np.add(summed, lattice.source, out=summed)
+        elif self.relaxation_constant != 0:
+            np.add(summed, self.relaxation_constant, out=summed)
+
+    def _relax_lattice(self, lattice, track):
+        # The ghost rows follow the points that were updated by the last lattice
+        if self.mirror is not None:
+            reflect(self.padded[1:-1, 1:-1], self.mirror)
+        summed = lattice.summed
+        if lattice.weights is None:
+            np.add(lattice.top, lattice.bottom, out=summed)
+            np.add(summed, lattice.left, out=summed)
+            np.add(summed, lattice.right, out=summed)
+            self._add_source(lattice, summed)
+            np.multiply(summed, 0.25, out=summed)
+        else:
+            top_w, bottom_w, left_w, right_w, weight_sum = lattice.weights
+            scratch = lattice.scratch
+            np.multiply(lattice.top, top_w, out=summed)
+            np.multiply(lattice.bottom, bottom_w, out=scratch)
+            np.add(summed, scratch, out=summed)
+            np.multiply(lattice.left, left_w, out=scratch)
+            np.add(summed, scratch, out=summed)
+            np.multiply(lattice.right, right_w, out=scratch)
+            np.add(summed, scratch, out=summed)
+            self._add_source(lattice, summed)
+            np.divide(summed, weight_sum, out=summed)
+        # The residual (divided by the diagonal) of the points
+        np.subtract(summed, lattice.center, out=summed)
+        residual = None
+        if track:
+            np.multiply(summed, lattice.mask, out=lattice.scratch)
+            residual = (
+                max(lattice.scratch.max(initial=0),
+                    -lattice.scratch.min(initial=0)),
+                np.vdot(lattice.scratch, lattice.scratch),
+            )
+        np.multiply(summed, self.omega, out=summed)
+        np.add(summed, lattice.center, out=summed)
+        np.copyto(lattice.center, summed, where=lattice.mask)
+        return residual
+
+    def sweep(self, norm=None):
+        if norm is not None and norm not in NORMS:
+            raise ValueError(f'Unknown norm `{norm}`, must be one of {NORMS}')
+        track = norm is not None or self.estimating
+        residuals = [self._relax_lattice(lat, track) for lat in self.lattices]
+        np.copyto(self.field, self.padded[1:-1, 1:-1], casting='same_kind',
+                  where=self.inner_mask)
+        if not track:
+            return None
+        max_norm = float(max(res[0] for res in residuals))
+        l2_norm = float(np.sqrt(sum(res[1] for res in residuals) /
+                                self.inner_count))
+        if self.estimating:
+            self._estimate_omega(l2_norm)
+        return max_norm if norm == 'max' else l2_norm
+
+    # Sweeps that only update the working copy, the field is not written to
+    def smooth(self, sweeps):
+        for i in range(sweeps):
+            for lattice in self.lattices:
+                self._relax_lattice(lattice, False)
+
+    # The sum of the weighted neighbors minus the weighted center point of
+    # `padded` (which has a ring of zeros around the grid) written to `out`:
+    #   sum(weight * V_neighbor) - sum(weight) * V
+    def apply_stencil(self, padded, out):
+        center = padded[1:-1, 1:-1]
+        neighbors = (padded[:-2, 1:-1], padded[2:, 1:-1], padded[1:-1, :-2],
+                     padded[1:-1, 2:])
+        if self.scratch is None:
+            self.scratch = np.empty(center.shape, dtype=self.padded.dtype)
+        scratch = self.scratch
+        if self.weights is None:
+            np.add(neighbors[0], neighbors[1], out=out)
+            np.add(out, neighbors[2], out=out)
+            np.add(out, neighbors[3], out=out)
+            np.multiply(center, 4, out=scratch)
+        else:
+            np.multiply(neighbors[0], self.weights[0], out=out)
+            for neighbor, weight in zip(neighbors[1:], self.weights[1:4]):
+                np.multiply(neighbor, weight, out=scratch)
+                np.add(out, scratch, out=out)
+            np.multiply(center, self.weights[4], out=scratch)
+        np.subtract(out, scratch, out=out)
+        return out
+
+    # The residual of the working copy written to `out` (zero at every point
+    # that is not relaxed):
+    #   relaxation_constant + sum(weight * V_neighbor) - sum(weight) * V
+    def residual(self, out):
+        if self.mirror is not None:
+            reflect(self.padded[1:-1, 1:-1], self.mirror)
+        self.apply_stencil(self.padded, out)
+        np.add(out, self.relaxation_constant, out=out)
+        np.multiply(out, self.inner_mask, out=out)
+        return out
+
+    # The sum of the weights around every point (the diagonal of the system)
+    def diagonal(self):
+        return 4 if self.weights is None else self.weights[4]
+
+    # Below the optimal omega the residual shrinks by a real factor `lambda`
+    # every sweep, which is related to the Jacobi spectral radius by:
+    #   rho = (lambda + omega - 1) / (omega * sqrt(lambda))
+    # Starting from Gauss-Seidel (omega = 1), omega is raised with each new
+    # estimate until it stops changing. The estimates approach the optimal
+    # omega from below, so the convergence factor stays measurable.
+    def _estimate_omega(self, residual):
+        self.residuals.append(residual)
+        if len(self.residuals) < ESTIMATE_SWEEPS:
+            return
+        ratios = np.divide(self.residuals[-5:], self.residuals[-6:-1])
+        factor = float(np.clip(np.median(ratios), 1e-12, 1))
+        omega = self.omega
+        spectral_radius = (factor + omega - 1) / (omega * np.sqrt(factor))
+        new_omega = max(optimal_omega(min(spectral_radius, 1)), omega)
+        self.residuals = []
+        self.omega = float(new_omega)
+        # Stop once omega has (relatively) settled
+        if new_omega - omega < ESTIMATE_SETTLED * (2 - new_omega):
+            self.estimating = False
+
+    def run(self, iterations):
+        for i in range(iterations):
+            self.sweep()
+        return self.field
+
+    # The working copy can have more precision than the field, and the omega
+    # estimate depends on the residuals since its last update
+    def state(self):
+        return {
+            'padded': self.padded,
+            'omega': self.omega,
+            'estimating': self.estimating,
+            'residuals': np.array(self.residuals, dtype='float64'),
+        }
+
+    def restore(self, state):
+        self.padded[...] = state['padded']
+        self.omega = float(state['omega'])
+        self.estimating = bool(state['estimating'])
+        self.residuals = [float(val) for val in state['residuals']]
+        np.copyto(self.field, self.padded[1:-1, 1:-1], casting='same_kind',
+                  where=self.inner_mask)
+
+    def solve(self, max_iterations, tolerance=None, check_every=10,
+              norm='max', checkpoint=None, profiler=None):
+        return iterate(self, max_iterations, tolerance, check_every, norm,
+                       checkpoint=checkpoint, profiler=profiler)
@@ -0,0 +1,263 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Sparse Matrix Backend
+# The relaxation update is a fixed-point iteration for a linear system, so the
+# system can also be built directly and solved in one go. Only the points inside
+# of the boundary are unknowns, each one has a row:
+#   sum(weight) * V - sum(weight * V_neighbor) = relaxation_constant
+# where the neighbors that are boundary points are moved to the right hand side.
+# Requires `scipy` (1.12 or newer).
+# ==============================================================================
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+
+from .convergence import NORMS, RelaxationResult
+from .dielectric import DielectricOperator
+from .multigrid import MultigridSolver
+
+METHODS = ('cg', 'direct')
+PRECONDITIONERS = (None, 'jacobi', 'ilu', 'multigrid')
+
+# Relative tolerance used by conjugate gradient when no tolerance is given
+DEFAULT_RTOL = 1e-12
+
+# Options for the incomplete LU factorization. Conjugate gradient needs a
+# symmetric preconditioner, so the rows and columns are kept in their natural
+# order without pivoting and entries are only dropped by their size.
+ILU_OPTIONS = {
+    'drop_tol': 1e-4,
+    'fill_factor': 10,
+    'permc_spec': 'NATURAL',
+    'diag_pivot_thresh': 0,
+    'options': {
+        'Equil': False,
+        'ILU_DropRule': 'BASIC',
+        'ILU_MILU': 'SILU',
+    },
+}
+
+# (row, col) offsets of the top, bottom, left and right neighbors
+_OFFSETS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+
+class SparseSystem:
+
+    # The matrix for the inner points of a geometry. It only depends on the
+    # inner mask and epsilon field, so it (and any factorization of it) can be
+    # reused for different boundary values or relaxation constants.
+    def __init__(self, inner_mask, epsilon_field=None):
+        self.inner_mask = inner_mask
+        self.shape = inner_mask.shape
+        self.rows, self.cols = np.nonzero(inner_mask)
+        self.size = len(self.rows)
+        # The unknown number of every inner point (-1 for everything else)
+        self.index = np.full(self.shape, -1, dtype='int64')
+        self.index[self.rows, self.cols] = np.arange(self.size)
+        self.epsilon_field = epsilon_field
+        if epsilon_field is None:
+            self.face_weights = [np.ones(self.size)] * 4
+            self.diagonal = np.full(self.size, 4.0)
+        else:
+            weights = DielectricOperator(epsilon_field).weights
+            self.face_weights = [w[self.rows, self.cols] for w in weights[:4]]
+            self.diagonal = weights[4][self.rows, self.cols]
+        self.matrix = self._assemble()
+        # Built the first time they are needed
+        self.factor = None
+        self.preconditioners = {}
+
+    # The neighbor in the direction of `offset` for every unknown. Returns the
+    # grid positions and a mask of the neighbors that are inside of the grid.
+    def _neighbors(self, offset):
+        rows = self.rows + offset[0]
+        cols = self.cols + offset[1]
+        inside = ((rows >= 0) & (rows < self.shape[0]) & (cols >= 0) &
+                  (cols < self.shape[1]))
+        return np.where(inside, rows, 0), np.where(inside, cols, 0), inside
+
+    def _assemble(self):
+        unknowns = np.arange(self.size)
+        matrix_rows = [unknowns]
+        matrix_cols = [unknowns]
+        values = [self.diagonal]
+        for offset, weight in zip(_OFFSETS, self.face_weights):
+            rows, cols, inside = self._neighbors(offset)
+            neighbor = np.where(inside, self.index[rows, cols], -1)
+            coupled = neighbor >= 0
+            matrix_rows.append(unknowns[coupled])
+            matrix_cols.append(neighbor[coupled])
+            values.append(-weight[coupled])
+        return sp.csr_matrix(
+            (np.concatenate(values),
+             (np.concatenate(matrix_rows), np.concatenate(matrix_cols))),
+            shape=(self.size, self.size),
+        )
+
+    # The right hand side for the boundary values in `field`, the points
+    # outside of the grid are zero potential
+    def rhs(self, field, relaxation_constant=0):
+        if isinstance(relaxation_constant, np.ndarray):
+            relaxation_constant = relaxation_constant[self.rows, self.cols]
+        rhs = np.zeros(self.size) + relaxation_constant
+        for offset, weight in zip(_OFFSETS, self.face_weights):
+            rows, cols, inside = self._neighbors(offset)
+            boundary = inside & ~self.inner_mask[rows, cols]
+            rhs[boundary] += weight[boundary] * field[rows, cols][boundary]
+        return rhs
+
+    def _preconditioner(self, name):
+        if name is None:
+            return None
+        if name in self.preconditioners:
+            return self.preconditioners[name]
+        if name == 'jacobi':
+            inverse = 1 / self.diagonal
+            operator = lambda vec: inverse * vec
+        elif name == 'ilu':
+            operator = spla.spilu(self.matrix.tocsc(), **ILU_OPTIONS).solve
+        elif name == 'multigrid':
+            # One V-cycle on the same geometry approximates the inverse. The
+            # step length would make the V-cycle nonlinear, which conjugate
+            # gradient does not handle well.
+            multigrid = MultigridSolver(np.zeros(self.shape), self.inner_mask,
+                                        0, self.epsilon_field,
+                                        step_length=False)
+            grid = np.zeros(self.shape)
+
+            def operator(vec):
+                grid[self.rows, self.cols] = vec
+                return multigrid.vcycle(grid)[self.rows, self.cols]
+        else:
+            raise ValueError(f'Unknown preconditioner `{name}`, must be one '
+                             f'of {PRECONDITIONERS}')
+        self.preconditioners[name] = spla.LinearOperator(
+            self.matrix.shape, matvec=operator, dtype='float64')
+        return self.preconditioners[name]
+
+    # The residual divided by the diagonal, which is the same update that a
+    # Jacobi sweep would make
+    def residual_norm(self, solution, rhs, norm='max'):
+        scaled = (rhs - self.matrix @ solution) / self.diagonal
+        if norm == 'max':
+            return float(np.abs(scaled).max(initial=0))
+        if norm == 'l2':
+            return float(np.sqrt(np.vdot(scaled, scaled) / max(self.size, 1)))
+        raise ValueError(f'Unknown norm `{norm}`, must be one of {NORMS}')
+
+    # Solve the system for `rhs`. With `cg` the iterations stop once the
+    # residual (divided by the diagonal) is below `tolerance` in every point.
+    # The `direct` factorization is kept for the next solve. Returns the
+    # solution, the number of iterations and the `info` of `spla.cg` (zero once
+    # converged, the number of iterations when it ran out of them). The
+    # `direct` solve always has an `info` of zero.
+    def solve(self, rhs, method='cg', preconditioner='multigrid',
+              tolerance=None, max_iterations=None, initial=None,
+              callback=None):
+        if method == 'direct':
+            if self.factor is None:
+                self.factor = spla.splu(self.matrix.tocsc())
+            return self.factor.solve(rhs), 1, 0
+        if method != 'cg':
+            raise ValueError(f'Unknown method `{method}`, must be one of '
+                             f'{METHODS}')
+        iterations = 0
+
+        def _count(solution):
+            nonlocal iterations
+            iterations += 1
+            if callback is not None:
+                callback(iterations, solution)
+
+        # A residual below `tolerance * diagonal` (in the 2-norm) guarantees
+        # that every point is below the tolerance
+        if tolerance is None:
+            rtol, atol = DEFAULT_RTOL, 0.0
+        else:
+            rtol, atol = 0.0, tolerance * float(self.diagonal.min())
+        solution, info = spla.cg(self.matrix, rhs, x0=initial, rtol=rtol,
+                                 atol=atol, maxiter=max_iterations,
+                                 M=self._preconditioner(preconditioner),
+                                 callback=_count)
+        return solution, iterations, info
+
+
+class SparseSolver:
+
+    # Same arguments as the `SORKernel` with the addition of:
+    #   method: `cg` (preconditioned conjugate gradient) or `direct` (sparse
+    #           LU factorization)
+    #   preconditioner: for `cg`, one of `jacobi`, `ilu`, `multigrid` or `None`
+    #   system: an existing `SparseSystem` for the same geometry to reuse
+    def __init__(self, field, inner_mask, relaxation_constant=0,
+                 epsilon_field=None, method='cg', preconditioner='multigrid',
+                 system=None):
+        self.field = field
+        self.inner_mask = inner_mask
+        self.relaxation_constant = relaxation_constant
+        self.method = method
+        self.preconditioner = preconditioner
+        if system is None:
+            system = SparseSystem(inner_mask, epsilon_field)
+        self.system = system
+
+    # Do the whole solve, any further call starts from the last solution
+    def sweep(self, norm=None):
+        result = self._solve(None, None, norm)
+        if norm is not None:
+            return result.residual
+
+    def _solve(self, max_iterations, tolerance, norm, check_every=1,
+               profiler=None):
+        if profiler is not None and not profiler.enabled:
+            profiler = None
+        if profiler is not None:
+            profiler.start_solve(self)
+        system = self.system
+        rhs = system.rhs(self.field, self.relaxation_constant)
+        initial = self.field[system.rows, system.cols].astype('float64')
+        history = []
+
+        def _record(iterations, solution):
+            if iterations % check_every == 0:
+                history.append(
+                    (iterations, system.residual_norm(solution, rhs, norm)))
+                if profiler is not None:
+                    profiler.sweep(*history[-1])
+
+        solution, iterations, info = system.solve(rhs, self.method,
+                                                  self.preconditioner,
+                                                  tolerance, max_iterations,
+                                                  initial,
+                                                  _record if norm else None)
+        self.field[system.rows, system.cols] = solution
+        residual = system.residual_norm(solution, rhs, norm or 'max')
+        if not history or history[-1][0] != iterations:
+            history.append((iterations, residual))
+        # Conjugate gradient reports whether it reached its tolerance, which
+        # is the default relative one when no tolerance is given
+        converged = info == 0 and (tolerance is None or residual <= tolerance)
+        result = RelaxationResult(self.field, iterations,
+                                  np.array(history).reshape(-1, 2), converged,
+                                  tolerance)
+        if profiler is not None:
+            profiler.end_solve(result)
+        return result
+
+    def run(self, iterations):
+        self._solve(iterations, None, None)
+        return self.field
+
+    # `max_iterations` limits the conjugate gradient iterations and the
+    # residual history is recorded every `check_every` of them. The search
+    # directions of the conjugate gradient would be lost when resuming, so
+    # this solver cannot be checkpointed. An enabled `Profiler` records the
+    # time between the residual checks.
+    def solve(self, max_iterations, tolerance=None, check_every=10,
+              norm='max', checkpoint=None, profiler=None):
+        if checkpoint is not None:
+            raise ValueError('The `sparse` solver does not support '
+                             'checkpoints')
+        return self._solve(max_iterations, tolerance, norm, check_every,
+                           profiler)
@@ -0,0 +1,137 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Superposition
+# The relaxed field depends linearly on the boundary values, so the field for
+# any potentials on a set of boundary segments is:
+#   V = V_0 + sum(voltage_i * V_i)
+# where V_i is the response to one volt on segment i (zero on every other
+# boundary and no relaxation constant) and V_0 has the boundaries that are not
+# on a segment along with the relaxation constant. The responses are solved
+# once, together, and can be saved for later runs on the same geometry. Any
+# combination of potentials then only takes a weighted sum of the responses.
+# ==============================================================================
+import os
+
+import numpy as np
+
+from .batch import BatchKernel
+from .convergence import RelaxationResult
+from .warm_start import geometry_hash
+
+# The responses are solved until their max residual is below this value. The
+# residual of a combined field is at most this times one plus the sum of the
+# absolute potentials.
+RESPONSE_TOLERANCE = 1e-9
+
+# The max number of sweeps for the responses
+RESPONSE_MAX_SWEEPS = 100000
+
+
+class ResponseCache:
+
+    # Arguments:
+    #   field: the potential of the boundary points that are not on a segment,
+    #          the values of the segments and inner points are not used
+    #   inner_mask: the points that are relaxed
+    #   segments: a list of masks of the boundary points that are driven
+    #             together, each point can only be on one segment
+    #   relaxation_constant / epsilon_field: same as the kernels
+    #   filename: the responses are loaded from this file when it holds them
+    #             for the same geometry, otherwise they are solved and saved
+    #   solver: `jacobi` or `sor` for the batched kernel
+    def __init__(self, field, inner_mask, segments, relaxation_constant=0,
+                 epsilon_field=None, filename=None, solver='sor',
+                 tolerance=RESPONSE_TOLERANCE,
+                 max_iterations=RESPONSE_MAX_SWEEPS):
+        segments = np.array(segments, dtype=bool).reshape(-1,
+                                                          *inner_mask.shape)
+        if (segments & inner_mask).any():
+            raise ValueError('The segments can only hold boundary points')
+        if (np.count_nonzero(segments, axis=0) > 1).any():
+            raise ValueError('Every point can only be on one segment')
+        self.inner_mask = inner_mask
+        self.segments = segments
+        self.tolerance = tolerance
+        base = np.where(inner_mask | segments.any(axis=0), 0,
+                        field).astype('float64')
+        # Everything that the responses depend on
+        self.geometry_hash = geometry_hash(
+            inner_mask, base, segments,
+            [] if epsilon_field is None else epsilon_field,
+            np.broadcast_to(relaxation_constant, inner_mask.shape),
+            [tolerance])
+        self.filename = filename
+        if filename is None or not self._load(filename):
+            self._solve(base, relaxation_constant, epsilon_field, solver,
+                        max_iterations)
+            if filename is not None:
+                self._save(filename)
+
+    # Solve the base field and every response at once
+    def _solve(self, base, relaxation_constant, epsilon_field, solver,
+               max_iterations):
+        fields = np.concatenate([base[None], self.segments.astype('float64')])
+        masks = np.broadcast_to(self.inner_mask, fields.shape)
+        # Only the base field has the relaxation constant
+        constants = np.zeros(fields.shape, dtype='float64')
+        constants[0] = relaxation_constant
+        epsilon_fields = None
+        if epsilon_field is not None:
+            epsilon_fields = np.broadcast_to(epsilon_field, fields.shape)
+        kernel = BatchKernel(fields, masks, constants, epsilon_fields, solver)
+        results = kernel.solve(max_iterations, self.tolerance)
+        self.base = fields[0]
+        self.responses = fields[1:]
+        self.iterations = max(result.iterations for result in results)
+        self.residuals = np.array([result.residual for result in results])
+        self.converged = all(result.converged for result in results)
+
+    def _load(self, filename):
+        if not os.path.exists(filename):
+            return False
+        with np.load(filename) as saved:
+            if str(saved['geometry_hash']) != self.geometry_hash:
+                return False
+            self.base = saved['base']
+            self.responses = saved['responses']
+            self.residuals = saved['residuals']
+            self.converged = bool(saved['converged'])
+        # Nothing had to be solved
+        self.iterations = 0
+        return True
+
+    # Written next to the file and moved over it, so a stopped run never
+    # leaves a partial file behind
+    def _save(self, filename):
+        temp_filename = f'{filename}.tmp'
+        with open(temp_filename, 'wb') as temp_file:
+            np.savez(temp_file, geometry_hash=self.geometry_hash,
+                     base=self.base, responses=self.responses,
+                     residuals=self.residuals, converged=self.converged)
+        os.replace(temp_filename, filename)
+
+    # The field with `voltages` (one per segment) on the segments. A 2D array
+    # of voltages, with one row per combination, gives a stack of fields.
+    def combine(self, voltages, out=None):
+        voltages = np.asarray(voltages, dtype='float64')
+        if voltages.shape[-1] != len(self.responses):
+            raise ValueError(f'Expected {len(self.responses)} voltages, got '
+                             f'{voltages.shape[-1]}')
+        combined = np.tensordot(voltages, self.responses, axes=1)
+        return np.add(combined, self.base, out=out)
+
+    # The max residual of a combined field is at most the residuals of the
+    # base field and responses weighted by the potentials
+    def residual_bound(self, voltages):
+        weights = np.abs(np.asarray(voltages, dtype='float64'))
+        return float(self.residuals[0] + weights @ self.residuals[1:])
+
+    # Same as `combine`, but returns a `RelaxationResult` with the iterations
+    # that were needed for the responses and the bound of the residual
+    def result(self, voltages, out=None):
+        field = self.combine(voltages, out)
+        residual = self.residual_bound(voltages)
+        return RelaxationResult(field, self.iterations,
+                                np.array([[self.iterations, residual]]),
+                                self.converged, self.tolerance)
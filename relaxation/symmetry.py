@@ -0,0 +1,150 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Symmetric Solves
+# When the boundaries, inner points, relaxation constant and epsilon field of a
+# problem are mirror images across the middle of the grid (along the rows, the
+# columns or both), so is its field. Only the first half of the grid along each
+# mirrored axis is then relaxed, which takes up to four times less memory and
+# work per sweep. The middle is either on a row of points (an odd number of
+# rows) or half a step between two rows (an even number). One ghost row past
+# the middle is kept, and the kernel copies the mirror image of the row on the
+# other side of the middle to it before every update. This is the zero normal
+# derivative (Neumann) condition of the mirror plane. Once solved, the half is
+# reflected back onto the whole field.
+# ==============================================================================
+import numpy as np
+
+from .solvers import close_kernel, make_kernel
+from .sor import grid_omega
+
+# The solvers whose kernels keep the ghost rows as mirror images
+SYMMETRIC_SOLVERS = ('jacobi', 'sor', 'mixed')
+
+# The boundary values (and epsilon values) of the two halves can differ by this
+# fraction of the largest one and still be mirror images, which allows for the
+# round-off of values like a sine that is stored in single precision
+SYMMETRY_TOLERANCE = 1e-6
+
+
+def _is_mirrored(values, axis):
+    flipped = np.flip(values, axis)
+    scale = float(np.abs(values).max(initial=0))
+    return np.allclose(values, flipped, rtol=0, atol=SYMMETRY_TOLERANCE * scale)
+
+
+# The axes (0 for the rows and 1 for the columns) that the problem is a mirror
+# image across, such as `(0, 1)` for a centered cylinder
+def detect_symmetry(field, inner_mask, relaxation_constant=0,
+                    epsilon_field=None):
+    boundary = np.where(inner_mask, 0, field)
+    axes = []
+    for axis in (0, 1):
+        if field.shape[axis] < 2:
+            continue
+        if not np.array_equal(inner_mask, np.flip(inner_mask, axis)):
+            continue
+        if not _is_mirrored(boundary, axis):
+            continue
+        if epsilon_field is not None and not _is_mirrored(epsilon_field, axis):
+            continue
+        if (isinstance(relaxation_constant, np.ndarray) and
+                not _is_mirrored(relaxation_constant, axis)):
+            continue
+        axes.append(axis)
+    return tuple(axes)
+
+
+class SymmetricSolver:
+
+    # Same arguments as `make_kernel`, along with:
+    #   axes: the axes that the field is mirrored across, `detect` uses every
+    #         axis that the problem is a mirror image across (none of them
+    #         solves the whole grid)
+    # Raises a `ValueError` when the problem is not a mirror image across one of
+    # the `axes` or the solver can not keep the ghost rows.
+    def __init__(self, solver, field, inner_mask, relaxation_constant=0,
+                 epsilon_field=None, axes='detect', **options):
+        symmetric = detect_symmetry(field, inner_mask, relaxation_constant,
+                                    epsilon_field)
+        if axes == 'detect':
+            axes = symmetric
+        for axis in axes:
+            if axis not in symmetric:
+                raise ValueError(f'The problem is not a mirror image across '
+                                 f'axis `{axis}`, it is across {symmetric}')
+        if axes and solver not in SYMMETRIC_SOLVERS:
+            raise ValueError(f'The `{solver}` solver can not solve half of a '
+                             f'symmetric field, must be one of '
+                             f'{SYMMETRIC_SOLVERS}')
+        self.field = field
+        self.inner_mask = inner_mask
+        self.axes = tuple(sorted(axes))
+        region = [slice(None), slice(None)]
+        mirror = [None, None]
+        for axis in self.axes:
+            size = field.shape[axis]
+            # The first half (and the middle row), then the ghost row
+            kept = (size + 1) // 2
+            region[axis] = slice(0, kept + 1)
+            mirror[axis] = size - 1 - kept
+        self.region = tuple(region)
+        if not self.axes:
+            self.kernel = make_kernel(solver, field, inner_mask,
+                                      relaxation_constant, epsilon_field,
+                                      **options)
+            return
+        self.reduced = np.array(field[self.region])
+        reduced_mask = np.array(inner_mask[self.region])
+        if 0 in self.axes:
+            reduced_mask[-1] = False
+        if 1 in self.axes:
+            reduced_mask[:, -1] = False
+        if isinstance(relaxation_constant, np.ndarray):
+            relaxation_constant = relaxation_constant[self.region]
+        if epsilon_field is not None:
+            epsilon_field = epsilon_field[self.region]
+        # The half relaxes as slowly as the whole grid, so omega is picked
+        # from the whole grid
+        if solver in ('sor', 'mixed') and options.get('omega') is None:
+            options['omega'] = grid_omega(inner_mask)
+        self.kernel = make_kernel(solver, self.reduced, reduced_mask,
+                                  relaxation_constant, epsilon_field,
+                                  mirror=tuple(mirror), **options)
+
+    # Reflect the solved half onto the inner points of the whole field
+    def expand(self):
+        if not self.axes:
+            return self.field
+        values = self.reduced
+        for axis in self.axes:
+            size = self.field.shape[axis]
+            index = np.arange(size)
+            values = np.take(values, np.minimum(index, size - 1 - index), axis)
+        np.copyto(self.field, values, casting='same_kind',
+                  where=self.inner_mask)
+        return self.field
+
+    def run(self, iterations):
+        self.kernel.run(iterations)
+        return self.expand()
+
+    def state(self):
+        return self.kernel.state()
+
+    def restore(self, state):
+        self.kernel.restore(state)
+        self.expand()
+
+    # Same as the kernels, the result holds the whole field
+    def solve(self, max_iterations, tolerance=None, check_every=10,
+              norm='max', checkpoint=None, profiler=None):
+        result = self.kernel.solve(max_iterations, tolerance, check_every,
+                                   norm, checkpoint=checkpoint,
+                                   profiler=profiler)
+        result.field = self.expand()
+        return result
+
+    # Stop the threads of the kernel, if it has any
+    def close(self):
+        close_kernel(self.kernel)
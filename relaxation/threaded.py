@@ -0,0 +1,158 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Threaded Relaxation Kernel
+# The grid is split into tiles of rows and each tile is relaxed by its own
+# thread (NumPy releases the GIL while it works on large arrays). A tile reads
+# its rows plus one halo row on each side from the current field and writes its
+# rows into a second copy of the field, so the tiles never wait on each other
+# during a sweep. The two copies swap places after every sweep. Each point goes
+# through the same operations as the `RelaxationKernel`, so the results do not
+# depend on the number of threads.
+# ==============================================================================
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+import weakref
+
+import numpy as np
+
+from .convergence import NORMS, iterate, residual_norm
+from .kernel import RelaxationKernel
+
+
+class _Tile:
+
+    # The rows `start:stop` of the grid, `halo` also includes the neighboring
+    # row on each side (when there is one)
+    def __init__(self, field, inner_mask, relaxation_constant, epsilon_field,
+                 start, stop):
+        self.rows = slice(start, stop)
+        halo_start = max(start - 1, 0)
+        halo_stop = min(stop + 1, inner_mask.shape[0])
+        self.halo = slice(halo_start, halo_stop)
+        # The rows of the tile within the halo
+        self.inner = slice(start - halo_start, stop - halo_start)
+        self.inner_mask = inner_mask[self.rows]
+        if isinstance(relaxation_constant, np.ndarray):
+            relaxation_constant = relaxation_constant[self.halo]
+        if epsilon_field is not None:
+            epsilon_field = epsilon_field[self.halo]
+        # The halo rows are averaged as if the grid ended there, which is wrong
+        # for them but they are never written back
+        self.kernel = RelaxationKernel(field[self.halo], inner_mask[self.halo],
+                                       relaxation_constant, epsilon_field)
+
+
+class ThreadedKernel:
+
+    # Same arguments as the `RelaxationKernel` with the addition of:
+    #   threads: the number of threads (and tiles), defaults to the number of
+    #            cores
+    # The field is written to whenever the residual is checked and at the end
+    # of `run`, `sync` writes it at any other time.
+    def __init__(self, field, inner_mask, relaxation_constant=0,
+                 epsilon_field=None, threads=None):
+        self.field = field
+        self.inner_mask = inner_mask
+        if threads is None:
+            threads = os.cpu_count() or 1
+        self.threads = max(min(int(threads), field.shape[0]), 1)
+        bounds = np.linspace(0, field.shape[0], self.threads + 1).astype(int)
+        self.tiles = [
+            _Tile(field, inner_mask, relaxation_constant, epsilon_field, start,
+                  stop) for start, stop in zip(bounds[:-1], bounds[1:])
+        ]
+        # The field that is read from and the one that is written to
+        self.current = field
+        self.other = field.copy()
+        # Only allocated once the residual is first checked
+        self.update = None
+        self.pool = None
+        if self.threads > 1:
+            self.pool = ThreadPoolExecutor(self.threads)
+            # The threads are also stopped once a kernel that was never
+            # closed is garbage collected
+            weakref.finalize(self, self.pool.shutdown, False)
+
+    def _sweep_tile(self, tile, track):
+        summed = tile.kernel.average(self.current[tile.halo],
+                                     tile.kernel.summed)[tile.inner]
+        if track:
+            np.subtract(summed, self.current[tile.rows],
+                        out=self.update[tile.rows])
+        np.copyto(self.other[tile.rows], summed, casting='same_kind',
+                  where=tile.inner_mask)
+
+    # Write the newest values to the field
+    def sync(self):
+        if self.current is not self.field:
+            np.copyto(self.field, self.current)
+            self.current, self.other = self.field, self.current
+        return self.field
+
+    def sweep(self, norm=None):
+        if norm is not None and norm not in NORMS:
+            raise ValueError(f'Unknown norm `{norm}`, must be one of {NORMS}')
+        track = norm is not None
+        if track and self.update is None:
+            self.update = np.empty(self.field.shape, dtype='float64')
+        if self.pool is None:
+            for tile in self.tiles:
+                self._sweep_tile(tile, track)
+        else:
+            # Waiting on every tile is the only synchronization in a sweep
+            list(self.pool.map(lambda tile: self._sweep_tile(tile, track),
+                               self.tiles))
+        self.current, self.other = self.other, self.current
+        if not track:
+            return None
+        self.sync()
+        return residual_norm(self.update, self.inner_mask, norm)
+
+    def run(self, iterations):
+        for i in range(iterations):
+            self.sweep()
+        return self.sync()
+
+    def state(self):
+        return {'field': self.sync()}
+
+    def restore(self, state):
+        self.sync()
+        self.field[...] = state['field']
+
+    def solve(self, max_iterations, tolerance=None, check_every=10,
+              norm='max', checkpoint=None, profiler=None):
+        return iterate(self, max_iterations, tolerance, check_every, norm,
+                       checkpoint=checkpoint, profiler=profiler)
+
+    # Stop the threads, the kernel can no longer be used afterwards
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Time `sweeps` sweeps for each number of threads. Returns a dictionary of the
+# number of threads to the cell updates (inner points times sweeps) per second.
+# The field is not changed.
+def throughput(field, inner_mask, sweeps=100, thread_counts=None,
+               relaxation_constant=0, epsilon_field=None):
+    if thread_counts is None:
+        thread_counts = sorted({1, 2, 4, 8, 16, 32, os.cpu_count() or 1})
+    cell_updates = int(np.count_nonzero(inner_mask)) * sweeps
+    rates = {}
+    for threads in thread_counts:
+        with ThreadedKernel(field.copy(), inner_mask, relaxation_constant,
+                            epsilon_field, threads) as kernel:
+            start = time.perf_counter()
+            kernel.run(sweeps)
+            rates[threads] = cell_updates / (time.perf_counter() - start)
+    return rates
@@ -0,0 +1,141 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Warm Starts
+# Instead of starting the inner points from zero, they can start from a field
+# that is already close to the solution. Either the problem is first solved on
+# a grid with twice the step size (and that one on a grid with twice its step
+# size, and so on) and interpolated onto the finer grid, or the field is loaded
+# from an earlier run of the same problem.
+# ==============================================================================
+import hashlib
+import os
+
+import numpy as np
+
+from .multigrid import prolong
+from .sor import SORKernel
+
+WARM_STARTS = (None, 'nested', 'cache')
+
+# Grids are no longer coarsened once a side would be smaller than this
+NESTED_COARSEST_SIDE = 9
+
+# Each coarser grid is solved until its max residual is below this fraction of
+# the largest boundary value. The coarse grids only need to be accurate to
+# their own (larger) discretization error.
+NESTED_TOLERANCE = 1e-4
+
+# The max number of SOR sweeps on each coarser grid
+NESTED_MAX_SWEEPS = 10000
+
+
+# The rows of an array that are hashed at once, so a memory-mapped array is
+# never read into memory as a whole
+HASH_ROWS = 256
+
+
+def _hash_array(digest, array):
+    array = np.asarray(array)
+    digest.update(str(array.shape).encode())
+    if array.ndim < 2:
+        array = array.reshape(1, -1)
+    for start in range(0, len(array), HASH_ROWS):
+        rows = np.ascontiguousarray(array[start:start + HASH_ROWS],
+                                    dtype='float64')
+        digest.update(rows.tobytes())
+
+
+# A hash of the arrays, saved fields are only used as a starting point for a
+# problem with the same hash
+def geometry_hash(*arrays):
+    digest = hashlib.sha256()
+    for array in arrays:
+        _hash_array(digest, array)
+    return digest.hexdigest()
+
+
+# The `geometry_hash` of a problem: the grid coordinates, the inner points, the
+# boundary values, the permittivity and the relaxation constant. The inner
+# points of `field` are left out since they are only the starting point.
+def problem_hash(x_coords, y_coords, field, inner_mask, epsilon_field=None,
+                 relaxation_constant=0):
+    digest = hashlib.sha256()
+    for coords in (x_coords, y_coords, inner_mask):
+        _hash_array(digest, coords)
+    digest.update(str(field.shape).encode())
+    for start in range(0, len(field), HASH_ROWS):
+        rows = slice(start, start + HASH_ROWS)
+        boundary = np.where(inner_mask[rows], 0, field[rows])
+        digest.update(boundary.astype('float64').tobytes())
+    _hash_array(digest, [] if epsilon_field is None else epsilon_field)
+    _hash_array(digest, np.broadcast_to(relaxation_constant, field.shape))
+    return digest.hexdigest()
+
+
+# The field saved in `filename` when it was computed for a problem with the same
+# `geometry_hash`, otherwise `None`
+def load_warm_start(filename, geometry_hash):
+    if not os.path.exists(filename):
+        return None
+    with np.load(filename) as saved:
+        if 'geometry_hash' not in saved or 'field' not in saved:
+            return None
+        if str(saved['geometry_hash']) != geometry_hash:
+            return None
+        return saved['field']
+
+
+# Solve the problem on a grid with every other point (recursively) and
+# interpolate that solution onto the inner points of `field`. Returns `False`
+# when the grid is too small to be coarsened.
+def nested_start(field, inner_mask, relaxation_constant=0, epsilon_field=None):
+    if min(inner_mask.shape) < 2 * NESTED_COARSEST_SIDE - 1:
+        return False
+    coarse_mask = np.ascontiguousarray(inner_mask[::2, ::2])
+    if not coarse_mask.any():
+        return False
+    coarse = np.zeros(np.add(coarse_mask.shape, 1), dtype='float64')
+    coarse_field = coarse[:-1, :-1]
+    coarse_field[...] = field[::2, ::2]
+    coarse_epsilon = None
+    if epsilon_field is not None:
+        coarse_epsilon = epsilon_field[::2, ::2]
+    # The equations are scaled by the step size squared, so the coarser grid
+    # has four times the relaxation constant
+    coarse_constant = relaxation_constant
+    if isinstance(coarse_constant, np.ndarray):
+        coarse_constant = coarse_constant[::2, ::2]
+    coarse_constant = coarse_constant * 4
+    nested_start(coarse_field, coarse_mask, coarse_constant, coarse_epsilon)
+    kernel = SORKernel(coarse_field, coarse_mask, coarse_constant,
+                       coarse_epsilon)
+    tolerance = NESTED_TOLERANCE * max(float(np.abs(field).max()), 1e-12)
+    kernel.solve(NESTED_MAX_SWEEPS, tolerance)
+    fine = np.empty(inner_mask.shape, dtype='float64')
+    prolong(coarse, fine)
+    np.copyto(field, fine, casting='same_kind', where=inner_mask)
+    return True
+
+
+# Set the inner points of `field` to a starting point, `source` is one of:
+#   None: leave the field as it is
+#   nested: interpolate the solution of coarser grids (see `nested_start`)
+#   cache: the field saved in `filename` by an earlier run of a problem with
+#          the same `geometry_hash`, falls back to `nested` when there is none
+# Returns the source that was actually used.
+def warm_start(source, field, inner_mask, relaxation_constant=0,
+               epsilon_field=None, filename=None, geometry_hash=None):
+    if source not in WARM_STARTS:
+        raise ValueError(f'Unknown warm start `{source}`, must be one of '
+                         f'{WARM_STARTS}')
+    if source == 'cache' and filename is not None:
+        saved = load_warm_start(filename, geometry_hash)
+        if saved is not None and saved.shape == field.shape:
+            np.copyto(field, saved, casting='same_kind', where=inner_mask)
+            return 'cache'
+    if source is None:
+        return None
+    if nested_start(field, inner_mask, relaxation_constant, epsilon_field):
+        return 'nested'
+    return None
@@ -0,0 +1,55 @@
+# ==============================================================================
+# Michael Jones (Michael_Jones6@student.uml.edu)
+# [PHYS 6570] Electromagnetic Theory I
+# Sweep Runner
+# Runs every scenario of a sweep spec (see `relaxation/scenarios.py`) on a pool
+# of processes, instead of editing the constants of the scripts and running
+# them one at a time:
+#   python3 run_sweep.py example.json --out example_results
+# ==============================================================================
+import argparse
+import json
+import os
+import sys
+
+# The shared relaxation package lives in the root of the repo
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from relaxation.scenarios import expand_sweep, estimate_memory, run_sweep
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run a sweep of the relaxation problems')
+    parser.add_argument('spec', help='the JSON file of the sweep spec')
+    parser.add_argument('--out', default='sweep_results',
+                        help='the folder that the results are written to')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='the max number of scenarios that run at once '
+                        '(defaults to the number of cores)')
+    parser.add_argument('--memory-budget', type=float, default=None,
+                        help='the max total estimated memory of the running '
+                        'scenarios in MB (defaults to most of the memory)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only list the scenarios and their estimated '
+                        'memory')
+    args = parser.parse_args()
+    with open(args.spec) as spec_file:
+        spec = json.load(spec_file)
+    if args.dry_run:
+        for scenario in expand_sweep(spec):
+            print(f'[{scenario["index"]:4}] {scenario["problem"]:8} '
+                  f'{scenario["arguments"]}  '
+                  f'{estimate_memory(scenario):.1f} MB')
+        return
+    records = run_sweep(spec, args.out, args.workers, args.memory_budget)
+    failed = [record for record in records if record['status'] != 'ok']
+    print(f'{len(records) - len(failed)} of {len(records)} scenarios finished, '
+          f'results written to `{args.out}`')
+    if failed:
+        sys.exit(1)
+
+
+# The pool starts its workers by importing this file, which must not start
+# another sweep
+if __name__ == '__main__':
+    main()